@@ -0,0 +1,92 @@
+from __future__ import absolute_import
+from __future__ import print_function
+
+import _resource_estimator as resource_estimator
+import _sweep_logging as sweep_logging
+
+_log = sweep_logging.get_logger('domain_planner')
+
+# 自由空間波長に対する最小余白の割合
+DEFAULT_WAVELENGTH_FRACTION = 0.25
+# 余白の下限 [mm]
+DEFAULT_MIN_MARGIN_MM = 50.0
+# 既存ボックスを作り直さない許容差 [mm]
+DEFAULT_TOLERANCE_MM = 1.0
+
+
+def compute_margin_mm(frequency_hz, max_step_mm=9.0, pml_layers=resource_estimator.DEFAULT_PML_LAYERS,
+		wavelength_fraction=DEFAULT_WAVELENGTH_FRACTION, min_margin_mm=DEFAULT_MIN_MARGIN_MM):
+	"""
+	ファントム表面から計算領域の端までに必要な余白 [mm] を返します。
+
+	自由空間波長の wavelength_fraction 倍 (下限 min_margin_mm) の空気層に、
+	吸収境界の層数 × 空気領域のセルサイズ分のクリアランスを加えます。
+	"""
+	wavelength_mm = resource_estimator.SPEED_OF_LIGHT / frequency_hz * 1e3
+	air_gap = max(wavelength_fraction * wavelength_mm, min_margin_mm)
+	return air_gap + pml_layers * max_step_mm
+
+
+def plan_domain(tissue_bboxes, frequency_hz, **margin_kwargs):
+	"""
+	組織エンティティのバウンディングボックスの和集合に余白を加えた計算領域 (p0, p1) [mm] を返します。
+	組織のバウンディングボックスがない場合はNoneを返します。
+	"""
+	union = resource_estimator.bounding_box_union(tissue_bboxes)
+	if union is None:
+		return None
+	margin = compute_margin_mm(frequency_hz, **margin_kwargs)
+	p0 = tuple(v - margin for v in union[0])
+	p1 = tuple(v + margin for v in union[1])
+	return (p0, p1)
+
+
+def _bbox_matches(bbox_a, bbox_b, tolerance_mm):
+	for corner in range(2):
+		for axis in range(3):
+			if abs(bbox_a[corner][axis] - bbox_b[corner][axis]) > tolerance_mm:
+				return False
+	return True
+
+
+def source_box_fits(domain_bbox, entity_name='Wire Block 1', tolerance_mm=DEFAULT_TOLERANCE_MM):
+	"""
+	entity_name のWire Blockが存在し、domain_bbox に許容差内で一致する場合にTrueを返します。
+	"""
+	import s4l_v1.model as model
+
+	entities = model.AllEntities()
+	if entity_name not in entities:
+		return False
+	current_bbox = resource_estimator.get_entity_bounding_boxes([entities[entity_name]])[0]
+	return current_bbox is not None and _bbox_matches(current_bbox, domain_bbox, tolerance_mm)
+
+
+def fit_source_box(domain_bbox, entity_name='Wire Block 1', tolerance_mm=DEFAULT_TOLERANCE_MM):
+	"""
+	平面波ソース用のWire Blockが domain_bbox に一致するよう作成またはサイズ変更します。
+	既存のボックスが許容差内で一致する場合は何もしません。
+
+	Returns:
+		エンティティ: 計算領域に合わせたWire Block。
+	"""
+	import s4l_v1.model as model
+	from s4l_v1.model import Vec3
+
+	entities = model.AllEntities()
+	if entity_name in entities:
+		existing = entities[entity_name]
+		if source_box_fits(domain_bbox, entity_name, tolerance_mm):
+			_log.info("'%s' already fits the phantom. Skipping resize.", entity_name)
+			return existing
+		_log.info("Resizing '%s' to fit the phantom.", entity_name)
+		existing.Delete()
+	else:
+		_log.info("'%s' not found. Creating it around the phantom.", entity_name)
+
+	p0, p1 = domain_bbox
+	wire = model.CreateWireBlock(p0=Vec3(*p0), p1=Vec3(*p1), parametrized=True)
+	wire.Name = entity_name
+	size = [p1[i] - p0[i] for i in range(3)]
+	_log.info("'%s' spans %.0f x %.0f x %.0f mm.", entity_name, size[0], size[1], size[2])
+	return wire
@@ -0,0 +1,173 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import cmath
+import math
+
+import _resource_estimator as resource_estimator
+import _sweep_logging as sweep_logging
+
+_log = sweep_logging.get_logger('grid_planner')
+
+# 真空の誘電率 [F/m]
+EPSILON_0 = 8.8541878128e-12
+# 1波長当たりの最小セル数 (これより粗いセルは生成しない)
+DEFAULT_CELLS_PER_WAVELENGTH = 10
+# 形状を解像するためのセルサイズの上限 [mm] (チュートリアルの Resolution = 2.0 に相当)
+DEFAULT_GEOMETRY_RESOLUTION_MM = 2.0
+# 空気領域のセルサイズの上限 [mm] (チュートリアルの MaxStep = 9.0 に相当)
+DEFAULT_MAX_AIR_STEP_MM = 9.0
+
+
+def _to_float(value):
+	"""
+	Sim4Lifeのプロパティ値 (数値、(値, 単位) のタプル、Valueを持つオブジェクト) をfloatに変換します。
+	"""
+	if isinstance(value, tuple):
+		value = value[0]
+	if hasattr(value, 'Value'):
+		value = value.Value
+	return float(value)
+
+
+def wavelength_in_medium_mm(frequency_hz, relative_permittivity, conductivity=0.0):
+	"""
+	損失のある媒質中の波長 [mm] を返します。
+	複素比誘電率 εr - jσ/(ωε0) から求めた波数の実部を用いるため、導電率が高いほど短くなります。
+	"""
+	omega = 2.0 * math.pi * frequency_hz
+	eps_complex = relative_permittivity - 1j * conductivity / (omega * EPSILON_0)
+	k = omega / resource_estimator.SPEED_OF_LIGHT * cmath.sqrt(eps_complex)
+	return 2.0 * math.pi / abs(k.real) * 1e3
+
+
+def read_material_properties(material_settings):
+	"""
+	MaterialSettingsから比誘電率と導電率を読み取ります。
+	UpdateAllMaterials() 後に呼び出すと、データベースの材料は実行周波数での値になります。
+
+	Returns:
+		tuple: (比誘電率, 導電率[S/m])。読み取れない場合はNone。
+	"""
+	try:
+		eps_r = _to_float(material_settings.ElectricProps.RelativePermittivity)
+		sigma = _to_float(material_settings.ElectricProps.Conductivity)
+		return eps_r, sigma
+	except Exception as e:
+		_log.warning("Could not read electric properties of '%s' (%s).", material_settings.Name, e)
+		return None
+
+
+def plan_grid(material_groups, frequency_hz, air_entities,
+		cells_per_wavelength=DEFAULT_CELLS_PER_WAVELENGTH,
+		geometry_resolution_mm=DEFAULT_GEOMETRY_RESOLUTION_MM,
+		max_air_step_mm=DEFAULT_MAX_AIR_STEP_MM):
+	"""
+	材料グループごとの手動グリッド設定を計画します。
+
+	各グループの最大セルサイズは、そのグループ内で最も波長が短い材料の波長を
+	cells_per_wavelength で割った値です。空気領域 (air_entities) は自由空間波長から同様に決めます。
+
+	Args:
+		material_groups (list): (MaterialSettings, エンティティのリスト) のリスト。
+		frequency_hz (float): 実行周波数 [Hz]。
+		air_entities (list): 空気として扱うエンティティ (平面波ソースのWire Block)。
+		cells_per_wavelength (int): 1波長当たりの最小セル数。
+		geometry_resolution_mm (float): 組織領域の Resolution の上限 [mm]。
+		max_air_step_mm (float): 空気領域の MaxStep の上限 [mm]。
+
+	Returns:
+		list: 'name', 'entities', 'max_step_mm', 'resolution_mm', 'wavelength_mm' を持つ辞書のリスト。
+			最初の要素が空気領域です。
+	"""
+	air_wavelength = wavelength_in_medium_mm(frequency_hz, 1.0)
+	air_step = min(air_wavelength / cells_per_wavelength, max_air_step_mm)
+	plan = [{
+		'name': 'Air',
+		'entities': list(air_entities),
+		'max_step_mm': air_step,
+		'resolution_mm': air_step,
+		'wavelength_mm': air_wavelength,
+	}]
+
+	# 材料グループごとに、実行周波数での波長からセルサイズを決める
+	for material_settings, entities in material_groups:
+		if not entities:
+			continue
+		properties = read_material_properties(material_settings)
+		if properties is None:
+			wavelength = None
+			step = geometry_resolution_mm
+		else:
+			wavelength = wavelength_in_medium_mm(frequency_hz, *properties)
+			step = min(wavelength / cells_per_wavelength, air_step)
+		plan.append({
+			'name': material_settings.Name,
+			'entities': list(entities),
+			'max_step_mm': step,
+			'resolution_mm': min(step, geometry_resolution_mm),
+			'wavelength_mm': wavelength,
+		})
+	return plan
+
+
+def apply_grid_plan(sim, plan):
+	"""
+	plan_grid() の結果をManualGridSettingsとしてシミュレーションに追加します。
+	"""
+	for group in plan:
+		if not group['entities']:
+			continue
+		manual_grid_settings = sim.AddManualGridSettings(group['entities'])
+		manual_grid_settings.Name = f"Planned Grid - {group['name']}"
+		manual_grid_settings.MaxStep = (group['max_step_mm'],) * 3 # model units
+		manual_grid_settings.Resolution = (group['resolution_mm'],) * 3 # model units
+
+
+def plan_regions(plan):
+	"""
+	グリッド計画を、リソース見積もり (_resource_estimator.estimate_simulation_resources() の regions) 用の
+	(バウンディングボックス, セルサイズ[mm]) のリストと空気領域のセルサイズ [mm] に変換します。
+
+	Returns:
+		tuple: (regions, 空気領域のセルサイズ[mm])。
+	"""
+	regions = []
+	for group in plan[1:]:
+		for bbox in resource_estimator.get_entity_bounding_boxes(group['entities']):
+			if bbox is not None:
+				regions.append((bbox, group['max_step_mm']))
+	return regions, plan[0]['max_step_mm']
+
+
+def estimate_cell_reduction(plan, domain_bbox, pml_layers=resource_estimator.DEFAULT_PML_LAYERS):
+	"""
+	計画したグリッドと、最も細かいセルサイズで一様に分割したグリッドのセル数を比較します。
+
+	Returns:
+		tuple: (計画したグリッドのセル数, 一様グリッドのセル数)。
+	"""
+	regions, air_step = plan_regions(plan)
+	finest = min([step for _, step in regions] + [air_step])
+
+	planned = resource_estimator.graded_axis_line_counts(domain_bbox, regions, air_step)
+	uniform = resource_estimator.graded_axis_line_counts(domain_bbox, [], finest)
+	planned_cells = 1
+	uniform_cells = 1
+	for n_planned, n_uniform in zip(planned, uniform):
+		planned_cells *= n_planned + 2 * pml_layers
+		uniform_cells *= n_uniform + 2 * pml_layers
+	return planned_cells, uniform_cells
+
+
+def format_plan(plan):
+	"""
+	グリッド計画を表示用の文字列のリストに整形します。
+	"""
+	lines = []
+	for group in plan:
+		wavelength = group['wavelength_mm']
+		wavelength_text = f"{wavelength:.1f} mm" if wavelength is not None else "unknown"
+		lines.append(f"{group['name']}: MaxStep {group['max_step_mm']:.2f} mm, "
+			f"Resolution {group['resolution_mm']:.2f} mm, wavelength {wavelength_text}, "
+			f"{len(group['entities'])} entities")
+	return lines
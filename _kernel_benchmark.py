@@ -0,0 +1,296 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import json
+import math
+import os
+import platform
+import threading
+import time
+
+import _resource_estimator as resource_estimator
+import _sweep_logging as sweep_logging
+
+try:
+	import psutil
+except ImportError:
+	psutil = None
+
+_log = sweep_logging.get_logger('kernel_benchmark')
+
+# カーネルプロファイルの既定の保存先 (ホストごとのローカルファイル)
+DEFAULT_PROFILE_PATH = os.path.join(os.path.expanduser('~'), '.s4l_sweep', 'kernel_profile.json')
+# 候補とするソルバーカーネル (Kernel.enum の名前)
+CANDIDATE_KERNELS = ('AXware', 'Cuda', 'Software')
+# GPUを使用するカーネル (同時実行はGPU1枚当たり1本とする)
+GPU_KERNELS = ('AXware', 'Cuda')
+# 校正問題のセル数
+DEFAULT_CALIBRATION_CELLS = (2e5, 1e6, 5e6)
+# 校正問題のセルサイズ [mm]、周波数 [MHz]、SimulationTime [周期]
+CALIBRATION_STEP_MM = 2.0
+CALIBRATION_FREQUENCY_MHZ = 1000.0
+CALIBRATION_PERIODS = 5.0
+
+
+def probe_kernels(sim, candidates=CANDIDATE_KERNELS):
+	"""
+	シミュレーションのSolverSettingsに設定できるカーネル名のリストを返します。
+	ライセンスやハードウェアがない場合、設定時に例外となるカーネルは除外されます。
+	"""
+	solver_settings = sim.SolverSettings
+	options = solver_settings.Kernel.enum
+	available = []
+	for name in candidates:
+		option = getattr(options, name, None)
+		if option is None:
+			continue
+		try:
+			solver_settings.Kernel = option
+			available.append(name)
+		except Exception as e:
+			_log.info("Kernel '%s' is not available on this host (%s).", name, e)
+	return available
+
+
+class _PeakMemorySampler(object):
+	"""
+	ソルバー実行中に、このプロセスと子プロセスのRSSの合計の最大値を記録します。
+	psutilがない場合は何もしません。
+	"""
+
+	def __init__(self, interval_s=0.5):
+		self.interval_s = interval_s
+		self.peak_bytes = None
+		self._stop = threading.Event()
+		self._thread = None
+
+	def _sample(self):
+		process = psutil.Process()
+		while not self._stop.is_set():
+			try:
+				total = process.memory_info().rss
+				for child in process.children(recursive=True):
+					try:
+						total += child.memory_info().rss
+					except psutil.Error:
+						pass
+				self.peak_bytes = max(self.peak_bytes or 0, total)
+			except psutil.Error:
+				pass
+			self._stop.wait(self.interval_s)
+
+	def __enter__(self):
+		if psutil is not None:
+			self._thread = threading.Thread(target=self._sample)
+			self._thread.daemon = True
+			self._thread.start()
+		return self
+
+	def __exit__(self, *exc_info):
+		if self._thread is not None:
+			self._stop.set()
+			self._thread.join()
+		return False
+
+
+def _calibration_edge_mm(target_cells, step_mm=CALIBRATION_STEP_MM, pml_layers=resource_estimator.DEFAULT_PML_LAYERS):
+	"""
+	吸収境界を含めたセル数が target_cells になる立方体領域の一辺 [mm] を返します。
+	"""
+	n = max(round(target_cells ** (1.0 / 3.0)) - 2 * pml_layers, 4)
+	return n * step_mm
+
+
+def _create_calibration_simulation(name, edge_mm, kernel):
+	"""
+	一辺edge_mmの空気領域の中心に筋肉相当のブロックを置いた校正用シミュレーションを作成します。
+	グリッドは CALIBRATION_STEP_MM の一様な手動グリッドです。
+	"""
+	import s4l_v1.model as model
+	import s4l_v1.simulation.emfdtd as fdtd
+	import s4l_v1.units as units
+	from s4l_v1 import Unit
+	from s4l_v1.model import Vec3
+
+	half = 0.5 * edge_mm
+	wire = model.CreateWireBlock(p0=Vec3(-half, -half, -half), p1=Vec3(half, half, half), parametrized=True)
+	wire.Name = f"{name} Source"
+	block = model.CreateSolidBlock(p0=Vec3(-0.5 * half, -0.5 * half, -0.5 * half),
+		p1=Vec3(0.5 * half, 0.5 * half, 0.5 * half), parametrized=True)
+	block.Name = f"{name} Block"
+
+	sim = fdtd.Simulation()
+	sim.Name = name
+	sim.SetupSettings.SimulationTime = CALIBRATION_PERIODS, units.Periods
+
+	material_settings = fdtd.MaterialSettings()
+	material_settings.Name = "Calibration Muscle"
+	material_settings.MassDensity = 1090.4, Unit("kg/m^3")
+	material_settings.ElectricProps.Conductivity = 0.9782042083052804, Unit("S/m")
+	material_settings.ElectricProps.RelativePermittivity = 54.81107626413944
+	sim.Add(material_settings, [block])
+
+	plane_wave_source_settings = sim.AddPlaneWaveSourceSettings(wire)
+	plane_wave_source_settings.CenterFrequency = CALIBRATION_FREQUENCY_MHZ, units.MHz
+
+	options = sim.GlobalBoundarySettings.GlobalBoundaryType.enum
+	sim.GlobalBoundarySettings.GlobalBoundaryType = options.UpmlCpml
+
+	manual_grid_settings = sim.AddManualGridSettings([wire, block])
+	manual_grid_settings.MaxStep = (CALIBRATION_STEP_MM,) * 3 # model units
+	manual_grid_settings.Resolution = (CALIBRATION_STEP_MM,) * 3 # model units
+	sim.AddAutomaticVoxelerSettings([wire, block])
+
+	solver_settings = sim.SolverSettings
+	solver_settings.Kernel = getattr(solver_settings.Kernel.enum, kernel)
+	return sim, [wire, block]
+
+
+def run_kernel_benchmark(cell_counts=DEFAULT_CALIBRATION_CELLS, kernels=None, profile_path=DEFAULT_PROFILE_PATH):
+	"""
+	利用可能な各カーネルで校正問題をセル数を変えて実行し、スループット [Mcells/s] と
+	ピークメモリをプロファイルに記録します。
+
+	Args:
+		cell_counts (tuple): 校正問題のセル数 (吸収境界を含む) のリスト。
+		kernels (list): 計測するカーネル名。Noneの場合は probe_kernels() の結果を使用。
+		profile_path (str): プロファイルの保存先。
+
+	Returns:
+		dict: 保存したプロファイル。
+	"""
+	import s4l_v1.document as document
+	import s4l_v1.simulation.emfdtd as fdtd
+
+	if kernels is None:
+		kernels = probe_kernels(fdtd.Simulation())
+	_log.info("Benchmarking kernels %s at %d problem sizes.", kernels, len(cell_counts))
+
+	frequency_hz = CALIBRATION_FREQUENCY_MHZ * 1e6
+	time_step = resource_estimator.estimate_time_step((CALIBRATION_STEP_MM,) * 3)
+	time_steps = int(math.ceil(CALIBRATION_PERIODS / frequency_hz / time_step))
+
+	profile = {
+		'host': platform.node(),
+		'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+		'cpu_count': os.cpu_count(),
+		'kernels': {},
+	}
+	for kernel in kernels:
+		samples = []
+		for target_cells in cell_counts:
+			edge_mm = _calibration_edge_mm(target_cells)
+			name = f"Kernel Calibration {kernel} {int(target_cells)}"
+			sim, entities = _create_calibration_simulation(name, edge_mm, kernel)
+			try:
+				document.AllSimulations.Add(sim)
+				sim.UpdateGrid()
+				sim.CreateVoxels()
+				with _PeakMemorySampler() as sampler:
+					start = time.perf_counter()
+					sim.RunSimulation(wait=True)
+					wall_time_s = time.perf_counter() - start
+			except Exception as e:
+				_log.warning("Calibration run '%s' failed (%s).", name, e)
+				continue
+			finally:
+				if sim in list(document.AllSimulations):
+					document.AllSimulations.Remove(sim)
+				for entity in entities:
+					entity.Delete()
+
+			n = round(edge_mm / CALIBRATION_STEP_MM) + 2 * resource_estimator.DEFAULT_PML_LAYERS
+			cells = n ** 3
+			throughput = cells * time_steps / wall_time_s / 1e6
+			samples.append({
+				'cells': cells,
+				'time_steps': time_steps,
+				'wall_time_s': wall_time_s,
+				'mcells_per_s': throughput,
+				'peak_memory_bytes': sampler.peak_bytes,
+			})
+			_log.info("%s: %.2f MCells -> %.1f Mcells/s in %.1f s", kernel, cells / 1e6, throughput, wall_time_s)
+		if samples:
+			profile['kernels'][kernel] = samples
+
+	save_profile(profile, profile_path)
+	return profile
+
+
+def save_profile(profile, profile_path=DEFAULT_PROFILE_PATH):
+	"""
+	プロファイルをJSONファイルに保存します。
+	"""
+	profile_dir = os.path.dirname(profile_path)
+	if profile_dir and not os.path.exists(profile_dir):
+		os.makedirs(profile_dir)
+	with open(profile_path, 'w', encoding='utf-8') as f:
+		json.dump(profile, f, indent=2)
+	_log.info("Kernel profile written to '%s'.", profile_path)
+
+
+def load_profile(profile_path=DEFAULT_PROFILE_PATH):
+	"""
+	プロファイルを読み込みます。ファイルがない場合や別ホストのプロファイルの場合はNoneを返します。
+	"""
+	if not os.path.exists(profile_path):
+		return None
+	with open(profile_path, 'r', encoding='utf-8') as f:
+		profile = json.load(f)
+	if profile.get('host') != platform.node():
+		_log.warning("Kernel profile '%s' was recorded on '%s'. Ignoring it.", profile_path, profile.get('host'))
+		return None
+	return profile
+
+
+def throughput_for(profile, kernel, cells):
+	"""
+	プロファイルから、指定セル数でのカーネルのスループット [Mcells/s] を
+	セル数の対数について線形補間して返します。計測範囲外は端の値を使用します。
+	"""
+	samples = sorted(profile['kernels'].get(kernel, []), key=lambda s: s['cells'])
+	if not samples:
+		return None
+	if cells <= samples[0]['cells']:
+		return samples[0]['mcells_per_s']
+	if cells >= samples[-1]['cells']:
+		return samples[-1]['mcells_per_s']
+	for lower, upper in zip(samples[:-1], samples[1:]):
+		if lower['cells'] <= cells <= upper['cells']:
+			t = (math.log(cells) - math.log(lower['cells'])) / (math.log(upper['cells']) - math.log(lower['cells']))
+			return lower['mcells_per_s'] + t * (upper['mcells_per_s'] - lower['mcells_per_s'])
+	return samples[-1]['mcells_per_s']
+
+
+def select_kernel(profile, cells):
+	"""
+	指定セル数で最もスループットが高いカーネルを返します。
+
+	Returns:
+		tuple: (カーネル名, スループット[Mcells/s])。プロファイルが空の場合は (None, None)。
+	"""
+	best = (None, None)
+	for kernel in profile['kernels']:
+		throughput = throughput_for(profile, kernel, cells)
+		if throughput is not None and (best[1] is None or throughput > best[1]):
+			best = (kernel, throughput)
+	return best
+
+
+def select_concurrency(profile, kernel, cells, memory_bytes, ram_budget_bytes=None):
+	"""
+	同時実行数を決めます。
+
+	GPUカーネルは1本ずつ実行します。CPUカーネルでは、このセル数でのスループットが
+	計測した最大スループットの何分の一かを同時実行数とし、RAM予算で上限をかけます。
+	"""
+	if kernel in GPU_KERNELS:
+		return 1
+	samples = profile['kernels'].get(kernel, [])
+	if not samples:
+		return 1
+	peak = max(s['mcells_per_s'] for s in samples)
+	current = throughput_for(profile, kernel, cells)
+	concurrency = max(int(peak / current), 1) if current else 1
+	if ram_budget_bytes:
+		concurrency = min(concurrency, max(int(ram_budget_bytes // memory_bytes), 1))
+	return concurrency
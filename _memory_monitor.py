@@ -0,0 +1,223 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import json
+import os
+import time
+import tracemalloc
+
+import numpy as np
+
+try:
+	import psutil
+except ImportError:
+	psutil = None
+
+# 単調増加と判定する、増加したステップの割合の下限
+DEFAULT_MONOTONIC_FRACTION = 0.9
+# 判定に必要なメンバー数
+DEFAULT_MIN_MEMBERS = 4
+# 増加の大きいPythonのメモリ確保箇所を表示する件数
+DEFAULT_TOP_ALLOCATIONS = 5
+
+
+def process_rss_bytes():
+	"""
+	このプロセスの常駐メモリ (RSS) [byte] を返します。取得できない場合はNoneを返します。
+	psutilがない場合は、Linuxでは /proc、Windowsでは GetProcessMemoryInfo を使用します。
+	"""
+	if psutil is not None:
+		return float(psutil.Process().memory_info().rss)
+	try:
+		if os.name == 'nt':
+			import ctypes
+			import ctypes.wintypes
+
+			class _ProcessMemoryCounters(ctypes.Structure):
+				_fields_ = [
+					('cb', ctypes.wintypes.DWORD),
+					('PageFaultCount', ctypes.wintypes.DWORD),
+					('PeakWorkingSetSize', ctypes.c_size_t),
+					('WorkingSetSize', ctypes.c_size_t),
+					('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+					('QuotaPagedPoolUsage', ctypes.c_size_t),
+					('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+					('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+					('PagefileUsage', ctypes.c_size_t),
+					('PeakPagefileUsage', ctypes.c_size_t),
+				]
+
+			counters = _ProcessMemoryCounters()
+			counters.cb = ctypes.sizeof(_ProcessMemoryCounters)
+			handle = ctypes.windll.kernel32.GetCurrentProcess()
+			ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb)
+			return float(counters.WorkingSetSize)
+		with open('/proc/self/statm') as f:
+			return float(int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE'))
+	except Exception:
+		return None
+
+
+def document_counts():
+	"""
+	開いているドキュメントのシミュレーション数と解析アルゴリズム数を返します。
+	Sim4Lifeの外で実行している場合は (None, None) を返します。
+	"""
+	try:
+		import s4l_v1.document as document
+		return len(list(document.AllSimulations)), len(list(document.AllAlgorithms))
+	except Exception:
+		return None, None
+
+
+class MemoryMonitor(object):
+	"""
+	スイープの各メンバーのフェーズ前後で、プロセスのRSS、Pythonヒープ (tracemalloc)、
+	ドキュメントのシミュレーション数とアルゴリズム数を記録します。
+
+	_sweep_timing.SweepTimer の hooks に渡すと、タイミングのスパンと同じ単位でサンプリングされ、
+	snapshot_phase のフェーズの後 (メンバーの最後) にtracemallocのスナップショットを取得します。
+	jsonl_pathを指定した場合は、各サンプルをJSON Lines形式で追記します。
+
+	tracemallocはPythonのすべてのメモリ確保を遅くするため、スイープが終わったら close() で停止します。
+	"""
+
+	def __init__(self, jsonl_path=None, trace_python=True, snapshot_phase='analyze'):
+		self.jsonl_path = jsonl_path
+		self.trace_python = trace_python
+		self.snapshot_phase = snapshot_phase
+		self.samples = []
+		self._baseline_snapshot = None
+		self._latest_snapshot = None
+		# 他でtracemallocを開始している場合は、close() で停止しない
+		self._started_tracing = trace_python and not tracemalloc.is_tracing()
+		if self._started_tracing:
+			tracemalloc.start()
+		if jsonl_path:
+			jsonl_dir = os.path.dirname(jsonl_path)
+			if jsonl_dir and not os.path.exists(jsonl_dir):
+				os.makedirs(jsonl_dir)
+
+	def sample(self, member, phase, when):
+		"""
+		現在のメモリ使用量を (member, phase, when) のサンプルとして記録して返します。
+		whenは 'before' または 'after' です。
+		"""
+		simulations, algorithms = document_counts()
+		record = {
+			'time': time.time(),
+			'member': member,
+			'phase': phase,
+			'when': when,
+			'rss_bytes': process_rss_bytes(),
+			'python_heap_bytes': None,
+			'simulations': simulations,
+			'algorithms': algorithms,
+		}
+		if self.trace_python and tracemalloc.is_tracing():
+			record['python_heap_bytes'] = float(tracemalloc.get_traced_memory()[0])
+		self.samples.append(record)
+		if self.jsonl_path:
+			with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+				f.write(json.dumps(record) + "\n")
+		return record
+
+	def on_span_start(self, member, phase):
+		self.sample(member, phase, 'before')
+
+	def on_span_end(self, member, phase, record):
+		self.sample(member, phase, 'after')
+		if phase == self.snapshot_phase:
+			self.snapshot()
+
+	def snapshot(self):
+		"""
+		tracemallocのスナップショットを取得します。最初のスナップショットを増加量の基準とします。
+		"""
+		if not (self.trace_python and tracemalloc.is_tracing()):
+			return None
+		snapshot = tracemalloc.take_snapshot()
+		if self._baseline_snapshot is None:
+			self._baseline_snapshot = snapshot
+		self._latest_snapshot = snapshot
+		return snapshot
+
+	def close(self):
+		"""
+		このモニターが開始したtracemallocを停止します。スナップショットは破棄し、以後のサンプルはRSSと
+		ドキュメントの数だけを記録します (増加の判定には記録済みのサンプルを使用します)。
+		"""
+		if self._started_tracing and tracemalloc.is_tracing():
+			tracemalloc.stop()
+		self._started_tracing = False
+		self.trace_python = False
+		self._baseline_snapshot = None
+		self._latest_snapshot = None
+
+	def top_allocation_growth(self, limit=DEFAULT_TOP_ALLOCATIONS):
+		"""
+		基準スナップショットから最新スナップショットまでに最も増加したメモリ確保箇所を返します。
+		"""
+		if self._baseline_snapshot is None or self._latest_snapshot is self._baseline_snapshot:
+			return []
+		stats = self._latest_snapshot.compare_to(self._baseline_snapshot, 'lineno')
+		return [str(stat) for stat in stats[:limit]]
+
+	def member_timeline(self):
+		"""
+		各メンバーの最後のサンプル (最後のフェーズの後) をメンバーの実行順に返します。
+		"""
+		last = {}
+		order = []
+		for record in self.samples:
+			if record['member'] not in last:
+				order.append(record['member'])
+			last[record['member']] = record
+		return [last[member] for member in order]
+
+	def growth_report(self, monotonic_fraction=DEFAULT_MONOTONIC_FRACTION, min_members=DEFAULT_MIN_MEMBERS):
+		"""
+		メンバーごとの値が単調に増加している指標を判定します。
+
+		Returns:
+			list: 'metric', 'first', 'last', 'slope_per_member', 'increasing_fraction', 'monotonic'
+				を持つ辞書のリスト。
+		"""
+		timeline = self.member_timeline()
+		report = []
+		for metric in ('rss_bytes', 'python_heap_bytes', 'simulations', 'algorithms'):
+			values = [record[metric] for record in timeline if record[metric] is not None]
+			if len(values) < min_members:
+				continue
+			values = np.asarray(values, dtype=float)
+			steps = np.diff(values)
+			increasing_fraction = float(np.count_nonzero(steps >= 0) / len(steps))
+			slope = float(np.polyfit(np.arange(len(values)), values, 1)[0])
+			report.append({
+				'metric': metric,
+				'first': float(values[0]),
+				'last': float(values[-1]),
+				'slope_per_member': slope,
+				'increasing_fraction': increasing_fraction,
+				'monotonic': increasing_fraction >= monotonic_fraction and values[-1] > values[0] and slope > 0,
+			})
+		return report
+
+	def format_growth_report(self):
+		"""
+		growth_report() と増加の大きいメモリ確保箇所を表示用の文字列に整形します。
+		"""
+		lines = []
+		for row in self.growth_report():
+			flag = "GROWING" if row['monotonic'] else "ok"
+			if row['metric'].endswith('_bytes'):
+				scale = 1024.0 ** 2
+				lines.append(f"{row['metric']:<20}{flag:>8}  {row['first'] / scale:.1f} MB -> {row['last'] / scale:.1f} MB "
+					f"({row['slope_per_member'] / scale:+.2f} MB/member)")
+			else:
+				lines.append(f"{row['metric']:<20}{flag:>8}  {row['first']:.0f} -> {row['last']:.0f} "
+					f"({row['slope_per_member']:+.2f}/member)")
+		top = self.top_allocation_growth()
+		if top:
+			lines.append("Top Python allocation growth:")
+			lines.extend(f"  {line}" for line in top)
+		return "\n".join(lines)
@@ -0,0 +1,290 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import math
+import os
+import shutil
+
+import _sweep_logging as sweep_logging
+
+_log = sweep_logging.get_logger('resource_estimator')
+
+# 光速 [m/s]
+SPEED_OF_LIGHT = 299792458.0
+
+# 1セル当たりのソルバーメモリ [byte]
+# E/H 6成分 + 更新係数 + 材料インデックスを単精度で持つ場合の概算
+DEFAULT_BYTES_PER_CELL_SOLVER = 64.0
+# 1セル当たりの出力ファイルサイズ [byte]
+# Overall Field の E, H, J, SAR などの複素数出力の概算
+DEFAULT_BYTES_PER_CELL_OUTPUT = 112.0
+# ソルバープロセスの固定オーバーヘッド [byte]
+DEFAULT_SOLVER_OVERHEAD_BYTES = 512.0 * 1024 ** 2
+# 吸収境界 (UPML/CPML) の層数
+DEFAULT_PML_LAYERS = 8
+# カーネルごとの既定スループット [Mcells/s] (プロファイル未計測時の目安)
+DEFAULT_THROUGHPUT_MCELLS = {
+	'AXware': 1500.0,
+	'Cuda': 1000.0,
+	'Software': 60.0,
+}
+# メッシュ生成・ボクセル化・解析の固定時間 [s]
+DEFAULT_SETUP_OVERHEAD_S = 60.0
+
+
+def bounding_box_union(bboxes):
+	"""
+	バウンディングボックス ((x0,y0,z0), (x1,y1,z1)) のリストの和集合を返します。
+	空のリストの場合はNoneを返します。
+	"""
+	bboxes = [b for b in bboxes if b is not None]
+	if not bboxes:
+		return None
+	p0 = tuple(min(float(b[0][i]) for b in bboxes) for i in range(3))
+	p1 = tuple(max(float(b[1][i]) for b in bboxes) for i in range(3))
+	return (p0, p1)
+
+
+def get_entity_bounding_boxes(entities):
+	"""
+	Sim4Lifeエンティティのリストから、各エンティティのバウンディングボックス [mm] を取得します。
+	取得に失敗したエンティティはNoneになります。
+	"""
+	import s4l_v1.model as model
+
+	bboxes = []
+	for entity in entities:
+		try:
+			p0, p1 = model.GetBoundingBox([entity])
+			bboxes.append(((p0[0], p0[1], p0[2]), (p1[0], p1[1], p1[2])))
+		except Exception as e:
+			_log.warning("Could not get bounding box of '%s' (%s).", getattr(entity, 'Name', entity), e)
+			bboxes.append(None)
+	return bboxes
+
+
+def graded_axis_line_counts(domain_bbox, regions, background_step_mm):
+	"""
+	直交格子の各軸のセル数を見積もります。
+
+	regions は (バウンディングボックス, セルサイズ[mm]) のリストで、各軸上の区間ごとに
+	その区間を覆う領域の最小セルサイズ (どの領域にも含まれない場合は background_step_mm) で分割します。
+	"""
+	counts = []
+	for axis in range(3):
+		lo = domain_bbox[0][axis]
+		hi = domain_bbox[1][axis]
+
+		# ドメイン内に切り詰めた各領域の区間
+		intervals = []
+		for bbox, step in regions or []:
+			a = max(bbox[0][axis], lo)
+			b = min(bbox[1][axis], hi)
+			if b > a and step:
+				intervals.append((a, b, step))
+
+		# 区間の端点で軸を分割し、各区間で最も細かいセルサイズを採用する
+		breaks = sorted(set([lo, hi] + [a for a, _, _ in intervals] + [b for _, b, _ in intervals]))
+		n = 0.0
+		for a, b in zip(breaks[:-1], breaks[1:]):
+			mid = 0.5 * (a + b)
+			steps = [step for ia, ib, step in intervals if ia <= mid <= ib]
+			n += (b - a) / min(steps + [background_step_mm])
+		counts.append(max(int(math.ceil(n)), 1))
+	return counts
+
+
+def estimate_time_step(min_steps_mm):
+	"""
+	Courant条件から最大タイムステップ [s] を返します。
+	"""
+	inv = sum(1.0 / (step * 1e-3) ** 2 for step in min_steps_mm)
+	return 1.0 / (SPEED_OF_LIGHT * math.sqrt(inv))
+
+
+def estimate_simulation_resources(domain_bbox, frequency_hz, periods,
+		refined_bboxes=None, max_step_mm=9.0, resolution_mm=2.0, regions=None,
+		pml_layers=DEFAULT_PML_LAYERS, kernel='Software', throughput_mcells=None,
+		bytes_per_cell_solver=DEFAULT_BYTES_PER_CELL_SOLVER,
+		bytes_per_cell_output=DEFAULT_BYTES_PER_CELL_OUTPUT):
+	"""
+	1つのハーモニックFDTDシミュレーションのセル数、メモリ、ディスク、実行時間を見積もります。
+
+	Args:
+		domain_bbox: 計算領域 (平面波ソースのWire Block) のバウンディングボックス [mm]。
+		frequency_hz (float): 励振周波数 [Hz]。
+		periods (float): SimulationTime [周期]。
+		refined_bboxes (list): 細分化される組織エンティティのバウンディングボックス [mm]。
+		max_step_mm (float): 空気領域の最大セルサイズ [mm]。
+		resolution_mm (float): 組織領域のセルサイズ [mm]。
+		regions (list): (バウンディングボックス, セルサイズ[mm]) のリスト。指定した場合は
+			refined_bboxes と resolution_mm の代わりに使用します。
+		pml_layers (int): 各面に追加される吸収境界の層数。
+		kernel (str): ソルバーカーネル名 ('AXware', 'Cuda', 'Software')。
+		throughput_mcells (float): 実測スループット [Mcells/s]。Noneの場合は既定値を使用。
+
+	Returns:
+		dict: 'cells', 'grid_shape', 'time_steps', 'memory_bytes', 'disk_bytes', 'wall_time_s' などを含む辞書。
+	"""
+	if regions is None:
+		regions = [(bbox, resolution_mm) for bbox in refined_bboxes or []]
+	shape = graded_axis_line_counts(domain_bbox, regions, max_step_mm)
+	shape = [n + 2 * pml_layers for n in shape]
+	cells = shape[0] * shape[1] * shape[2]
+
+	min_step = min([step for _, step in regions] + [max_step_mm])
+	dt = estimate_time_step((min_step,) * 3)
+	time_steps = int(math.ceil(periods / frequency_hz / dt))
+
+	if throughput_mcells is None:
+		throughput_mcells = DEFAULT_THROUGHPUT_MCELLS.get(kernel, DEFAULT_THROUGHPUT_MCELLS['Software'])
+	solve_time_s = cells * time_steps / (throughput_mcells * 1e6)
+
+	return {
+		'grid_shape': tuple(shape),
+		'cells': cells,
+		'time_steps': time_steps,
+		'time_step_s': dt,
+		'memory_bytes': cells * bytes_per_cell_solver + DEFAULT_SOLVER_OVERHEAD_BYTES,
+		'disk_bytes': cells * bytes_per_cell_output,
+		'wall_time_s': solve_time_s + DEFAULT_SETUP_OVERHEAD_S,
+		'kernel': kernel,
+		'max_step_mm': max_step_mm,
+		'resolution_mm': resolution_mm,
+	}
+
+
+def available_ram_bytes():
+	"""
+	現在利用可能な物理メモリ [byte] (Windowsでは ullAvailPhys、Linuxでは /proc/meminfo の MemAvailable) を返します。
+	取得できない場合はNoneを返します。
+	"""
+	try:
+		if os.name == 'nt':
+			import ctypes
+
+			class _MemoryStatusEx(ctypes.Structure):
+				_fields_ = [
+					('dwLength', ctypes.c_ulong),
+					('dwMemoryLoad', ctypes.c_ulong),
+					('ullTotalPhys', ctypes.c_ulonglong),
+					('ullAvailPhys', ctypes.c_ulonglong),
+					('ullTotalPageFile', ctypes.c_ulonglong),
+					('ullAvailPageFile', ctypes.c_ulonglong),
+					('ullTotalVirtual', ctypes.c_ulonglong),
+					('ullAvailVirtual', ctypes.c_ulonglong),
+					('ullAvailExtendedVirtual', ctypes.c_ulonglong),
+				]
+
+			status = _MemoryStatusEx()
+			status.dwLength = ctypes.sizeof(_MemoryStatusEx)
+			ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status))
+			return float(status.ullAvailPhys)
+		if os.path.exists('/proc/meminfo'):
+			with open('/proc/meminfo') as f:
+				for line in f:
+					if line.startswith('MemAvailable:'):
+						return float(line.split()[1]) * 1024.0
+		return float(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVPHYS_PAGES'))
+	except Exception:
+		return None
+
+
+def available_disk_bytes(path):
+	"""
+	pathが属するドライブの空き容量 [byte] を返します。取得できない場合はNoneを返します。
+	"""
+	try:
+		return float(shutil.disk_usage(path).free)
+	except Exception:
+		return None
+
+
+def admit_sweep(estimate, n_configs, ram_budget_gb=None, disk_budget_gb=None,
+		concurrency=1, policy='downscale', output_dir=None, ram_fraction=0.8):
+	"""
+	見積もり結果と予算からスイープの実行可否を判定します。
+
+	RAM予算は同時実行数の上限を、ディスク予算は実行できるシミュレーション数の上限を決めます。
+	1本でもRAM予算に収まらない場合は、セルサイズを粗くした場合の推奨値を返して拒否します。
+
+	Args:
+		estimate (dict): estimate_simulation_resources() の戻り値。
+		n_configs (int): スイープのシミュレーション数。
+		ram_budget_gb (float): RAM予算 [GB]。Noneの場合は利用可能な物理メモリ × ram_fraction。
+		disk_budget_gb (float): ディスク予算 [GB]。Noneの場合は output_dir の空き容量。
+		concurrency (int): 希望する同時実行数。
+		policy (str): 'downscale' (縮小して実行) または 'refuse' (予算超過時は拒否)。
+			'downscale' では、RAM予算の超過は同時実行数を下げて解消し、それでも収まらないディスク予算の超過に限り
+			max_configs を減らします (どの設定を除くかと、その記録は呼び出し側が行います)。
+
+	Returns:
+		dict: 'admitted', 'concurrency', 'max_configs', 'reasons', 'suggested_max_step_mm',
+			'suggested_resolution_mm' を含む辞書。
+	"""
+	gb = 1024.0 ** 3
+	if ram_budget_gb is not None:
+		ram_budget = ram_budget_gb * gb
+	else:
+		total_ram = available_ram_bytes()
+		ram_budget = total_ram * ram_fraction if total_ram else None
+	if disk_budget_gb is not None:
+		disk_budget = disk_budget_gb * gb
+	else:
+		disk_budget = available_disk_bytes(output_dir) if output_dir else None
+
+	decision = {
+		'admitted': True,
+		'concurrency': max(int(concurrency), 1),
+		'max_configs': n_configs,
+		'reasons': [],
+		'suggested_max_step_mm': None,
+		'suggested_resolution_mm': None,
+		'ram_budget_bytes': ram_budget,
+		'disk_budget_bytes': disk_budget,
+	}
+
+	memory = estimate['memory_bytes']
+	if ram_budget is not None:
+		fit = int(ram_budget // memory)
+		if fit < 1:
+			# セル数はセルサイズの3乗に反比例するため、必要な粗さは (超過率)^(1/3)
+			scale = (memory / ram_budget) ** (1.0 / 3.0)
+			decision['admitted'] = False
+			decision['suggested_max_step_mm'] = estimate['max_step_mm'] * scale
+			decision['suggested_resolution_mm'] = estimate['resolution_mm'] * scale
+			decision['reasons'].append(
+				f"single run needs {memory / gb:.1f} GB but RAM budget is {ram_budget / gb:.1f} GB")
+			return decision
+		if fit < decision['concurrency']:
+			decision['reasons'].append(
+				f"concurrency reduced from {decision['concurrency']} to {fit} to fit RAM budget")
+			if policy == 'refuse':
+				decision['admitted'] = False
+				return decision
+			decision['concurrency'] = fit
+
+	disk = estimate['disk_bytes']
+	if disk_budget is not None and disk * n_configs > disk_budget:
+		max_configs = int(disk_budget // disk)
+		decision['reasons'].append(
+			f"sweep needs {disk * n_configs / gb:.1f} GB of output but disk budget is {disk_budget / gb:.1f} GB")
+		if policy == 'refuse' or max_configs < 1:
+			decision['admitted'] = False
+			decision['max_configs'] = max_configs
+			return decision
+		decision['max_configs'] = max_configs
+
+	return decision
+
+
+def format_estimate(estimate):
+	"""
+	見積もり結果を1行の文字列に整形します。
+	"""
+	gb = 1024.0 ** 3
+	nx, ny, nz = estimate['grid_shape']
+	return (f"{estimate['cells'] / 1e6:.1f} MCells ({nx} x {ny} x {nz}), "
+		f"{estimate['time_steps']} steps, "
+		f"memory {estimate['memory_bytes'] / gb:.2f} GB, "
+		f"disk {estimate['disk_bytes'] / gb:.2f} GB, "
+		f"~{estimate['wall_time_s'] / 60.0:.1f} min on {estimate['kernel']}")
@@ -0,0 +1,258 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import json
+import math
+import os
+
+import numpy as np
+
+import _sweep_logging as sweep_logging
+
+_log = sweep_logging.get_logger('steady_state_monitor')
+
+# 周期ごとの位相振幅の相対変化の許容値
+DEFAULT_TOLERANCE = 1e-3
+# 許容値を下回り続ける必要がある周期数
+DEFAULT_STABLE_PERIODS = 3
+# 定常状態を監視するシミュレーションのソルバーの自動終了 (UserDefined) の収束レベル [dB]。
+# ソルバーが判定するのは場のエネルギーの収束で、周期ごとの位相振幅の変化 (DEFAULT_TOLERANCE) とは別の量のため、
+# 許容値からは換算しない。既定の自動終了 (Strict) より緩く、予算より早く定常状態に達した計算を打ち切る値とする
+DEFAULT_CONVERGENCE_LEVEL_DB = -30.0
+# 学習した周期数に掛ける安全係数
+DEFAULT_SAFETY_FACTOR = 1.25
+# 周期数の下限
+DEFAULT_MIN_PERIODS = 5.0
+# 周期予算の既定の保存先
+DEFAULT_BUDGET_PATH = os.path.join(os.path.expanduser('~'), '.s4l_sweep', 'period_budgets.json')
+# 定常状態監視用の点センサー名の接頭辞
+SENSOR_PREFIX = "Steady State Probe"
+# 点センサーを置く組織エンティティのバウンディングボックスの各辺の下限 [mm]
+DEFAULT_MIN_PROBE_ENTITY_MM = 20.0
+# 周期予算の計算に使用する最近の収束の観測数と、その分位点 [%]
+DEFAULT_HISTORY = 20
+DEFAULT_BUDGET_PERCENTILE = 90.0
+
+
+def phasor_amplitudes_per_period(time_s, signal, frequency_hz):
+	"""
+	時間波形を1周期ごとに区切り、各周期の周波数 frequency_hz での位相振幅 (DFT) を返します。
+
+	Args:
+		time_s (ndarray): 時刻 [s]。
+		signal (ndarray): 時間波形 (1次元、または最後の軸が成分の2次元)。
+		frequency_hz (float): 励振周波数 [Hz]。
+
+	Returns:
+		ndarray: 各周期の位相振幅 (成分がある場合はベクトルのノルム)。
+	"""
+	time_s = np.asarray(time_s, dtype=float)
+	signal = np.asarray(signal, dtype=float)
+	if signal.ndim == 1:
+		signal = signal[:, np.newaxis]
+
+	period = 1.0 / frequency_hz
+	n_periods = int(math.floor((time_s[-1] - time_s[0]) / period + 1e-9))
+	kernel = np.exp(-2j * math.pi * frequency_hz * time_s)
+	period_index = np.floor((time_s - time_s[0]) / period + 1e-9).astype(int)
+
+	amplitudes = np.zeros(n_periods)
+	for k in range(n_periods):
+		mask = period_index == k
+		if np.count_nonzero(mask) < 2:
+			continue
+		dt = np.gradient(time_s[mask])
+		phasor = 2.0 / period * np.sum((signal[mask] * (kernel[mask] * dt)[:, np.newaxis]), axis=0)
+		amplitudes[k] = np.linalg.norm(phasor)
+	return amplitudes
+
+
+def converged_period(amplitudes, tolerance=DEFAULT_TOLERANCE, stable_periods=DEFAULT_STABLE_PERIODS):
+	"""
+	周期ごとの振幅の相対変化が tolerance 未満の状態が stable_periods 周期続いた時点の周期数を返します。
+	収束していない場合はNoneを返します。
+	"""
+	stable = 0
+	for k in range(1, len(amplitudes)):
+		reference = max(abs(amplitudes[k]), 1e-30)
+		change = abs(amplitudes[k] - amplitudes[k - 1]) / reference
+		stable = stable + 1 if change < tolerance else 0
+		if stable >= stable_periods:
+			return float(k + 1)
+	return None
+
+
+def probe_points(entities, n_probes=3, min_size_mm=DEFAULT_MIN_PROBE_ENTITY_MM):
+	"""
+	点センサーを置く組織内の点 [mm] を選びます。
+
+	人体全体のバウンディングボックスの中心付近は脚の間など空気になりうるため、各辺が min_size_mm 以上の
+	組織エンティティのうちバウンディングボックスの小さいもの (中心がその組織の内部にある、コンパクトな臓器) から
+	順に n_probes 個を選び、それぞれのバウンディングボックスの中心を使用します。
+	条件を満たすエンティティがない場合は、全体のバウンディングボックスの中心を使用します。
+
+	Returns:
+		list: (x, y, z) [mm] のリスト。エンティティのバウンディングボックスが取得できない場合は空のリスト。
+	"""
+	import _resource_estimator as resource_estimator
+
+	bboxes = [b for b in resource_estimator.get_entity_bounding_boxes(entities) if b is not None]
+	if not bboxes:
+		return []
+
+	def _extents(bbox):
+		return [bbox[1][i] - bbox[0][i] for i in range(3)]
+
+	compact = [b for b in bboxes if min(_extents(b)) >= min_size_mm]
+	compact.sort(key=lambda b: float(np.prod(_extents(b))))
+	chosen = compact[:n_probes] or [resource_estimator.bounding_box_union(bboxes)]
+	return [tuple(0.5 * (bbox[0][i] + bbox[1][i]) for i in range(3)) for bbox in chosen]
+
+
+def add_probe_sensors(sim, entities, n_probes=3):
+	"""
+	組織エンティティの内部 (probe_points() を参照) に点センサーを配置してシミュレーションに追加します。
+	点エンティティは最初のシミュレーションで作成し、以後のシミュレーションでは名前で再利用します。
+	スイープの終了後は remove_probe_points() で削除します。
+
+	Returns:
+		list: 作成した点エンティティの名前のリスト。
+	"""
+	import s4l_v1.model as model
+	import s4l_v1.simulation.emfdtd as fdtd
+	from s4l_v1.model import Vec3
+
+	existing = {entity.Name: entity for entity in model.AllEntities() if entity.Name.startswith(SENSOR_PREFIX)}
+	points = None
+	names = []
+	for index in range(n_probes):
+		name = f"{SENSOR_PREFIX} {index}"
+		point = existing.get(name)
+		if point is None:
+			if points is None:
+				points = probe_points(entities, n_probes)
+			if index >= len(points):
+				break
+			point = model.CreatePoint(Vec3(*points[index]))
+			point.Name = name
+		point_sensor_settings = fdtd.PointSensorSettings()
+		point_sensor_settings.Name = name
+		sim.Add(point_sensor_settings, [point])
+		names.append(name)
+	return names
+
+
+def remove_probe_points():
+	"""
+	add_probe_sensors() で作成した点エンティティをモデルから削除します (プロジェクトに保存されないように)。
+
+	Returns:
+		int: 削除した点の数。
+	"""
+	import s4l_v1.model as model
+
+	points = [entity for entity in model.AllEntities() if entity.Name.startswith(SENSOR_PREFIX)]
+	if points:
+		model.Delete(points)
+	return len(points)
+
+
+def _extract_probe_signal(sim, sensor_name):
+	"""
+	点センサーの時間波形 EM E(t) を (時刻, 信号) として取り出します。取得できない場合はNoneを返します。
+	"""
+	try:
+		sensor_extractor = sim.Results()[sensor_name]
+		output = sensor_extractor.Outputs["EM E(t)"]
+		output.Update()
+		data = output.Data
+		time_s = np.asarray(data.Axis)
+		signal = np.stack([np.real(np.asarray(data.GetComponent(i))).ravel() for i in range(3)], axis=-1)
+		return time_s, signal
+	except Exception as e:
+		_log.warning("Could not read time signal of '%s' in '%s' (%s).", sensor_name, sim.Name, e)
+		return None
+
+
+def measure_convergence(sim, sensor_names, frequency_hz, tolerance=DEFAULT_TOLERANCE,
+		stable_periods=DEFAULT_STABLE_PERIODS):
+	"""
+	実行済みシミュレーションの点センサーから、すべてのセンサーが定常状態に達した周期数を求めます。
+	いずれかのセンサーが収束していない、または読み取れない場合はNoneを返します。
+	"""
+	if not sensor_names:
+		_log.warning("No steady-state probes in '%s'.", sim.Name)
+		return None
+	periods = []
+	for sensor_name in sensor_names:
+		probe = _extract_probe_signal(sim, sensor_name)
+		if probe is None:
+			return None
+		amplitudes = phasor_amplitudes_per_period(probe[0], probe[1], frequency_hz)
+		period = converged_period(amplitudes, tolerance, stable_periods)
+		if period is None:
+			_log.warning("'%s' in '%s' did not reach steady state.", sensor_name, sim.Name)
+			return None
+		periods.append(period)
+	return max(periods) if periods else None
+
+
+def budget_key(model_name, frequency_mhz=None, grid=None):
+	"""
+	周期予算のキーを返します。定常状態に達するまでの周期数は周波数とグリッドによって変わるため、
+	モデル名に周波数 [MHz] とグリッド (grid_mode やティア名など) を加えます。
+	"""
+	key = model_name
+	if frequency_mhz is not None:
+		key += f" @ {frequency_mhz:g} MHz"
+	if grid:
+		key += f" [{grid}]"
+	return key
+
+
+def load_budgets(budget_path=DEFAULT_BUDGET_PATH):
+	"""
+	budget_key() をキーとする周期予算の辞書を読み込みます。
+	"""
+	if not os.path.exists(budget_path):
+		return {}
+	with open(budget_path, 'r', encoding='utf-8') as f:
+		return json.load(f)
+
+
+def get_period_budget(key, default_periods, budget_path=DEFAULT_BUDGET_PATH):
+	"""
+	学習済みの周期予算を返します。未学習の場合は default_periods を返します。
+	"""
+	budget = load_budgets(budget_path).get(key)
+	if budget is None:
+		return default_periods
+	return budget['periods']
+
+
+def update_period_budget(key, converged_periods, max_periods, safety_factor=DEFAULT_SAFETY_FACTOR,
+		min_periods=DEFAULT_MIN_PERIODS, history=DEFAULT_HISTORY, percentile=DEFAULT_BUDGET_PERCENTILE,
+		budget_path=DEFAULT_BUDGET_PATH):
+	"""
+	収束した周期数の観測値を追加し、周期予算を更新して返します。
+	予算は最近の history 個の観測値の percentile 分位点に安全係数を掛け、[min_periods, max_periods] に収めた値です。
+
+	converged_periods がNoneの場合 (予算内に収束しなかった、またはセンサーを読み取れなかった場合) は、
+	打ち切られた周期数は収束の観測値ではないため記録せず、次のシミュレーションの予算だけを max_periods に戻します。
+	次に収束した観測値で、予算は再び最近の観測値から計算されます。
+	"""
+	budgets = load_budgets(budget_path)
+	entry = budgets.get(key, {'observations': []})
+	if converged_periods is None:
+		entry['periods'] = max_periods
+	else:
+		entry['observations'] = (entry['observations'] + [converged_periods])[-history:]
+		recent = float(np.percentile(entry['observations'], percentile))
+		entry['periods'] = min(max(math.ceil(recent * safety_factor), min_periods), max_periods)
+	budgets[key] = entry
+
+	budget_dir = os.path.dirname(budget_path)
+	if budget_dir and not os.path.exists(budget_dir):
+		os.makedirs(budget_dir)
+	with open(budget_path, 'w', encoding='utf-8') as f:
+		json.dump(budgets, f, indent=2)
+	return entry['periods']
@@ -0,0 +1,196 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+# スイープのロガー名 (各モジュールは get_logger() でこの下の子ロガーを使用する)
+LOGGER_NAME = 's4l_sweep'
+# コンソールに同じキーのメッセージを再表示するまでの最短間隔 [s]
+DEFAULT_CONSOLE_INTERVAL_S = 10.0
+# コンソールに表示する最低レベル
+DEFAULT_CONSOLE_LEVEL = logging.INFO
+
+_listener = None
+_console_filter = None
+
+
+def get_logger(name=None):
+	"""
+	スイープのロガー (nameを指定した場合はその子ロガー) を返します。
+	configure_logging() を呼ぶまでは、Pythonの既定どおりWARNING以上だけが標準エラーに出力されます。
+	"""
+	return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+class RateLimitFilter(logging.Filter):
+	"""
+	同じキーのログを、最初の1件と以後 interval_s ごとに1件だけ通すフィルターです。
+
+	キーはロガー名、レベル、書式化前のメッセージ (QueueHandler経由では record.template) の組です。
+	log.warning("Entity '%s' not found.", name) のように引数付きで記録すると、
+	引数が異なっても同じキーとして数えられます。extra={'key': ...} で明示的に指定することもできます。
+	抑制した件数は、次に通したログの末尾と summary_lines() で報告します。
+	"""
+
+	def __init__(self, interval_s=DEFAULT_CONSOLE_INTERVAL_S):
+		super(RateLimitFilter, self).__init__()
+		self.interval_s = interval_s
+		self._last_emit = {}
+		self._suppressed = {}
+		self._totals = {}
+		self._lock = threading.Lock()
+
+	@staticmethod
+	def _key(record):
+		key = getattr(record, 'key', None)
+		if key is None:
+			key = getattr(record, 'template', record.msg)
+		return (record.name, record.levelno, str(key))
+
+	def filter(self, record):
+		key = self._key(record)
+		now = time.monotonic()
+		with self._lock:
+			self._totals[key] = self._totals.get(key, 0) + 1
+			last = self._last_emit.get(key)
+			if last is not None and now - last < self.interval_s:
+				self._suppressed[key] = self._suppressed.get(key, 0) + 1
+				return False
+			self._last_emit[key] = now
+			suppressed = self._suppressed.pop(key, 0)
+		if suppressed:
+			record.suppressed = suppressed
+		return True
+
+	def summary_lines(self):
+		"""
+		2回以上記録されたキーについて、合計件数の説明のリストを返します。
+		"""
+		with self._lock:
+			repeated = [(key, count) for key, count in self._totals.items() if count > 1]
+		repeated.sort(key=lambda item: -item[1])
+		return [f"{logging.getLevelName(levelno)}: {message} (x{count})" for (_, levelno, message), count in repeated]
+
+
+class _TemplateQueueHandler(logging.handlers.QueueHandler):
+	"""
+	キューに積む前に書式化前のメッセージを record.template に退避する QueueHandler です。
+	QueueHandler.prepare() は record.msg を書式化後の文字列に置き換えるため、
+	バックグラウンド側の RateLimitFilter はこの値をキーに使います。
+	"""
+
+	def prepare(self, record):
+		record.template = str(record.msg)
+		return super(_TemplateQueueHandler, self).prepare(record)
+
+
+class ConsoleFormatter(logging.Formatter):
+	"""
+	"LEVEL: メッセージ" の形式で整形し、抑制した件数があれば末尾に付けます。
+	"""
+
+	def format(self, record):
+		text = f"{record.levelname}: {record.getMessage()}"
+		suppressed = getattr(record, 'suppressed', 0)
+		if suppressed:
+			text += f" (+{suppressed} similar suppressed)"
+		if record.exc_info:
+			text += "\n" + self.formatException(record.exc_info)
+		return text
+
+
+class JsonLinesFormatter(logging.Formatter):
+	"""
+	1件のログを1行のJSONに整形します。extraで渡した member、phase、key も記録します。
+	"""
+
+	def format(self, record):
+		entry = {
+			'time': record.created,
+			'level': record.levelname,
+			'logger': record.name,
+			'message': record.getMessage(),
+		}
+		for field in ('member', 'phase', 'key'):
+			value = getattr(record, field, None)
+			if value is not None:
+				entry[field] = value
+		if record.exc_info:
+			entry['exception'] = self.formatException(record.exc_info)
+		return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(log_path=None, console_level=DEFAULT_CONSOLE_LEVEL,
+		console_interval_s=DEFAULT_CONSOLE_INTERVAL_S, stream=None):
+	"""
+	スイープのロガーを設定します。
+
+	ログはキューに積むだけで返り、バックグラウンドのスレッドが書き込みます。
+	log_pathを指定した場合はすべてのレベルをJSON Lines形式でファイルに書き込み、
+	コンソール (既定では設定時点の sys.stdout) には console_level 以上を RateLimitFilter を通して出力します。
+	既に設定されている場合は、先に shutdown_logging() を呼んで設定し直します。
+
+	Returns:
+		logging.Logger: スイープのロガー。
+	"""
+	global _listener, _console_filter
+	shutdown_logging(print_summary=False)
+
+	console_handler = logging.StreamHandler(stream if stream is not None else sys.stdout)
+	console_handler.setLevel(console_level)
+	console_handler.setFormatter(ConsoleFormatter())
+	_console_filter = RateLimitFilter(console_interval_s)
+	console_handler.addFilter(_console_filter)
+	handlers = [console_handler]
+
+	if log_path:
+		log_dir = os.path.dirname(log_path)
+		if log_dir and not os.path.exists(log_dir):
+			os.makedirs(log_dir)
+		file_handler = logging.FileHandler(log_path, encoding='utf-8')
+		file_handler.setLevel(logging.DEBUG)
+		file_handler.setFormatter(JsonLinesFormatter())
+		handlers.append(file_handler)
+
+	log_queue = queue.Queue()
+	logger = get_logger()
+	logger.setLevel(logging.DEBUG)
+	logger.propagate = False
+	for handler in list(logger.handlers):
+		logger.removeHandler(handler)
+	logger.addHandler(_TemplateQueueHandler(log_queue))
+
+	_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+	_listener.start()
+	return logger
+
+
+def shutdown_logging(print_summary=True):
+	"""
+	キューに残ったログを書き出してバックグラウンドのスレッドを停止し、ハンドラーを閉じます。
+	print_summary=Trueの場合は、繰り返し記録されたメッセージの件数をコンソールに表示します。
+	"""
+	global _listener, _console_filter
+	if _listener is None:
+		return
+	_listener.stop()
+	for handler in _listener.handlers:
+		if print_summary and _console_filter is not None and isinstance(handler, logging.StreamHandler) \
+				and not isinstance(handler, logging.FileHandler):
+			lines = _console_filter.summary_lines()
+			if lines:
+				handler.stream.write("--- Repeated Log Messages ---\n" + "\n".join(lines) + "\n")
+				handler.flush()
+		handler.close()
+	logger = get_logger()
+	for handler in list(logger.handlers):
+		logger.removeHandler(handler)
+	logger.propagate = True
+	_listener = None
+	_console_filter = None
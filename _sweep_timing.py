@@ -0,0 +1,108 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import contextlib
+import json
+import os
+import time
+
+import numpy as np
+
+# サマリーに表示するパーセンタイル
+SUMMARY_PERCENTILES = (50, 90, 99)
+
+
+class SweepTimer(object):
+	"""
+	スイープの各メンバー (シミュレーション) のフェーズごとの所要時間を記録します。
+	jsonl_pathを指定した場合は、各スパンを終了時にJSON Lines形式で追記します。
+	hooksには on_span_start(member, phase) と on_span_end(member, phase, record) を持つ
+	オブジェクト (_memory_monitor.MemoryMonitor など) を渡せます。
+	"""
+
+	def __init__(self, jsonl_path=None, hooks=None):
+		self.jsonl_path = jsonl_path
+		self.hooks = list(hooks or [])
+		self.records = []
+		self._sweep_start = time.perf_counter()
+		if jsonl_path:
+			jsonl_dir = os.path.dirname(jsonl_path)
+			if jsonl_dir and not os.path.exists(jsonl_dir):
+				os.makedirs(jsonl_dir)
+
+	@contextlib.contextmanager
+	def span(self, member, phase):
+		"""
+		with文の本体の所要時間を (member, phase) のスパンとして記録します。
+		本体で例外が発生した場合も ok=False として記録し、例外はそのまま送出します。
+		"""
+		for hook in self.hooks:
+			hook.on_span_start(member, phase)
+		start = time.perf_counter()
+		record = {
+			'member': member,
+			'phase': phase,
+			'start_s': start - self._sweep_start,
+			'ok': True,
+		}
+		try:
+			yield record
+		except BaseException:
+			record['ok'] = False
+			raise
+		finally:
+			record['duration_s'] = time.perf_counter() - start
+			self._add(record)
+			for hook in self.hooks:
+				hook.on_span_end(member, phase, record)
+
+	def _add(self, record):
+		self.records.append(record)
+		if self.jsonl_path:
+			with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+				f.write(json.dumps(record) + "\n")
+
+	def summary_rows(self):
+		"""
+		フェーズごとの回数、合計時間、スイープ全体に対する割合、パーセンタイル、最大値を返します。
+		フェーズは最初に記録された順に並びます。
+		"""
+		wall_time = time.perf_counter() - self._sweep_start
+		phases = []
+		durations = {}
+		for record in self.records:
+			if record['phase'] not in durations:
+				phases.append(record['phase'])
+				durations[record['phase']] = []
+			durations[record['phase']].append(record['duration_s'])
+
+		rows = []
+		for phase in phases:
+			values = np.asarray(durations[phase])
+			row = {
+				'phase': phase,
+				'count': len(values),
+				'total_s': float(values.sum()),
+				'share': float(values.sum() / wall_time) if wall_time > 0 else 0.0,
+				'max_s': float(values.max()),
+			}
+			for q in SUMMARY_PERCENTILES:
+				row[f"p{q}_s"] = float(np.percentile(values, q))
+			rows.append(row)
+		return rows
+
+	def format_summary(self):
+		"""
+		summary_rows() を表形式の文字列に整形します。
+		"""
+		header = f"{'phase':<16}{'count':>7}{'total[s]':>12}{'share':>8}"
+		for q in SUMMARY_PERCENTILES:
+			header += f"{f'p{q}[s]':>10}"
+		header += f"{'max[s]':>10}"
+		lines = [header, "-" * len(header)]
+		for row in self.summary_rows():
+			line = f"{row['phase']:<16}{row['count']:>7}{row['total_s']:>12.1f}{row['share']:>8.1%}"
+			for q in SUMMARY_PERCENTILES:
+				line += f"{row[f'p{q}_s']:>10.2f}"
+			line += f"{row['max_s']:>10.2f}"
+			lines.append(line)
+		return "\n".join(lines)
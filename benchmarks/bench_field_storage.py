@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+FieldStore の保存形式 (storage) と sparse のすべての組み合わせについて、合成した電界とSARを書き込んで読み戻し、
+容量、書き込み・読み込み時間、誤差を計測するベンチマークです。Sim4Life (fake_s4l を含む) は不要です。
+
+使い方:
+	python benchmarks/bench_field_storage.py
+	python benchmarks/bench_field_storage.py --shape 120 80 200 --output storage.json
+
+読み戻した値が read()、read_rows()、read_voxels() のいずれかで元の値と一致しない場合 (誤差がメタデータに記録した
+誤差や保存形式の誤差の上限を超える場合、人体の外のボクセルが0でない場合、書き込みに失敗した場合) は終了コード1で終了します。
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _ROOT)
+
+from s4l_sweep import fields
+
+DEFAULT_SHAPE = (40, 30, 20)
+# 保存形式ごとの、ピーク (int16 と half はブロックの最大値) に対する要素ごとの誤差の上限
+_RELATIVE_BOUNDS = {'native': 0.0, 'single': 1e-7, 'half': 5e-4, 'int16': 1.0 / 65534}
+
+
+def synthetic_fields(shape, seed=0):
+	"""
+	楕円体の人体の内側だけで正の値を持つSARと、複素電界 (形状 shape + (3,)) を返します。
+	SARは 1 V/m の平面波で典型的な 1e-6〜1e-4 W/kg の大きさにします (float16 の正規化数の範囲より小さい値を含む)。
+	"""
+	rng = np.random.default_rng(seed)
+	grid = np.meshgrid(*(np.linspace(-1.0, 1.0, n) for n in shape), indexing='ij')
+	body = sum(axis ** 2 for axis in grid) < 0.8
+	e_field = rng.standard_normal(shape + (3,)) + 1j * rng.standard_normal(shape + (3,))
+	sar = np.where(body, 1e-6 + 1e-4 * rng.random(shape) ** 4, 0.0)
+	return {'e_field': e_field, 'sar': sar}, tuple(np.linspace(0.0, 0.01 * n, n + 1) for n in shape), body
+
+
+def _element_bound(storage, values):
+	"""
+	保存形式の要素ごとの誤差の上限を返します。half と int16 はブロック (QUANT_BLOCK_VOXELS 個の保存行) の最大値に対する上限です。
+	"""
+	if storage in ('native', 'single'):
+		return _RELATIVE_BOUNDS[storage] * np.abs(values.reshape(len(values), -1)) + 1e-30
+	# half と int16 は実部と虚部を別々に保存するため、大きい方を要素の大きさとする
+	rows = np.maximum(np.abs(values.real), np.abs(values.imag)).reshape(len(values), -1)
+	starts = np.arange(0, len(rows), fields.QUANT_BLOCK_VOXELS)
+	peaks = np.maximum.reduceat(rows.max(axis=1), starts)
+	block_peak = np.repeat(peaks, fields.QUANT_BLOCK_VOXELS)[:len(rows), np.newaxis]
+	if storage == 'int16':
+		return block_peak * _RELATIVE_BOUNDS['int16'] * 1.01 + 1e-30
+	# half: 正規化数は相対誤差、非正規化数はブロックの最大値に対する絶対誤差
+	return np.maximum(_RELATIVE_BOUNDS['half'] * rows, 3e-8 * block_peak) * 1.01 + 1e-30
+
+
+def check_round_trip(store, direction, arrays, body, storage, sparse):
+	"""
+	保存した配列を read()、read_rows()、read_voxels() で読み戻し、問題の説明のリストを返します。
+	"""
+	problems = []
+	label = f"{storage}/{'sparse' if sparse else 'dense'}"
+	for name, original in arrays.items():
+		info = store.array_info(direction, name)
+		dense = np.asarray(store.read(direction, name))
+		expected = np.where(body.reshape(body.shape + (1,) * (original.ndim - 3)), original, 0.0) if sparse else original
+		if dense.shape != original.shape:
+			problems.append(f"{label} {name}: read() shape {dense.shape} != {original.shape}")
+			continue
+		error = np.abs(dense - expected)
+		if float(error.max()) > info['max_abs_error'] * (1.0 + 1e-6) + 1e-30:
+			problems.append(f"{label} {name}: read() error {error.max():.3g} exceeds recorded {info['max_abs_error']:.3g}")
+		if sparse and np.any(dense[~body] != 0.0):
+			problems.append(f"{label} {name}: non-zero values outside the body")
+
+		n_voxels = int(np.prod(original.shape[:3]))
+		start, stop = n_voxels // 3, n_voxels // 3 + 1000
+		rows = store.read_rows(direction, name, start, stop)
+		if not np.array_equal(rows, dense.reshape((n_voxels,) + original.shape[3:])[start:stop]):
+			problems.append(f"{label} {name}: read_rows() differs from read()")
+
+		flat_indices, values = store.read_voxels(direction, name)
+		stored = fields.gather(expected, flat_indices)
+		bound = _element_bound(storage, stored)
+		difference = values - stored
+		# half と int16 は実部と虚部を別々に保存するため、それぞれの誤差を比べる
+		element_error = np.maximum(np.abs(difference.real), np.abs(difference.imag)).reshape(len(stored), -1)
+		if storage in ('native', 'single'):
+			element_error = np.abs(difference).reshape(len(stored), -1)
+		if np.any(element_error > bound):
+			problems.append(f"{label} {name}: {int(np.count_nonzero(element_error > bound))} elements exceed the "
+				f"{storage} error bound")
+	return problems
+
+
+def measure(shape, storage, sparse, seed=0):
+	"""
+	1つの組み合わせについて書き込み・読み込みを計測し、結果の辞書と問題のリストを返します。
+	"""
+	arrays, axes, body = synthetic_fields(shape, seed)
+	directory = tempfile.mkdtemp(prefix='bench_field_storage_')
+	try:
+		store = fields.FieldStore(directory)
+		start = time.perf_counter()
+		try:
+			store.write('Phi_000_VPol', arrays, axes, storage=storage, sparse=sparse)
+		except Exception as e:
+			return None, [f"{storage}/{'sparse' if sparse else 'dense'}: write failed ({type(e).__name__}: {e})"]
+		write_s = time.perf_counter() - start
+		start = time.perf_counter()
+		for name in arrays:
+			np.asarray(store.read('Phi_000_VPol', name))
+		read_s = time.perf_counter() - start
+		size = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory))
+		problems = check_round_trip(fields.FieldStore(directory), 'Phi_000_VPol', arrays, body, storage, sparse)
+		info = store.array_info('Phi_000_VPol', 'sar')
+		return {
+			'storage': storage,
+			'sparse': sparse,
+			'bytes': size,
+			'write_ms': write_s * 1e3,
+			'read_ms': read_s * 1e3,
+			'sar_max_rel_error': info['max_rel_error'],
+			'e_max_rel_error': store.array_info('Phi_000_VPol', 'e_field')['max_rel_error'],
+		}, problems
+	finally:
+		shutil.rmtree(directory, ignore_errors=True)
+
+
+def format_rows(rows):
+	"""
+	ベンチマーク結果を表形式の文字列に整形します。
+	"""
+	header = f"{'storage':<8}{'sparse':>8}{'size[MB]':>10}{'write[ms]':>11}{'read[ms]':>10}{'SAR rel err':>13}{'E rel err':>11}"
+	lines = [header, "-" * len(header)]
+	for row in rows:
+		lines.append(f"{row['storage']:<8}{str(row['sparse']):>8}{row['bytes'] / 1024.0 ** 2:>10.2f}"
+			f"{row['write_ms']:>11.1f}{row['read_ms']:>10.1f}{row['sar_max_rel_error']:>13.2e}{row['e_max_rel_error']:>11.2e}")
+	return "\n".join(lines)
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Round-trip and benchmark the field storage modes.")
+	parser.add_argument('--shape', nargs=3, type=int, default=list(DEFAULT_SHAPE))
+	parser.add_argument('--output', help="write the results to this JSON file")
+	args = parser.parse_args(argv)
+
+	rows = []
+	problems = []
+	for storage in fields.STORAGE_MODES:
+		for sparse in (False, True):
+			row, row_problems = measure(tuple(args.shape), storage, sparse)
+			if row is not None:
+				rows.append(row)
+			problems.extend(row_problems)
+	print(format_rows(rows))
+
+	if args.output:
+		with open(args.output, 'w', encoding='utf-8') as f:
+			json.dump(rows, f, indent=2)
+		print(f"INFO: Results written to '{args.output}'.")
+	for problem in problems:
+		print(f"ERROR: {problem}")
+	return 1 if problems else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
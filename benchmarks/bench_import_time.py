@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+s4l_sweep パッケージとスクリプトのインポート時間と、インポート時に読み込まれる s4l_v1 のモジュールを計測するベンチマークです。
+各モジュールを新しいPythonプロセスで fake_s4l のスタンドインを使ってインポートします。
+
+使い方:
+	python benchmarks/bench_import_time.py
+	python benchmarks/bench_import_time.py --repeat 10 --output imports.json
+	python benchmarks/bench_import_time.py --baseline imports.json --tolerance 0.5
+
+s4l_v1 はすべて関数の中でインポートする方針のため、いずれかのモジュールのインポートで
+s4l_v1 のモジュールが読み込まれた場合は終了コード1で終了します。
+--baseline を指定した場合は、インポート時間が基準値より tolerance を超えて増加した場合も終了コード1で終了します。
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 計測するモジュール (後処理のワーカーが使う output と analysis を先頭に置く)
+DEFAULT_MODULES = (
+	's4l_sweep',
+	's4l_sweep.output',
+	's4l_sweep.analysis',
+	's4l_sweep.model',
+	's4l_sweep.materials',
+	's4l_sweep.sweep',
+	'Taro_emfdtd_plane_wave',
+)
+
+# 子プロセスで実行するコード。インポート時間 [s] と読み込まれた s4l_v1 のモジュールをJSONで出力する
+_PROBE = """
+import importlib, json, sys, time
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+elapsed = time.perf_counter() - start
+loaded = sorted(name for name in sys.modules if name == 's4l_v1' or name.startswith('s4l_v1.'))
+print(json.dumps({'seconds': elapsed, 's4l_v1_modules': loaded}))
+"""
+
+
+def measure_import(module_name, repeat=5):
+	"""
+	module_name を新しいプロセスで repeat 回インポートし、インポート時間の中央値と
+	読み込まれた s4l_v1 のモジュールを返します。
+
+	Returns:
+		dict: 'module', 'median_ms', 'min_ms', 's4l_v1_modules' を持つ辞書。
+	"""
+	env = dict(os.environ)
+	env['PYTHONPATH'] = os.pathsep.join([os.path.join(_ROOT, 'fake_s4l'), _ROOT] +
+		([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+	env['PYTHONDONTWRITEBYTECODE'] = '1'
+	seconds = []
+	loaded = []
+	for _ in range(repeat):
+		completed = subprocess.run([sys.executable, '-c', _PROBE, module_name], cwd=_ROOT, env=env,
+			stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+		result = json.loads(completed.stdout.strip().splitlines()[-1])
+		seconds.append(result['seconds'])
+		loaded = result['s4l_v1_modules']
+	return {
+		'module': module_name,
+		'median_ms': float(np.median(seconds)) * 1e3,
+		'min_ms': float(np.min(seconds)) * 1e3,
+		's4l_v1_modules': loaded,
+	}
+
+
+def format_rows(rows):
+	"""
+	ベンチマーク結果を表形式の文字列に整形します。
+	"""
+	header = f"{'module':<28}{'median[ms]':>12}{'min[ms]':>10}  s4l_v1 modules"
+	lines = [header, "-" * len(header)]
+	for row in rows:
+		loaded = ", ".join(row['s4l_v1_modules']) if row['s4l_v1_modules'] else "-"
+		lines.append(f"{row['module']:<28}{row['median_ms']:>12.1f}{row['min_ms']:>10.1f}  {loaded}")
+	return "\n".join(lines)
+
+
+def check_rows(rows, baseline_rows=None, tolerance=0.5):
+	"""
+	s4l_v1 を読み込んだモジュールと、インポート時間が基準値の (1 + tolerance) 倍を超えたモジュールの説明のリストを返します。
+	"""
+	baseline = {row['module']: row for row in baseline_rows or []}
+	problems = []
+	for row in rows:
+		if row['s4l_v1_modules']:
+			problems.append(f"{row['module']}: importing loads {', '.join(row['s4l_v1_modules'])}")
+		reference = baseline.get(row['module'])
+		if reference is not None and row['median_ms'] > reference['median_ms'] * (1.0 + tolerance):
+			problems.append(f"{row['module']}: {row['median_ms']:.1f} ms exceeds baseline "
+				f"{reference['median_ms']:.1f} ms by more than {tolerance:.0%}")
+	return problems
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Benchmark the import time of the sweep library.")
+	parser.add_argument('--modules', nargs='+', default=list(DEFAULT_MODULES))
+	parser.add_argument('--repeat', type=int, default=5)
+	parser.add_argument('--output', help="write the results to this JSON file")
+	parser.add_argument('--baseline', help="compare against a JSON file written with --output")
+	parser.add_argument('--tolerance', type=float, default=0.5)
+	args = parser.parse_args(argv)
+
+	rows = [measure_import(module_name, args.repeat) for module_name in args.modules]
+	print(format_rows(rows))
+
+	if args.output:
+		with open(args.output, 'w', encoding='utf-8') as f:
+			json.dump(rows, f, indent=2)
+		print(f"INFO: Results written to '{args.output}'.")
+
+	baseline_rows = None
+	if args.baseline:
+		with open(args.baseline, 'r', encoding='utf-8') as f:
+			baseline_rows = json.load(f)
+	problems = check_rows(rows, baseline_rows, args.tolerance)
+	for problem in problems:
+		print(f"ERROR: {problem}")
+	return 1 if problems else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+スイープのオーケストレーション (作成・グリッド・ボクセル・実行・解析の流れ) のオーバーヘッドを、
+fake_s4l のスタンドインを使ってSim4Lifeなしで計測するベンチマークです。
+
+使い方:
+	python benchmarks/bench_orchestration.py
+	python benchmarks/bench_orchestration.py --sizes 24 144 --run-latency 0.01 --concurrency 4
+	python benchmarks/bench_orchestration.py --output bench.json
+	python benchmarks/bench_orchestration.py --baseline bench.json --tolerance 0.25
+
+--baseline を指定した場合は、1本当たりのオーバーヘッドが基準値より tolerance を超えて
+増加したサイズがあると終了コード1で終了します (CIでの回帰検出用)。
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _ROOT)
+sys.path.insert(0, os.path.join(_ROOT, 'fake_s4l'))
+
+import s4l_v1._fake as fake
+import s4l_v1.model as model
+
+import _memory_monitor as memory_monitor
+import _sweep_logging as sweep_logging
+import _sweep_timing as sweep_timing
+from s4l_sweep import model as sweep_model
+from s4l_sweep import sweep
+
+# 既定のスイープサイズ (30度刻みの両偏波、5度刻みの両偏波、大規模スイープ)
+DEFAULT_SIZES = (24, 144, 1000)
+
+
+def make_configs(n_configs):
+	"""
+	n_configs 本の (名前サフィックス, Theta, Phi, Psi) のリストを作ります。
+	半分をVPol、残りをHPolとし、Phiを360度に等間隔で割り振ります。
+	"""
+	configs = []
+	polarizations = (("VPol", 90.0), ("HPol", 0.0))
+	per_polarization = [n_configs - n_configs // 2, n_configs // 2]
+	for (pol_name, psi), count in zip(polarizations, per_polarization):
+		for index in range(count):
+			phi = 360.0 * index / count
+			configs.append((f"Phi_{phi:07.3f}_{pol_name}", 90.0, phi, psi))
+	return configs
+
+
+def _injected_latency_s(concurrency):
+	"""
+	1回のスイープで人工的な待ち時間として費やされた時間 [s] を、フェイクの呼び出し回数から求めます。
+	同時実行の場合、RunSimulationの待ち時間はバッチごとに1回と数えます。
+	"""
+	total = 0.0
+	for operation, count in fake.CALL_COUNTS.items():
+		if operation == 'RunSimulation' and concurrency > 1:
+			count = -(-count // concurrency)
+		total += fake.LATENCIES.get(operation, 0.0) * count
+	return total
+
+
+class _SlowConsole(io.StringIO):
+	"""
+	1回の書き込みごとに latency_s 待機する、描画の遅いコンソールの代わりのストリームです。
+	"""
+
+	def __init__(self, latency_s):
+		super(_SlowConsole, self).__init__()
+		self.latency_s = latency_s
+
+	def write(self, text):
+		if self.latency_s > 0.0:
+			time.sleep(self.latency_s)
+		return super(_SlowConsole, self).write(text)
+
+
+def run_sweep_benchmark(n_configs, concurrency=1, grid_mode='automatic', quiet=True, console_latency_s=0.0):
+	"""
+	フェイクのファントムを作成し、n_configs 本のスイープを s4l_sweep.sweep.run_simulation_configs() で実行して計測します。
+
+	Returns:
+		dict: 'configs', 'wall_s', 'overhead_ms_per_config', 'rss_growth_mb', 'results', 'phases' を持つ辞書。
+	"""
+	fake.reset()
+	model._populate_phantom()
+	configs = make_configs(n_configs)
+
+	# 本番と同じく、ログはバックグラウンドでファイルとコンソール (quietの場合は破棄) に書き込む
+	output = _SlowConsole(console_latency_s) if quiet else sys.stdout
+	log_dir = tempfile.mkdtemp(prefix='bench_orchestration_')
+	sweep_logging.configure_logging(os.path.join(log_dir, "sweep_log.jsonl"), stream=output)
+	rss_before = memory_monitor.process_rss_bytes()
+	timer = sweep_timing.SweepTimer()
+	try:
+		with contextlib.redirect_stdout(output):
+			start = time.perf_counter()
+			sweep_model.create_model()
+			results = sweep.run_simulation_configs("Benchmark Model", configs, concurrency, grid_mode=grid_mode,
+				timer=timer)
+			wall_s = time.perf_counter() - start
+	finally:
+		sweep_logging.shutdown_logging(print_summary=not quiet)
+		shutil.rmtree(log_dir, ignore_errors=True)
+	rss_after = memory_monitor.process_rss_bytes()
+
+	overhead_s = max(wall_s - _injected_latency_s(concurrency), 0.0)
+	return {
+		'configs': n_configs,
+		'concurrency': concurrency,
+		'grid_mode': grid_mode,
+		'wall_s': wall_s,
+		'overhead_ms_per_config': overhead_s / n_configs * 1e3,
+		'rss_growth_mb': (rss_after - rss_before) / 1024.0 ** 2 if rss_before is not None else None,
+		'results': len(results),
+		'phases': {row['phase']: row['total_s'] / n_configs * 1e3 for row in timer.summary_rows()},
+	}
+
+
+def format_rows(rows):
+	"""
+	ベンチマーク結果を表形式の文字列に整形します。
+	"""
+	phases = []
+	for row in rows:
+		phases.extend(phase for phase in row['phases'] if phase not in phases)
+	header = f"{'configs':>8}{'wall[s]':>10}{'ovh[ms/cfg]':>13}{'rss[MB]':>9}{'results':>9}"
+	header += "".join(f"{phase[:12] + '[ms]':>18}" for phase in phases)
+	lines = [header, "-" * len(header)]
+	for row in rows:
+		rss = f"{row['rss_growth_mb']:>9.1f}" if row['rss_growth_mb'] is not None else f"{'n/a':>9}"
+		line = f"{row['configs']:>8}{row['wall_s']:>10.2f}{row['overhead_ms_per_config']:>13.2f}{rss}{row['results']:>9}"
+		line += "".join(f"{row['phases'].get(phase, 0.0):>18.2f}" for phase in phases)
+		lines.append(line)
+	return "\n".join(lines)
+
+
+def compare_to_baseline(rows, baseline_rows, tolerance):
+	"""
+	1本当たりのオーバーヘッドが基準値の (1 + tolerance) 倍を超えたサイズの説明のリストを返します。
+	"""
+	baseline = {row['configs']: row for row in baseline_rows}
+	regressions = []
+	for row in rows:
+		reference = baseline.get(row['configs'])
+		if reference is None:
+			continue
+		limit = reference['overhead_ms_per_config'] * (1.0 + tolerance)
+		if row['overhead_ms_per_config'] > limit:
+			regressions.append(f"{row['configs']} configs: {row['overhead_ms_per_config']:.2f} ms/config "
+				f"exceeds baseline {reference['overhead_ms_per_config']:.2f} ms/config by more than {tolerance:.0%}")
+		if row['results'] != row['configs']:
+			regressions.append(f"{row['configs']} configs: only {row['results']} results were analyzed")
+	return regressions
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Benchmark sweep orchestration against the fake s4l_v1.")
+	parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+	parser.add_argument('--concurrency', type=int, default=1)
+	parser.add_argument('--grid-mode', choices=('automatic', 'planned'), default='automatic')
+	parser.add_argument('--run-latency', type=float, default=0.0, help="artificial RunSimulation latency [s]")
+	parser.add_argument('--setup-latency', type=float, default=0.0,
+		help="artificial latency of UpdateGrid and CreateVoxels [s]")
+	parser.add_argument('--console-latency', type=float, default=0.0,
+		help="artificial latency of each console write [s]")
+	parser.add_argument('--output', help="write the results to this JSON file")
+	parser.add_argument('--baseline', help="compare against a JSON file written with --output")
+	parser.add_argument('--tolerance', type=float, default=0.25)
+	parser.add_argument('--verbose', action='store_true', help="show the sweep output")
+	args = parser.parse_args(argv)
+
+	fake.configure(latencies={
+		'RunSimulation': args.run_latency,
+		'UpdateGrid': args.setup_latency,
+		'CreateVoxels': args.setup_latency,
+	})
+
+	rows = []
+	for n_configs in args.sizes:
+		rows.append(run_sweep_benchmark(n_configs, args.concurrency, args.grid_mode, quiet=not args.verbose,
+			console_latency_s=args.console_latency))
+		print(f"INFO: {n_configs} configs done in {rows[-1]['wall_s']:.2f} s.")
+	print(format_rows(rows))
+
+	if args.output:
+		with open(args.output, 'w', encoding='utf-8') as f:
+			json.dump(rows, f, indent=2)
+		print(f"INFO: Results written to '{args.output}'.")
+
+	if args.baseline:
+		with open(args.baseline, 'r', encoding='utf-8') as f:
+			baseline_rows = json.load(f)
+		regressions = compare_to_baseline(rows, baseline_rows, args.tolerance)
+		for regression in regressions:
+			print(f"ERROR: {regression}")
+		if regressions:
+			return 1
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -1,15 +1,10 @@
 from __future__ import absolute_import
 from __future__ import print_function
 import sys, os
-import numpy as np
-import csv
 
 import s4l_v1.document as document
 import s4l_v1.model as model
 import s4l_v1.simulation.emfdtd as fdtd
-import s4l_v1.analysis as analysis
-import s4l_v1.analysis.viewers as viewers
-import s4l_v1.analysis.core as analysis_core
 #import s4l_v1.materials.database as database # <-- 追加: 材料データベースのインポート
 
 import s4l_v1.units as units
@@ -18,6 +13,14 @@ from s4l_v1 import Unit # Unitクラスのインポート (材料データベー
 _CFILE = os.path.abspath(sys.argv[0] if __name__ == '__main__' else __file__ )
 _CDIR = os.path.dirname(_CFILE)
 
+# 同じフォルダにある補助モジュールとs4l_sweepパッケージをインポートできるようにする
+if _CDIR not in sys.path:
+	sys.path.insert(0, _CDIR)
+
+# 解析とCSV出力は s4l_sweep パッケージの処理を使用する
+from s4l_sweep import analysis as sar_analysis
+from s4l_sweep import output
+
 def CreateModel():
 	"""
 	シミュレーションに必要なモデルエンティティを作成します。
@@ -205,157 +208,16 @@ def Analyze_EM_E(sim):
 	"""
 	Analyzes the results of the specified simulation and adds viewers.
 	"""
-	# Get simulation results
-	results = sim.Results()
-
-	print(f"Analyzing results for: {sim.Name}")
-	print(results)
-
-	# overall field sensor
-	overall_field_sensor = results[ 'Overall Field' ]
-
-	# E場のスライスビューアを作成
-	slice_field_viewer_efield = viewers.SliceFieldViewer()
-	# E場成分（中心周波数f0）をビューアに接続
-	slice_field_viewer_efield.Inputs[0].Connect( overall_field_sensor['EM E(x,y,z,f0)'] )
-	# データ表示モードと成分を設定（実部・Component0）
-	slice_field_viewer_efield.Data.Mode = slice_field_viewer_efield.Data.Mode.enum.QuantityRealPart
-	slice_field_viewer_efield.Data.Component = slice_field_viewer_efield.Data.Component.enum.Component0
-	# スライス平面をYZ面に設定
-	slice_field_viewer_efield.Slice.Plane = slice_field_viewer_efield.Slice.Plane.enum.YZ
-	# ビューアを更新し、最大スライス位置へ移動
-	slice_field_viewer_efield.Update(0)
-	slice_field_viewer_efield.GotoMaxSlice()
-	# ビューアをS4Lドキュメントのアルゴリズムとして追加
-	document.AllAlgorithms.Add( slice_field_viewer_efield )
+	# E場 (実部・Component0) のYZ面スライスビューアを、最大値のスライスに移動して追加
+	return sar_analysis.add_e_field_slice_viewer(sim)
 
 # --- ここから、WBSAR解析結果のための関数 ---
 def Analyze_WBSAR(sim):
 	"""
 	指定されたシミュレーションの結果を解析し、
-	「Volume Weighted Average」SAR値を抽出し表示します。
+	「Volume Weighted Average」SAR値を抽出して返します。
 	"""
-	import json # JSONデータを扱うためにjsonモジュールをインポート
-
-	results = sim.Results()
-	print(f"Analysis results for: {sim.Name}")
-	print(results)
-
-	em_sensor_extractor = results[ 'Overall Field' ]
-	em_sensor_extractor.FrequencySettings.ExtractedFrequency = u"All"
-	document.AllAlgorithms.Add( em_sensor_extractor )
-
-	inputs_for_statistics = [em_sensor_extractor.Outputs["SAR(x,y,z,f0)"]]
-	statistics_evaluator = analysis_core.StatisticsEvaluator(inputs=inputs_for_statistics)
-	statistics_evaluator.Mode = u"Value"
-	statistics_evaluator.UpdateAttributes()
-	document.AllAlgorithms.Add( statistics_evaluator )
-	
-	# 統計評価アルゴリズムの計算を強制的に実行
-	# Update() が False を返す場合、計算に失敗したことを示す
-	if not statistics_evaluator.Update(): # Update()の戻り値で計算成功をチェック
-		print(f"DEBUG: StatisticsEvaluator '{statistics_evaluator.Name}' failed to update/compute. Cannot extract SAR statistics.")
-		return # 計算に失敗したため、処理を中断
-
-	# --- ここからが修正箇所：Volume Weighted Average の値を取得 ---
-
-	# 1. StatisticsEvaluatorの「SAR Statistics」出力（AlgorithmOutputオブジェクト）を取得
-	sar_statistics_output_ref = statistics_evaluator.Outputs["SAR Statistics"]
-
-	# 2. AlgorithmOutputオブジェクトの .Data プロパティを使って、JsonDataObjectを取得
-	json_data_object = sar_statistics_output_ref.Data
-
-	# デバッグ: 取得したオブジェクトの型を確認
-	print(f"DEBUG: Type of json_data_object: {type(json_data_object)}")
-	
-	# --- ここから JsonDataObject のプロパティをデバッグ出力 ---
-	print("\n--- DEBUG: Inspecting JsonDataObject Properties ---")
-	
-	# DataJson プロパティの確認
-	if hasattr(json_data_object, 'DataJson'):
-		print(f"DEBUG: json_data_object.DataJson type: {type(json_data_object.DataJson)}")
-		print(f"DEBUG: json_data_object.DataJson content (first 300 chars): {str(json_data_object.DataJson)[:300]}...")
-	else:
-		print("DEBUG: json_data_object has no 'DataJson' attribute.")
-
-	# AttributeJson プロパティの確認
-	if hasattr(json_data_object, 'AttributeJson'):
-		print(f"DEBUG: json_data_object.AttributeJson type: {type(json_data_object.AttributeJson)}")
-		print(f"DEBUG: json_data_object.AttributeJson content (first 300 chars): {str(json_data_object.AttributeJson)[:300]}...")
-	else:
-		print("DEBUG: json_data_object has no 'AttributeJson' attribute.")
-
-	# keys() メソッドの確認 (辞書のように振る舞うか)
-	if hasattr(json_data_object, 'keys') and callable(json_data_object.keys):
-		try:
-			print(f"DEBUG: json_data_object.keys(): {list(json_data_object.keys())}")
-			# もしキーがあれば、最初のキーでアクセスを試みる
-			if list(json_data_object.keys()):
-				first_key = list(json_data_object.keys())[0]
-				print(f"DEBUG: Accessing first key '{first_key}': {json_data_object[first_key]}")
-		except Exception as e:
-			print(f"DEBUG: Error calling json_data_object.keys() or accessing by key: {e}") #これが出力された。よって keys() メソッドは存在するが、辞書のように振る舞わない可能性がある
-	else:
-		print("DEBUG: json_data_object has no 'keys()' method.")
-
-	print("--- DEBUG: End JsonDataObject Inspection ---\n")
-	# --- デバッグ出力ここまで ---
-
-	# --- 新しいデータ抽出ロジック: DataJsonからの直接抽出 ---
-	volume_weighted_average_value = None
-
-	# JsonDataObjectがDataJson属性を持ち、文字列であることを確認
-	if hasattr(json_data_object, 'DataJson') and isinstance(json_data_object.DataJson, str):
-		try:
-			# DataJson文字列をPythonオブジェクト（辞書）にパース
-			parsed_data = json.loads(json_data_object.DataJson)
-			print("DEBUG: Successfully parsed DataJson string.") # これが出力された。よってパースは成功している。
-
-			# デバッグ出力から判明したネストされた構造をたどる
-			# {"simple_data_collection":{"data_collection":{"Average":{"data":[VALUE]...
-			if "simple_data_collection" in parsed_data and \
-			   "data_collection" in parsed_data["simple_data_collection"] and \
-			   "Average" in parsed_data["simple_data_collection"]["data_collection"] and \
-			   "data" in parsed_data["simple_data_collection"]["data_collection"]["Average"] and \
-			   isinstance(parsed_data["simple_data_collection"]["data_collection"]["Average"]["data"], list) and \
-			   len(parsed_data["simple_data_collection"]["data_collection"]["Average"]["data"]) > 0:
-				
-				volume_weighted_average_value = parsed_data["simple_data_collection"]["data_collection"]["Average"]["data"][0]
-				print("DEBUG: Extracted Volume Weighted Average value from nested dictionary.") # これが出力された。よって値の抽出は成功している。
-			else:
-				print("DEBUG: Could not find 'Volume Weighted Average' data in expected nested structure.")
-
-		except json.JSONDecodeError as e:
-			print(f"ERROR: Failed to decode DataJson string: {e}")
-		except Exception as e:
-			print(f"ERROR: An unexpected error occurred during data extraction from parsed DataJson: {e}")
-	else:
-		print("ERROR: JsonDataObject has no 'DataJson' attribute or 'DataJson' is not a string. Cannot extract value.")
-
-	# 最終的な値が取得できたか確認
-	if volume_weighted_average_value is not None:
-		print(f"Volume Weighted Average for simulation '{sim.Name}': {volume_weighted_average_value} W/kg")
-		
-		# これで 'volume_weighted_average_value' 変数に目的の値が格納されました。
-		# この値を後続の処理やファイルへの書き出しなどに使用できます。
-	else:
-		print(f"WARNING: 'Volume Weighted Average' not found in SAR Statistics data for {sim.Name} using direct access methods.")
-
-	# --- ここまでが追加コード ---
-
-	# --- DataTableHTMLViewerの初期化と追加 ---
-	# 新しいDataTableHTMLViewerを追加
-	# ここでは、元のstatistics_evaluatorの出力をそのまま使用します。
-	# HTMLビューアはJsonDataObjectを直接表示できる場合が多いです。
-	inputs_for_html_viewer = [statistics_evaluator.Outputs["SAR Statistics"]] 
-	data_table_html_viewer = viewers.DataTableHTMLViewer(inputs=inputs_for_html_viewer)
-	
-	# 属性を更新
-	data_table_html_viewer.UpdateAttributes()
-	# S4Lドキュメントに追加
-	document.AllAlgorithms.Add(data_table_html_viewer)
-	# 抽出した値を戻り値として追加
-	return volume_weighted_average_value
+	return sar_analysis.analyze_volume_weighted_sar(sim)
 
 # --- ここから、SAR解析結果をCSVファイルに書き込む関数 ---
 def write_sar_results_to_csv(results_list, filename="WBSAR_results.csv"):
@@ -368,21 +230,7 @@ def write_sar_results_to_csv(results_list, filename="WBSAR_results.csv"):
 							 例: [{'SimulationName': '...', 'Direction': '...', 'VWA_SAR': ...}]
 		filename (str): 出力するCSVファイルのパスと名前。
 	"""
-	# ファイルが存在するかどうかを確認し、ヘッダーを書き込む必要があるかを判断
-	file_exists = os.path.exists(filename)
-	
-	# 'a' は追記モード、'w' は上書きモード
-	# newline='' はcsvモジュールで推奨される設定
-	with open(filename, 'a' if file_exists else 'w', newline='', encoding='utf-8') as csvfile:
-		fieldnames = ['SimulationName', 'Direction', 'VWA_SAR'] # CSVの列名
-		writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-		if not file_exists:
-			writer.writeheader() # ファイルが新規作成された場合のみヘッダーを書き込む
-
-		for row in results_list:
-			writer.writerow(row)
-	print(f"\nResults successfully written to '{filename}'.")
+	output.write_sar_results_to_csv(results_list, filename, fieldnames=['SimulationName', 'Direction', 'VWA_SAR'])
 
 # --- ここから、RunSingleSimulation関数 ---
 def RunSingleSimulation():
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+Sim4Lifeのs4l_v1のスタンドイン。
+
+スイープのオーケストレーション (シミュレーションの作成・実行・解析の流れ) を
+Sim4Lifeのライセンスなしで実行・計測するためのもので、物理計算は行いません。
+"""
+from __future__ import absolute_import
+
+from s4l_v1.model import Rotation, Transform, Translation, Vec3
+
+
+class Unit(object):
+	def __init__(self, text):
+		self.text = text
+
+	def __repr__(self):
+		return f"Unit({self.text!r})"
+
+
+class ReleaseVersion(object):
+	version7_2 = '7.2'
+	_active = None
+
+	@classmethod
+	def set_active(cls, version):
+		cls._active = version
+
+	@classmethod
+	def reset(cls):
+		cls._active = None
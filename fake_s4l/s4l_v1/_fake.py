@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Sim4Lifeのs4l_v1を置き換える、ライセンス不要の軽量スタンドインの共通部分。
+
+処理ごとの人工的な待ち時間と合成結果の設定、列挙型、名前付きコレクションを提供します。
+sys.pathの先頭に fake_s4l フォルダを追加すると、本物の s4l_v1 の代わりにインポートされます。
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+import math
+import time
+
+import numpy as np
+
+# 処理ごとの人工的な待ち時間 [s]
+LATENCIES = {
+	'CreateSimulation': 0.0,
+	'UpdateAllMaterials': 0.0,
+	'UpdateGrid': 0.0,
+	'CreateVoxels': 0.0,
+	'RunSimulation': 0.0,
+	'ExtractorUpdate': 0.0,
+	'EvaluatorUpdate': 0.0,
+	'OpenDocument': 0.0,
+	'SaveDocument': 0.0,
+	'ApplyTransform': 0.0,
+}
+# 合成結果のフィールドの格子点数 (x, y, z)
+FIELD_SHAPE = (16, 12, 24)
+# RunSimulation() が書き出す生の出力ファイル (_Output.h5) の大きさ [bytes]
+OUTPUT_BYTES = 64 * 1024
+# 設定時に例外となるカーネル (ライセンスのないカーネルの模擬)
+UNAVAILABLE_KERNELS = set()
+# 人工的な待ち時間の記録 (処理名 -> 呼び出し回数)
+CALL_COUNTS = {}
+
+
+def configure(latencies=None, field_shape=None, unavailable_kernels=None):
+	"""
+	待ち時間、合成フィールドの形状、利用できないカーネルを設定します。
+	"""
+	global FIELD_SHAPE, UNAVAILABLE_KERNELS
+	if latencies:
+		LATENCIES.update(latencies)
+	if field_shape is not None:
+		FIELD_SHAPE = tuple(field_shape)
+	if unavailable_kernels is not None:
+		UNAVAILABLE_KERNELS = set(unavailable_kernels)
+
+
+def reset():
+	"""
+	ドキュメントとモデルを空にし、呼び出し回数を消去します。
+	"""
+	from s4l_v1 import document, model
+	document._reset()
+	model._reset()
+	CALL_COUNTS.clear()
+
+
+def delay(operation):
+	"""
+	operationに設定された待ち時間だけ待機し、呼び出し回数を数えます。
+	"""
+	CALL_COUNTS[operation] = CALL_COUNTS.get(operation, 0) + 1
+	seconds = LATENCIES.get(operation, 0.0)
+	if seconds > 0.0:
+		time.sleep(seconds)
+
+
+def synthetic_wbsar(theta_deg, phi_deg, psi_deg):
+	"""
+	入射方向と偏波に対して滑らかに変化する合成WBSAR [W/kg] を返します。
+	"""
+	theta = math.radians(theta_deg)
+	phi = math.radians(phi_deg)
+	psi = math.radians(psi_deg)
+	return 0.08 * (1.0 + 0.3 * math.sin(theta) * math.cos(phi - 0.4) + 0.15 * math.cos(2.0 * phi)
+		+ 0.2 * math.sin(psi) ** 2)
+
+
+def synthetic_e_field(theta_deg, phi_deg, psi_deg, shape=None):
+	"""
+	平面波の方向と偏波に応じた合成の複素電界 (セル数, 3) を返します。
+	"""
+	shape = shape or FIELD_SHAPE
+	theta = math.radians(theta_deg)
+	phi = math.radians(phi_deg)
+	psi = math.radians(psi_deg)
+	k = -np.array([math.sin(theta) * math.cos(phi), math.sin(theta) * math.sin(phi), math.cos(theta)])
+	e_theta = np.array([math.cos(theta) * math.cos(phi), math.cos(theta) * math.sin(phi), -math.sin(theta)])
+	e_phi = np.array([-math.sin(phi), math.cos(phi), 0.0])
+	polarization = math.cos(psi) * e_phi + math.sin(psi) * e_theta
+
+	axes = [np.linspace(0.0, 1.0, n) for n in shape]
+	x, y, z = np.meshgrid(*axes, indexing='ij')
+	points = np.stack([x.ravel(order='F'), y.ravel(order='F'), z.ravel(order='F')], axis=-1)
+	phase = np.exp(-2j * math.pi * points.dot(k) * 3.0)
+	decay = np.exp(-((points - 0.5) ** 2).sum(axis=1))
+	return (decay * phase)[:, np.newaxis] * polarization[np.newaxis, :]
+
+
+def synthetic_body_mask(shape=None):
+	"""
+	計算領域の中央の楕円体を人体とみなした、セルごとの人体のマスク (形状 shape の bool配列) を返します。
+	"""
+	shape = shape or FIELD_SHAPE
+	axes = [(np.arange(n) + 0.5) / n for n in shape]
+	x, y, z = np.meshgrid(*axes, indexing='ij')
+	return ((x - 0.5) / 0.3) ** 2 + ((y - 0.5) / 0.25) ** 2 + ((z - 0.5) / 0.45) ** 2 <= 1.0
+
+
+def synthetic_sar(theta_deg, phi_deg, psi_deg, shape=None):
+	"""
+	synthetic_e_field() の電界から σ|E|²/(2ρ) として求めた合成SAR (セル数, 1) を返します。人体の外は0です。
+	"""
+	shape = shape or FIELD_SHAPE
+	e_field = synthetic_e_field(theta_deg, phi_deg, psi_deg, shape)
+	body = synthetic_body_mask(shape).ravel(order='F')
+	return (0.4 * body * (np.abs(e_field) ** 2).sum(axis=1))[:, np.newaxis]
+
+
+class EnumValue(object):
+	"""
+	Sim4Lifeの列挙型プロパティの値。.enumから同じ列挙型の他の値を参照できます。
+	"""
+
+	def __init__(self, name, enum):
+		self.name = name
+		self.enum = enum
+
+	def __eq__(self, other):
+		return isinstance(other, EnumValue) and other.name == self.name
+
+	def __hash__(self):
+		return hash(self.name)
+
+	def __repr__(self):
+		return f"<{self.name}>"
+
+
+class Enum(object):
+	"""
+	名前の並びから列挙型を作り、最初の値を返します。
+	"""
+
+	def __init__(self, *names):
+		for name in names:
+			setattr(self, name, EnumValue(name, self))
+
+	@staticmethod
+	def first(*names):
+		enum = Enum(*names)
+		return getattr(enum, names[0])
+
+
+class NamedCollection(object):
+	"""
+	Nameを持つオブジェクトのコレクション。名前またはオブジェクトでの in と、名前での [] に対応します。
+	"""
+
+	def __init__(self):
+		self._items = []
+
+	def Add(self, item):
+		self._items.append(item)
+
+	def Remove(self, item):
+		self._items.remove(item)
+
+	def Clear(self):
+		del self._items[:]
+
+	def _find(self, name):
+		for item in self._items:
+			if item.Name == name:
+				return item
+		return None
+
+	def __contains__(self, key):
+		if isinstance(key, str):
+			return self._find(key) is not None
+		return any(item is key for item in self._items)
+
+	def __getitem__(self, key):
+		if isinstance(key, int):
+			return self._items[key]
+		item = self._find(key)
+		if item is None:
+			raise KeyError(key)
+		return item
+
+	def __iter__(self):
+		return iter(list(self._items))
+
+	def __len__(self):
+		return len(self._items)
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""
+s4l_v1.analysis のスタンドイン。
+"""
+from __future__ import absolute_import
+
+from s4l_v1.analysis import core
+from s4l_v1.analysis import em_evaluators
+from s4l_v1.analysis import viewers
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+s4l_v1.analysis.core のスタンドイン。
+"""
+from __future__ import absolute_import
+import json
+
+from s4l_v1 import _fake
+
+
+class Algorithm(object):
+	def __init__(self, inputs=None):
+		self.Name = type(self).__name__
+		self.inputs = list(inputs or [])
+		self.Outputs = {}
+
+	def UpdateAttributes(self):
+		pass
+
+	def Update(self):
+		_fake.delay('EvaluatorUpdate')
+		return True
+
+
+class _JsonDataObject(object):
+	def __init__(self, data):
+		self.DataJson = json.dumps(data)
+
+
+class _JsonOutput(object):
+	def __init__(self):
+		self.Data = None
+
+
+class StatisticsEvaluator(Algorithm):
+	"""
+	入力のSAR分布を計算したシミュレーションの入射方向と偏波から、合成のSAR統計を作ります。
+	DataJson の simple_data_collection/data_collection/Average/data[0] がVolume Weighted Averageです。
+	"""
+
+	def __init__(self, inputs=None):
+		super(StatisticsEvaluator, self).__init__(inputs)
+		self.Mode = u"Value"
+		self.Outputs = {"SAR Statistics": _JsonOutput()}
+
+	def Update(self):
+		super(StatisticsEvaluator, self).Update()
+		wbsar = _fake.synthetic_wbsar(*self.inputs[0].Data.source)
+		self.Outputs["SAR Statistics"].Data = _JsonDataObject({
+			'simple_data_collection': {'data_collection': {'Average': {'data': [wbsar]}}},
+		})
+		return True
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+s4l_v1.analysis.em_evaluators のスタンドイン。
+"""
+from __future__ import absolute_import
+
+from s4l_v1 import _fake
+from s4l_v1.analysis.core import Algorithm
+
+
+class _TableData(object):
+	def __init__(self, rows):
+		self._rows = rows
+
+	def ToList(self):
+		return [list(row) for row in self._rows]
+
+
+class _TableOutput(object):
+	def __init__(self):
+		self.Data = None
+
+
+class SarStatisticsEvaluator(Algorithm):
+	"""
+	入力の電界を計算したシミュレーションの入射方向と偏波から、合成のSAR統計表を作ります。
+	表の最後の行が 'All Regions' で、列2がMass-Averaged SARです。
+	"""
+
+	def __init__(self, inputs=None):
+		super(SarStatisticsEvaluator, self).__init__(inputs)
+		self.PeakSpatialAverageSAR = False
+		self.Outputs = {"SAR Statistics": _TableOutput()}
+
+	def Update(self):
+		super(SarStatisticsEvaluator, self).Update()
+		angles = self.inputs[0].Data.source
+		wbsar = _fake.synthetic_wbsar(*angles)
+		rows = [
+			["Fat", 12.0, 0.6 * wbsar, 1.5 * wbsar],
+			["Skin", 4.0, 1.4 * wbsar, 3.0 * wbsar],
+			["Muscle", 30.0, 1.05 * wbsar, 2.4 * wbsar],
+			["All Regions", 46.0, wbsar, 3.0 * wbsar],
+		]
+		self.Outputs["SAR Statistics"].Data = _TableData(rows)
+		return True
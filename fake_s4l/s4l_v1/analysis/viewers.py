@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""
+s4l_v1.analysis.viewers のスタンドイン。
+"""
+from __future__ import absolute_import
+
+from s4l_v1.analysis.core import Algorithm
+
+
+class DataTableHTMLViewer(Algorithm):
+	pass
+
+
+class SliceFieldViewer(Algorithm):
+	pass
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+s4l_v1.document のスタンドイン。
+"""
+from __future__ import absolute_import
+
+from s4l_v1 import _fake
+from s4l_v1._fake import NamedCollection
+
+AllSimulations = NamedCollection()
+AllAlgorithms = NamedCollection()
+FileName = ""
+# 保存したプロジェクトのパス -> (エンティティのリスト, シミュレーションのリスト)
+_SAVED = {}
+
+
+def _reset():
+	AllSimulations.Clear()
+	AllAlgorithms.Clear()
+
+
+def New():
+	global FileName
+	from s4l_v1 import model
+	_reset()
+	model._reset()
+	FileName = ""
+
+
+def Open(filename):
+	"""
+	SaveAs() で保存したプロジェクトの場合はそのエンティティとシミュレーションを復元し、
+	それ以外の場合はドキュメントとモデルを空にしてファントムを作成します。
+	"""
+	global FileName
+	from s4l_v1 import model
+	_fake.delay('OpenDocument')
+	New()
+	if filename in _SAVED:
+		entities, simulations = _SAVED[filename]
+		for entity in entities:
+			model.AllEntities().Add(entity)
+		for sim in simulations:
+			AllSimulations.Add(sim)
+	else:
+		model._populate_phantom()
+	FileName = filename
+
+
+def SaveAs(filename):
+	"""
+	エンティティとシミュレーションを記録し、シミュレーション名を書いた小さなファイルを作成します。
+	待ち時間はシミュレーション数に比例します (プロジェクトが大きいほど保存が遅いことの模擬)。
+	"""
+	global FileName
+	import os
+	from s4l_v1 import model
+	for _ in range(1 + len(AllSimulations)):
+		_fake.delay('SaveDocument')
+	_SAVED[filename] = (list(model.AllEntities()), list(AllSimulations))
+	directory = os.path.dirname(filename)
+	if directory and not os.path.exists(directory):
+		os.makedirs(directory)
+	with open(filename, 'w', encoding='utf-8') as f:
+		f.write("\n".join(sim.Name for sim in AllSimulations))
+	FileName = filename
+
+
+def Save():
+	SaveAs(FileName)
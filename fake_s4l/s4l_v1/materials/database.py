@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+s4l_v1.materials.database のスタンドイン。
+
+本物と同じく database["IT'IS 4.1"]["Fat"] の形で参照できるよう、
+このモジュールはインポート時に辞書形式のデータベースオブジェクトに置き換わります。
+値は1 GHzでの特性です。
+"""
+from __future__ import absolute_import
+import sys
+
+
+class _Material(object):
+	def __init__(self, name, mass_density, conductivity, relative_permittivity):
+		self.Name = name
+		self.MassDensity = mass_density
+		self.Conductivity = conductivity
+		self.RelativePermittivity = relative_permittivity
+
+
+_ITIS_4_1 = {
+	'Fat': _Material('Fat', 911.0, 0.11638198214029223, 11.29425354244377),
+	'Skin': _Material('Skin', 1109.0, 0.8997924135002646, 40.936135452253346),
+	'Muscle': _Material('Muscle', 1090.4, 0.9782042083052804, 54.81107626413944),
+}
+
+
+class _Database(object):
+	def __init__(self):
+		self._libraries = {"IT'IS 4.1": _ITIS_4_1}
+
+	def __getitem__(self, name):
+		return self._libraries[name]
+
+	def __contains__(self, name):
+		return name in self._libraries
+
+
+sys.modules[__name__] = _Database()
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+s4l_v1.model のスタンドイン。エンティティは名前と軸平行のバウンディングボックスだけを持ちます。
+"""
+from __future__ import absolute_import
+import math
+
+import numpy as np
+
+from s4l_v1 import _fake
+from s4l_v1._fake import NamedCollection
+
+
+class Vec3(object):
+	def __init__(self, x=0.0, y=0.0, z=0.0):
+		self._values = [float(x), float(y), float(z)]
+
+	def __getitem__(self, index):
+		return self._values[index]
+
+	def __iter__(self):
+		return iter(self._values)
+
+	def __repr__(self):
+		return f"Vec3({self._values[0]}, {self._values[1]}, {self._values[2]})"
+
+
+class Transform(object):
+	"""
+	4x4の同次変換行列を持つ変換。a * b は b を適用してから a を適用する変換です。
+	"""
+
+	def __init__(self, matrix=None):
+		self.matrix = np.identity(4) if matrix is None else np.asarray(matrix, dtype=float)
+
+	def __mul__(self, other):
+		return Transform(self.matrix.dot(other.matrix))
+
+
+def Rotation(axis, angle_rad):
+	"""
+	原点を通る axis 周りに angle_rad [rad] 回転する変換を返します。
+	"""
+	u = np.array(list(axis), dtype=float)
+	u /= np.linalg.norm(u)
+	cross = np.array([[0.0, -u[2], u[1]], [u[2], 0.0, -u[0]], [-u[1], u[0], 0.0]])
+	matrix = np.identity(4)
+	matrix[:3, :3] = np.identity(3) + math.sin(angle_rad) * cross + (1.0 - math.cos(angle_rad)) * cross.dot(cross)
+	return Transform(matrix)
+
+
+def Translation(vector):
+	matrix = np.identity(4)
+	matrix[:3, 3] = list(vector)
+	return Transform(matrix)
+
+
+class Entity(object):
+	def __init__(self, name, p0, p1, kind):
+		self.Name = name
+		self.p0 = Vec3(*p0)
+		self.p1 = Vec3(*p1)
+		self.kind = kind
+
+	def ApplyTransform(self, transform):
+		"""
+		バウンディングボックスの8つの角を変換し、その軸平行のバウンディングボックスに置き換えます。
+		"""
+		_fake.delay('ApplyTransform')
+		corners = np.array([[x, y, z, 1.0] for x in (self.p0[0], self.p1[0]) for y in (self.p0[1], self.p1[1])
+			for z in (self.p0[2], self.p1[2])])
+		moved = corners.dot(transform.matrix.T)[:, :3]
+		self.p0 = Vec3(*moved.min(axis=0))
+		self.p1 = Vec3(*moved.max(axis=0))
+
+	def Delete(self):
+		if self in _ENTITIES:
+			_ENTITIES.Remove(self)
+
+	def __repr__(self):
+		return f"<Entity {self.Name!r}>"
+
+
+_ENTITIES = NamedCollection()
+
+
+def _reset():
+	_ENTITIES.Clear()
+
+
+def AllEntities():
+	return _ENTITIES
+
+
+def _create(name, p0, p1, kind):
+	entity = Entity(name, p0, p1, kind)
+	_ENTITIES.Add(entity)
+	return entity
+
+
+def CreateWireBlock(p0, p1, parametrized=True):
+	return _create("Wire Block", p0, p1, 'wire')
+
+
+def CreateSolidBlock(p0, p1, parametrized=True):
+	return _create("Block", p0, p1, 'solid')
+
+
+def CreatePoint(p):
+	return _create("Point", p, p, 'point')
+
+
+def GetBoundingBox(entities):
+	entities = list(entities)
+	p0 = Vec3(*(min(e.p0[i] for e in entities) for i in range(3)))
+	p1 = Vec3(*(max(e.p1[i] for e in entities) for i in range(3)))
+	return [p0, p1]
+
+
+def Delete(entities):
+	for entity in list(entities):
+		entity.Delete()
+
+
+def _populate_phantom(tissue_ids=range(57), height_mm=1700.0):
+	"""
+	人体モデルの代わりに、'Tissue_N' という名前の直方体を縦に積んだファントムを作成します。
+	"""
+	tissue_ids = list(tissue_ids)
+	slab = height_mm / len(tissue_ids)
+	for index, tissue_id in enumerate(tissue_ids):
+		entity = CreateSolidBlock(p0=(0.0, 0.0, index * slab), p1=(400.0, 250.0, (index + 1) * slab))
+		entity.Name = f"Tissue_{tissue_id}"
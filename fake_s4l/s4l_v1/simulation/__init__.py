@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+"""
+s4l_v1.simulation のスタンドイン。
+"""
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+s4l_v1.simulation.emfdtd のスタンドイン。
+
+設定の保持と処理ごとの人工的な待ち時間だけを模擬し、結果は _fake の合成関数から作ります。
+"""
+from __future__ import absolute_import
+import math
+import os
+import time
+
+import numpy as np
+
+from s4l_v1 import _fake
+
+
+class _Settings(object):
+	def __init__(self, name=""):
+		self.Name = name
+		self.components = []
+
+
+class MaterialSettings(_Settings):
+	class _ElectricProps(object):
+		def __init__(self):
+			self.Conductivity = 0.0
+			self.RelativePermittivity = 1.0
+
+	def __init__(self):
+		super(MaterialSettings, self).__init__("Material")
+		self.MassDensity = 1000.0
+		self.ElectricProps = MaterialSettings._ElectricProps()
+
+
+class PlaneWaveSourceSettings(_Settings):
+	def __init__(self):
+		super(PlaneWaveSourceSettings, self).__init__("Plane Wave Source")
+		self.Theta = 0.0
+		self.Phi = 0.0
+		self.Psi = 0.0
+		self.CenterFrequency = 1000.0, 'MHz'
+
+
+class PointSensorSettings(_Settings):
+	def __init__(self):
+		super(PointSensorSettings, self).__init__("Point Sensor")
+
+
+class FieldSensorSettings(_Settings):
+	pass
+
+
+class AutomaticGridSettings(_Settings):
+	pass
+
+
+class ManualGridSettings(_Settings):
+	def __init__(self):
+		super(ManualGridSettings, self).__init__("Manual Grid")
+		self.MaxStep = (9.0,) * 3
+		self.Resolution = (2.0,) * 3
+
+
+class AutomaticVoxelerSettings(_Settings):
+	pass
+
+
+class _SetupSettings(object):
+	def __init__(self):
+		self.GlobalAutoTermination = _fake.Enum.first('GlobalAutoTerminationStrict', 'GlobalAutoTerminationMedium',
+			'GlobalAutoTerminationWeak', 'GlobalAutoTerminationUserDefined', 'GlobalAutoTerminationNone')
+		self.SimulationTime = 30.0, 'Periods'
+		self.ConvergenceLevel = -30.0
+
+
+class _GlobalBoundarySettings(object):
+	def __init__(self):
+		self.GlobalBoundaryType = _fake.Enum.first('UpmlCpml', 'ABC', 'PEC', 'PMC')
+
+
+class _SolverSettings(object):
+	def __init__(self):
+		object.__setattr__(self, 'Kernel', _fake.Enum.first('Software', 'AXware', 'Cuda'))
+
+	def __setattr__(self, name, value):
+		if name == 'Kernel' and isinstance(value, _fake.EnumValue) and value.name in _fake.UNAVAILABLE_KERNELS:
+			raise RuntimeError(f"No license for kernel '{value.name}'")
+		object.__setattr__(self, name, value)
+
+
+def _magnitude(value):
+	"""
+	数値または (値, 単位) のタプルから数値を取り出します。
+	"""
+	return float(value[0] if isinstance(value, tuple) else value)
+
+
+class Simulation(object):
+	"""
+	シミュレーション。RunSimulation(wait=False) の後は、待ち時間が経過するとHasResults() がTrueになります。
+	"""
+
+	def __init__(self):
+		_fake.delay('CreateSimulation')
+		self.Name = "Simulation"
+		self.SetupSettings = _SetupSettings()
+		self.GlobalBoundarySettings = _GlobalBoundarySettings()
+		self.SolverSettings = _SolverSettings()
+		overall_field = FieldSensorSettings("Overall Field")
+		self.AllSettings = [AutomaticGridSettings("Automatic"), AutomaticVoxelerSettings("Automatic Voxeler Settings"),
+			overall_field]
+		self._finish_time = None
+
+	def Add(self, settings, components=None):
+		if not any(s is settings for s in self.AllSettings):
+			self.AllSettings.append(settings)
+		settings.components.extend(components or [])
+		return settings
+
+	def AddPlaneWaveSourceSettings(self, entity):
+		return self.Add(PlaneWaveSourceSettings(), [entity])
+
+	def AddManualGridSettings(self, entities):
+		return self.Add(ManualGridSettings(), list(entities))
+
+	def AddAutomaticVoxelerSettings(self, entities):
+		return self.Add(AutomaticVoxelerSettings("Automatic Voxeler Settings"), list(entities))
+
+	def LinkMaterialWithDatabase(self, material_settings, material):
+		material_settings.Name = material.Name
+		material_settings.MassDensity = material.MassDensity
+		material_settings.ElectricProps.Conductivity = material.Conductivity
+		material_settings.ElectricProps.RelativePermittivity = material.RelativePermittivity
+
+	def UpdateAllMaterials(self):
+		_fake.delay('UpdateAllMaterials')
+
+	def UpdateGrid(self):
+		_fake.delay('UpdateGrid')
+
+	def CreateVoxels(self):
+		_fake.delay('CreateVoxels')
+
+	def GetOutputFileName(self):
+		"""
+		ドキュメントの結果フォルダー (<プロジェクト名>_Results) にある、このシミュレーションの出力ファイルのパスを返します。
+		ドキュメントが未保存の場合は空文字列です。
+		"""
+		from s4l_v1 import document
+		if not document.FileName:
+			return ""
+		results_dir = os.path.splitext(document.FileName)[0] + "_Results"
+		return os.path.join(results_dir, f"{id(self):x}_Output.h5")
+
+	def _write_output_file(self):
+		path = self.GetOutputFileName()
+		if not path:
+			return
+		if not os.path.exists(os.path.dirname(path)):
+			os.makedirs(os.path.dirname(path))
+		with open(path, 'wb') as f:
+			f.write(b"\0" * _fake.OUTPUT_BYTES)
+
+	def RunSimulation(self, wait=True):
+		self._write_output_file()
+		if wait:
+			_fake.delay('RunSimulation')
+			self._finish_time = time.perf_counter()
+		else:
+			_fake.CALL_COUNTS['RunSimulation'] = _fake.CALL_COUNTS.get('RunSimulation', 0) + 1
+			self._finish_time = time.perf_counter() + _fake.LATENCIES.get('RunSimulation', 0.0)
+
+	def HasResults(self):
+		return self._finish_time is not None and time.perf_counter() >= self._finish_time
+
+	def _source(self):
+		for settings in self.AllSettings:
+			if isinstance(settings, PlaneWaveSourceSettings):
+				return settings
+		return PlaneWaveSourceSettings()
+
+	def Results(self):
+		return _SimulationResults(self)
+
+
+class _SimulationResults(object):
+	def __init__(self, sim):
+		self._extractors = {}
+		if sim.HasResults():
+			for settings in sim.AllSettings:
+				if isinstance(settings, (FieldSensorSettings, PointSensorSettings)):
+					self._extractors[settings.Name] = _SensorExtractor(sim, settings)
+
+	def __contains__(self, name):
+		return name in self._extractors
+
+	def __getitem__(self, name):
+		return self._extractors[name]
+
+
+class _FrequencySettings(object):
+	def __init__(self):
+		self.ExtractedFrequency = u"All"
+
+
+class _Output(object):
+	def __init__(self, compute):
+		self._compute = compute
+		self._data = None
+
+	def Update(self):
+		_fake.delay('ExtractorUpdate')
+		self._data = self._compute()
+		return True
+
+	@property
+	def Data(self):
+		if self._data is None:
+			self.Update()
+		return self._data
+
+
+class _Grid(object):
+	def __init__(self, shape):
+		self.XAxis, self.YAxis, self.ZAxis = (np.linspace(0.0, 1.0, n + 1) for n in shape)
+
+
+class _FieldData(object):
+	def __init__(self, values, shape, source):
+		self._values = values
+		self.Grid = _Grid(shape)
+		self.source = source
+
+	def Field(self, index):
+		return self._values
+
+	@property
+	def NumberOfComponents(self):
+		return self._values.shape[1]
+
+
+class _TimeSignalData(object):
+	def __init__(self, time_s, components):
+		self.Axis = time_s
+		self._components = components
+
+	def GetComponent(self, index):
+		return self._components[index]
+
+
+class _SensorExtractor(object):
+	def __init__(self, sim, settings):
+		self.Name = settings.Name
+		self.FrequencySettings = _FrequencySettings()
+		source = sim._source()
+		angles = tuple(_magnitude(getattr(source, name)) for name in ('Theta', 'Phi', 'Psi'))
+		frequency_hz = _magnitude(source.CenterFrequency) * 1e6
+		periods = _magnitude(sim.SetupSettings.SimulationTime)
+		if isinstance(settings, PointSensorSettings):
+			self.Outputs = {"EM E(t)": _Output(lambda: self._ring_up(frequency_hz, periods))}
+		else:
+			shape = _fake.FIELD_SHAPE
+			self.Outputs = {
+				"EM E(x,y,z,f0)": _Output(lambda: _FieldData(_fake.synthetic_e_field(*angles, shape=shape), shape, angles)),
+				"SAR(x,y,z,f0)": _Output(lambda: _FieldData(_fake.synthetic_sar(*angles, shape=shape), shape, angles)),
+			}
+
+	@staticmethod
+	def _ring_up(frequency_hz, periods, samples_per_period=40):
+		"""
+		振幅が指数関数的に定常値へ近づく正弦波の時間波形を返します。
+		"""
+		time_s = np.arange(int(periods * samples_per_period) + 1) / (samples_per_period * frequency_hz)
+		envelope = 1.0 - np.exp(-time_s * frequency_hz / 1.5)
+		signal = envelope * np.sin(2.0 * math.pi * frequency_hz * time_s)
+		return _TimeSignalData(time_s, [signal, 0.5 * signal, np.zeros_like(signal)])
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""
+s4l_v1.units のスタンドイン。
+"""
+Periods = 'Periods'
+Degrees = 'Degrees'
+Hz = 'Hz'
+MHz = 'MHz'
+GHz = 'GHz'
@@ -0,0 +1,36 @@
+"""
+平面波スイープのモデル作成・材料設定・実行・解析・出力をまとめたパッケージです。
+
+	model      モデルエンティティの作成と検索、ドキュメントのシミュレーションの削除
+	materials  組織エンティティへの材料の割り当て
+	sweep      シミュレーションの作成・実行・解析のスイープ
+	analysis   SAR値の抽出と解析ビューアの追加
+	fields     電界とSARのボリュームの保存と読み込み
+	geometry   格子のセルの体積・中心・ボクセルの質量のキャッシュ
+	multipath  保存したフィールドの重ね合わせによる多重波環境のSARの分布
+	hotspots   全方向のSARの上位ボクセル (ホットスポット) の索引
+	tissues    保存したSARの組織ごとの質量・吸収電力・平均SAR・最大SARの内訳
+	output     SAR結果のCSV出力
+	posture    エンティティのグループの姿勢変換とポーズのスイープ
+	pyramid    保存したボリュームの多重解像度ピラミッド (プレビュー用)
+	retention  解析後の生の出力の間引き・切り出し・圧縮・削除
+	spec       スイープ仕様ファイルの読み込みと設定の展開
+	directions 球面全体の入射方向の求積点と等方平均SAR
+	surrogate  SARの代理モデルと次に計算する方向の能動学習
+	shards     スイープのシミュレーションのプロジェクトファイル (シャード) への分割と索引
+	cli        スイープ仕様ファイルからGUIなしで実行するコマンド (python -m s4l_sweep)
+
+Sim4Life固有のライブラリ (s4l_v1) は各関数の中で使用する時点でインポートするため、
+output のように s4l_v1 を使わないモジュールは、Sim4Lifeの外の後処理でもすぐにインポートできます。
+サブモジュールは `import s4l_sweep` の時点ではインポートせず、属性として最初に参照した時点でインポートします。
+"""
+from __future__ import absolute_import
+import importlib
+
+__all__ = ['analysis', 'cli', 'directions', 'fields', 'geometry', 'hotspots', 'materials', 'model', 'multipath', 'output', 'posture', 'pyramid', 'retention', 'shards', 'spec', 'surrogate', 'sweep', 'tissues']
+
+
+def __getattr__(name):
+	if name in __all__:
+		return importlib.import_module(f"{__name__}.{name}")
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
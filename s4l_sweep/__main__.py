@@ -0,0 +1,6 @@
+from __future__ import absolute_import
+import sys
+
+from s4l_sweep import cli
+
+sys.exit(cli.main())
@@ -0,0 +1,247 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import json
+
+import numpy as np
+
+import _sweep_logging as sweep_logging
+
+_log = sweep_logging.get_logger('analysis')
+
+# SAR Statistics の表で Mass-Averaged SAR が入っている列 (目視で確認した値)
+MASS_AVERAGED_SAR_COLUMN = 2
+
+
+def _overall_field_extractor(sim):
+	"""
+	シミュレーション結果の 'Overall Field' センサーの抽出器を、全周波数を抽出する設定でドキュメントに追加して返します。
+	見つからない場合はNoneを返します。
+	"""
+	import s4l_v1.document as document
+
+	results = sim.Results()
+	if 'Overall Field' not in results:
+		_log.error("Overall Field sensor not found for %s.", sim.Name)
+		return None
+	em_sensor_extractor = results['Overall Field']
+	em_sensor_extractor.FrequencySettings.ExtractedFrequency = u"All"
+	document.AllAlgorithms.Add(em_sensor_extractor)
+	return em_sensor_extractor
+
+
+def _extract_field_array(sim, output_name):
+	"""
+	Overall Field の output_name の出力を NumPy 配列として取り出します。抽出器はドキュメントに追加しません。
+
+	Returns:
+		tuple: (形状 (nx, ny, nz, 成分数) の値, (X, Y, Z) の格子点の座標 [m] のタプル)。取得できない場合はNone。
+	"""
+	results = sim.Results()
+	if 'Overall Field' not in results:
+		_log.error("Overall Field sensor not found for %s.", sim.Name)
+		return None
+	em_sensor_extractor = results['Overall Field']
+	if output_name not in em_sensor_extractor.Outputs:
+		_log.error("'%s' output port not found in the Overall Field sensor of %s.", output_name, sim.Name)
+		return None
+	field_data = em_sensor_extractor.Outputs[output_name].Data
+	if field_data is None:
+		_log.error("'%s' output data is None for %s.", output_name, sim.Name)
+		return None
+	axes = tuple(np.asarray(axis, dtype=float) for axis in (field_data.Grid.XAxis, field_data.Grid.YAxis,
+		field_data.Grid.ZAxis))
+	shape = tuple(len(axis) - 1 for axis in axes)
+	# フィールドはセルごとの値で、X方向が最も速く変わる順に並んでいる
+	values = np.asarray(field_data.Field(0))
+	return values.reshape(shape + (values.shape[-1],), order='F'), axes
+
+
+def extract_e_field_array(sim):
+	"""
+	Overall Field の E(x,y,z,f0) を、形状 (nx, ny, nz, 3) の複素電界と格子点の座標 [m] のタプルとして返します。
+	取得できない場合はNoneを返します。
+	"""
+	return _extract_field_array(sim, "EM E(x,y,z,f0)")
+
+
+def extract_sar_array(sim):
+	"""
+	Overall Field の SAR(x,y,z,f0) を、形状 (nx, ny, nz) のSAR [W/kg] と格子点の座標 [m] のタプルとして返します。
+	取得できない場合はNoneを返します。
+	"""
+	extracted = _extract_field_array(sim, "SAR(x,y,z,f0)")
+	if extracted is None:
+		return None
+	values, axes = extracted
+	return np.real(values[..., 0]), axes
+
+
+def _add_table_viewer(table_output):
+	import s4l_v1.analysis.viewers as viewers
+	import s4l_v1.document as document
+
+	data_table_html_viewer = viewers.DataTableHTMLViewer(inputs=[table_output])
+	data_table_html_viewer.UpdateAttributes()
+	document.AllAlgorithms.Add(data_table_html_viewer)
+	_log.info("DataTableHTMLViewer '%s' has been added to the document.", data_table_html_viewer.Name)
+
+
+def analyze_wbsar(sim):
+	"""
+	指定されたシミュレーションの結果を解析し、
+	「All Regions」の「Mass-Averaged SAR」値を抽出して返します。取得できない場合はNoneを返します。
+	"""
+	import s4l_v1.analysis.em_evaluators as em_evaluators
+	import s4l_v1.document as document
+
+	_log.info("Analysis results for: %s", sim.Name)
+	em_sensor_extractor = _overall_field_extractor(sim)
+	if em_sensor_extractor is None:
+		return None
+
+	if "EM E(x,y,z,f0)" not in em_sensor_extractor.Outputs:
+		_log.error("'EM E(x,y,z,f0)' output port not found in the Overall Field sensor. "
+			"This indicates the FDTD simulation did not produce the necessary electric field data.")
+		return None
+	em_field_output = em_sensor_extractor.Outputs["EM E(x,y,z,f0)"]
+	if em_field_output.Data is None:
+		_log.error("'EM E(x,y,z,f0)' output data is None. The simulation results might be missing or incomplete.")
+		return None
+
+	sar_statistics_evaluator_name = f"SAR Statistics for {sim.Name}"
+	if sar_statistics_evaluator_name in document.AllAlgorithms:
+		sar_statistics_evaluator = document.AllAlgorithms[sar_statistics_evaluator_name]
+		_log.info("Found existing SarStatisticsEvaluator '%s'.", sar_statistics_evaluator_name)
+	else:
+		sar_statistics_evaluator = em_evaluators.SarStatisticsEvaluator(inputs=[em_field_output])
+		sar_statistics_evaluator.Name = sar_statistics_evaluator_name
+		sar_statistics_evaluator.PeakSpatialAverageSAR = True
+		sar_statistics_evaluator.UpdateAttributes()
+		document.AllAlgorithms.Add(sar_statistics_evaluator)
+		_log.info("Created new SarStatisticsEvaluator '%s'.", sar_statistics_evaluator_name)
+
+	if not sar_statistics_evaluator.Update():
+		_log.error("SarStatisticsEvaluator '%s' failed to update/compute.", sar_statistics_evaluator.Name)
+		return None
+	_log.info("SarStatisticsEvaluator '%s' successfully computed.", sar_statistics_evaluator.Name)
+	if "SAR Statistics" not in sar_statistics_evaluator.Outputs:
+		_log.error("'SAR Statistics' output port not found.")
+		return None
+	sar_statistics_output = sar_statistics_evaluator.Outputs["SAR Statistics"]
+	_add_table_viewer(sar_statistics_output)
+
+	mass_averaged_sar_value = None
+	try:
+		table_data_obj = sar_statistics_output.Data
+		if table_data_obj is None:
+			_log.error("SarStatisticsEvaluator did not produce valid table data.")
+			return None
+		if not (hasattr(table_data_obj, 'ToList') and callable(table_data_obj.ToList)):
+			_log.error("TableData object has no 'ToList' method.")
+			return None
+
+		table_list = table_data_obj.ToList()
+		if not isinstance(table_list, list) or len(table_list) < 1:
+			_log.warning("ToList() did not return a valid list with at least one data row.")
+			return None
+		# 'All Regions' 行は表の最後の行
+		last_row_values = table_list[-1]
+		if isinstance(last_row_values, list) and MASS_AVERAGED_SAR_COLUMN < len(last_row_values):
+			mass_averaged_sar_value = last_row_values[MASS_AVERAGED_SAR_COLUMN]
+		else:
+			_log.warning("Last row is not a list or column index is out of range.")
+	except Exception as e:
+		_log.error("An unexpected error occurred during data extraction: %s", e)
+		return None
+
+	if mass_averaged_sar_value is not None:
+		_log.info("Mass-Averaged SAR (All Regions) for '%s': %s W/kg", sim.Name, mass_averaged_sar_value)
+	else:
+		_log.warning("'Mass-Averaged SAR' value not found for %s.", sim.Name)
+	return mass_averaged_sar_value
+
+
+def parse_volume_weighted_average(data_json):
+	"""
+	StatisticsEvaluatorの 'SAR Statistics' 出力のDataJson文字列から、
+	Volume Weighted Average (simple_data_collection/data_collection/Average/data[0]) を取り出します。
+	見つからない場合はNoneを返します。
+	"""
+	parsed_data = json.loads(data_json)
+	try:
+		values = parsed_data["simple_data_collection"]["data_collection"]["Average"]["data"]
+	except (KeyError, TypeError):
+		return None
+	if isinstance(values, list) and values:
+		return values[0]
+	return None
+
+
+def analyze_volume_weighted_sar(sim):
+	"""
+	指定されたシミュレーションの SAR(x,y,z,f0) の統計を計算し、
+	「Volume Weighted Average」SAR値を抽出して返します。取得できない場合はNoneを返します。
+	"""
+	import s4l_v1.analysis.core as analysis_core
+	import s4l_v1.document as document
+
+	_log.info("Analysis results for: %s", sim.Name)
+	em_sensor_extractor = _overall_field_extractor(sim)
+	if em_sensor_extractor is None:
+		return None
+
+	statistics_evaluator = analysis_core.StatisticsEvaluator(inputs=[em_sensor_extractor.Outputs["SAR(x,y,z,f0)"]])
+	statistics_evaluator.Mode = u"Value"
+	statistics_evaluator.UpdateAttributes()
+	document.AllAlgorithms.Add(statistics_evaluator)
+
+	# Update() がFalseを返す場合は計算に失敗している
+	if not statistics_evaluator.Update():
+		_log.error("StatisticsEvaluator '%s' failed to update/compute. Cannot extract SAR statistics.",
+			statistics_evaluator.Name)
+		return None
+
+	sar_statistics_output = statistics_evaluator.Outputs["SAR Statistics"]
+	json_data_object = sar_statistics_output.Data
+	_log.debug("Type of SAR Statistics data for %s: %s", sim.Name, type(json_data_object))
+
+	volume_weighted_average_value = None
+	data_json = getattr(json_data_object, 'DataJson', None)
+	if isinstance(data_json, str):
+		_log.debug("SAR Statistics DataJson for %s: %s", sim.Name, data_json)
+		try:
+			volume_weighted_average_value = parse_volume_weighted_average(data_json)
+		except ValueError as e:
+			_log.error("Failed to decode DataJson string: %s", e)
+	else:
+		_log.error("JsonDataObject has no 'DataJson' attribute or 'DataJson' is not a string. Cannot extract value.")
+
+	if volume_weighted_average_value is not None:
+		_log.info("Volume Weighted Average for simulation '%s': %s W/kg", sim.Name, volume_weighted_average_value)
+	else:
+		_log.warning("'Volume Weighted Average' not found in SAR Statistics data for %s.", sim.Name)
+
+	_add_table_viewer(sar_statistics_output)
+	return volume_weighted_average_value
+
+
+def add_e_field_slice_viewer(sim):
+	"""
+	Overall Field の E(x,y,z,f0) の実部 (成分0) をYZ面で表示するスライスビューアを、
+	最大値のスライスに移動してドキュメントに追加します。
+	"""
+	import s4l_v1.analysis.viewers as viewers
+	import s4l_v1.document as document
+
+	_log.info("Analyzing results for: %s", sim.Name)
+	overall_field_sensor = sim.Results()['Overall Field']
+
+	slice_field_viewer_efield = viewers.SliceFieldViewer()
+	slice_field_viewer_efield.Inputs[0].Connect(overall_field_sensor['EM E(x,y,z,f0)'])
+	slice_field_viewer_efield.Data.Mode = slice_field_viewer_efield.Data.Mode.enum.QuantityRealPart
+	slice_field_viewer_efield.Data.Component = slice_field_viewer_efield.Data.Component.enum.Component0
+	slice_field_viewer_efield.Slice.Plane = slice_field_viewer_efield.Slice.Plane.enum.YZ
+	slice_field_viewer_efield.Update(0)
+	slice_field_viewer_efield.GotoMaxSlice()
+	document.AllAlgorithms.Add(slice_field_viewer_efield)
+	return slice_field_viewer_efield
@@ -0,0 +1,258 @@
+"""
+スイープ仕様ファイル (JSON / YAML) から平面波スイープをGUIの操作なしで実行するコマンドです。
+
+使い方 (Sim4LifeのPythonで実行):
+	python -m s4l_sweep sweep.json
+	python -m s4l_sweep sweep.yaml --output-dir D:/results/run1
+	python -m s4l_sweep sweep.json --dry-run
+
+仕様に model_files を指定した場合は、各プロジェクトを順に開いて同じスイープを実行し、閉じてから次に進みます。
+仕様のキーと既定値は s4l_sweep.spec.DEFAULT_SPEC を参照してください。
+終了コードは、成功した場合は0、実行中にエラーが発生した場合は1、仕様に問題がある場合は2です。
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+import argparse
+import itertools
+import os
+import sys
+import time
+
+import _memory_monitor as memory_monitor
+import _sweep_logging as sweep_logging
+from s4l_sweep import spec as sweep_spec
+
+_log = sweep_logging.get_logger('cli')
+
+# --dry-run で表示する設定の件数
+DRY_RUN_PREVIEW = 5
+
+
+def run_spec(spec):
+	"""
+	スイープ仕様を実行します。model_file を指定した場合はそのプロジェクトを開いてから実行します。
+	周波数ごとに設定を展開し、chunk_size を指定した場合はその本数ずつ実行して結果をCSVに追記します
+	(各チャンクの開始時に前のチャンクのシミュレーションはドキュメントから削除されます)。
+	shard_by を指定した場合は、チャンクの代わりにシャードごとに別のプロジェクトに保存し、
+	output_dir/<モデル名>_shards.json の索引 (s4l_sweep.shards.ShardIndex) に記録します。索引がすでにある場合は
+	それに追加し、以前のシャードを上書きしないよう番号を続けます (索引を読めない場合は実行しません)。
+	direction_scheme が球面の求積の場合は、周波数ごとの等方平均SARを output_dir/<モデル名>_isotropic_wbsar.csv に書き出します。
+	sweep_mode='active' の場合は、仕様の設定を初期設定として計算し、以後は代理モデル (s4l_sweep.surrogate) が
+	選んだ設定を active_batch_size 本ずつ計算します。
+
+	Returns:
+		int: 解析できたSAR結果の件数。
+	"""
+	from s4l_sweep import directions
+	from s4l_sweep import fields
+	from s4l_sweep import hotspots
+	from s4l_sweep import model as sweep_model
+	from s4l_sweep import multipath
+	from s4l_sweep import output
+	from s4l_sweep import pyramid
+	from s4l_sweep import shards
+	from s4l_sweep import surrogate
+	from s4l_sweep import sweep
+	from s4l_sweep import tissues
+
+	if spec['model_file'] is not None:
+		sweep_model.open_model(spec['model_file'])
+	# シャードに保存するとドキュメントのファイル名が変わるため、開いた時点のモデル名を使い続ける
+	model_name = sweep_model.get_model_name()
+	if not os.path.exists(spec['output_dir']):
+		os.makedirs(spec['output_dir'])
+
+	if spec['sweep_mode'] == 'screened':
+		run_function = sweep.run_screened_plane_wave_simulations
+		options = {'top_k': spec['top_k'], 'margin_fraction': spec['margin_fraction']}
+		if spec['chunk_size'] is not None:
+			# 方向の順位付けにはすべての方向の粗い計算結果が必要なため、分割しない
+			_log.warning("chunk_size is ignored in screened sweep mode.")
+		chunk_size = None
+	else:
+		run_function = sweep.run_multiple_plane_wave_simulations
+		if spec['sweep_mode'] == 'active' and spec['chunk_size'] is not None:
+			_log.warning("chunk_size is ignored in active sweep mode.")
+		options = {'admission_policy': spec['admission_policy'], 'model_name': model_name}
+		chunk_size = spec['chunk_size']
+
+	shard_index = None
+	if spec['shard_by'] is not None:
+		shard_dir = os.path.join(spec['output_dir'], f"{model_name}_shards")
+		index_path = os.path.join(spec['output_dir'], f"{model_name}_shards.json")
+		if os.path.exists(index_path):
+			# 以前のスイープのシャードを上書きしないよう、既存の索引に追加して番号を続ける
+			shard_index = shards.ShardIndex.load(index_path)
+			if shard_index is None:
+				raise RuntimeError(f"Shard index '{index_path}' exists but cannot be read. Refusing to overwrite its shards.")
+			_log.info("Continuing shard index '%s' after %d existing shards.", index_path, len(shard_index.shards))
+		else:
+			shard_index = shards.ShardIndex(index_path, model_name)
+		_log.info("Saving sweep shards to '%s' (index: '%s').", shard_dir, shard_index.index_path)
+
+	options['retention_policy'] = spec['retention_policy']
+	options['retention_options'] = {'stride': spec['retention_stride'], 'roi_m': spec['retention_roi_m']}
+	options['export_fields'] = spec['export_fields']
+	options['field_options'] = {'storage': spec['field_storage'], 'sparse': spec['field_sparse']}
+
+	n_results = 0
+	labels_stored = False
+	n_configs = sweep_spec.count_simulation_configs(spec)
+	for frequency_mhz in spec['frequencies_mhz']:
+		frequency_label = f"{frequency_mhz:g} MHz" if frequency_mhz is not None else "source default frequency"
+		_log.info("--- Sweep of %d directions at %s ---", n_configs, frequency_label)
+		configs = sweep_spec.iter_simulation_configs(spec, frequency_mhz)
+		frequency_results = []
+
+		def run_configs(simulation_configs):
+			return run_function(None, None, spec['output_dir'],
+				ram_budget_gb=spec['ram_budget_gb'], disk_budget_gb=spec['disk_budget_gb'],
+				concurrency=spec['concurrency'], frequency_mhz=frequency_mhz, grid_mode=spec['grid_mode'],
+				kernel=spec['kernel'], adaptive_periods=spec['adaptive_periods'],
+				steady_state_tolerance=spec['steady_state_tolerance'], stable_periods=spec['stable_periods'],
+				convergence_level_db=spec['convergence_level_db'],
+				monitor_memory=spec['monitor_memory'], simulation_configs=simulation_configs, **options)
+
+		if spec['sweep_mode'] == 'active':
+			candidates = surrogate.candidate_configs(sweep_spec.polarization_angles(spec),
+				name_tag=sweep_spec.frequency_tag(spec, frequency_mhz))
+			frequency_results = surrogate.run_active_learning(run_configs, list(configs),
+				max_iterations=spec['active_iterations'], batch_size=spec['active_batch_size'],
+				objective=spec['active_objective'], tolerance=spec['active_tolerance'], candidates=candidates)
+			n_results += len(frequency_results)
+			continue
+		if shard_index is None:
+			parts = ((None, chunk) for chunk in sweep_spec.iter_config_chunks(configs, chunk_size))
+		else:
+			parts = shards.iter_shards(configs, spec['shard_by'], spec['shard_size'])
+		for key, part in parts:
+			if shard_index is not None:
+				options['project_path'] = shard_index.next_project_path(shard_dir, model_name)
+			results = run_configs(part)
+			if shard_index is not None and results is not None:
+				shard_index.add_shard(options['project_path'], key,
+					[row['SimulationName'] for row in results], frequency_mhz)
+			n_results += len(results or [])
+			frequency_results.extend(results or [])
+
+		weights = sweep_spec.simulation_config_weights(spec, frequency_mhz)
+		if weights is not None and spec['sweep_mode'] == 'full':
+			average = directions.isotropic_average(frequency_results, weights)
+			if average is not None:
+				_log.info("Isotropic average WBSAR at %s: %.6g W/kg (%d directions, %.1f%% of the weight).",
+					frequency_label, average['IsotropicAverageSAR'], average['Directions'], 100.0 * average['WeightCovered'])
+				average.update({'ModelName': model_name, 'FrequencyMHz': frequency_mhz,
+					'DirectionScheme': spec['direction_scheme'], 'DirectionOrder': spec['direction_order']})
+				output.write_sar_results_to_csv([average], os.path.join(spec['output_dir'],
+					f"{model_name}_isotropic_wbsar.csv"), fieldnames=output.ISOTROPIC_FIELDNAMES)
+		if spec['multipath_realizations']:
+			# 全身平均SARの質量の重みに使用するため、組織ラベルを先に保存する
+			if spec['tissue_labels'] is not None and not labels_stored:
+				labels_stored = tissues.store_label_file(fields.FieldStore(fields.fields_dir(spec['output_dir'],
+					model_name)), spec['tissue_labels'])
+			multipath.run_multipath_analysis(spec['output_dir'], model_name, weights=weights,
+				n_realizations=spec['multipath_realizations'], amplitude=spec['multipath_amplitude'],
+				seed=spec['multipath_seed'], frequency_mhz=frequency_mhz)
+	if spec['tissue_labels'] is not None and not labels_stored:
+		tissues.store_label_file(fields.FieldStore(fields.fields_dir(spec['output_dir'], model_name)),
+			spec['tissue_labels'])
+	if spec['field_pyramid']:
+		pyramid.build_pyramids(fields.FieldStore(fields.fields_dir(spec['output_dir'], model_name)))
+	if spec['hotspot_top_k']:
+		hotspots.build_hotspot_index(spec['output_dir'], model_name, k=spec['hotspot_top_k'])
+	if spec['tissue_breakdown']:
+		tissues.write_tissue_breakdown(spec['output_dir'], model_name)
+	return n_results
+
+
+def run_batch(spec):
+	"""
+	model_files の各プロジェクトについて、開く・スイープする・閉じるを順に実行します。
+	エンティティの索引と材料はモデルを開いている間のシミュレーションで再利用し、閉じるときに解放します。
+	あるプロジェクトで失敗しても、残りのプロジェクトは続けて実行します。
+
+	Returns:
+		list: 'model_file', 'ok', 'results', 'wall_s', 'rss_bytes' を持つ、プロジェクトごとの辞書のリスト。
+	"""
+	from s4l_sweep import model as sweep_model
+
+	model_files = sweep_spec.expand_model_files(spec)
+	rows = []
+	for index, model_file in enumerate(model_files):
+		_log.info("=== Model %d of %d: %s ===", index + 1, len(model_files), model_file)
+		row = {'model_file': model_file, 'ok': False, 'results': 0}
+		start = time.perf_counter()
+		try:
+			row['results'] = run_spec(dict(spec, model_file=model_file, model_files=None))
+			row['ok'] = True
+		except Exception:
+			_log.exception("Sweep failed for '%s'. Continuing with the next model.", model_file)
+		finally:
+			sweep_model.close_model()
+		row['wall_s'] = time.perf_counter() - start
+		row['rss_bytes'] = memory_monitor.process_rss_bytes()
+		rows.append(row)
+		rss = f"{row['rss_bytes'] / 1024.0 ** 2:.0f} MB" if row['rss_bytes'] is not None else "n/a"
+		_log.info("Model '%s' %s with %d SAR results in %.0f s. RSS after close: %s.", model_file,
+			"finished" if row['ok'] else "failed", row['results'], row['wall_s'], rss)
+	return rows
+
+
+def format_batch_summary(rows):
+	"""
+	run_batch() の結果を表形式の文字列に整形します。
+	"""
+	header = f"{'model':<40}{'status':>8}{'results':>9}{'wall[s]':>10}{'rss[MB]':>10}"
+	lines = [header, "-" * len(header)]
+	for row in rows:
+		rss = f"{row['rss_bytes'] / 1024.0 ** 2:>10.0f}" if row['rss_bytes'] is not None else f"{'n/a':>10}"
+		lines.append(f"{os.path.basename(row['model_file'])[:39]:<40}{'ok' if row['ok'] else 'FAILED':>8}"
+			f"{row['results']:>9}{row['wall_s']:>10.1f}{rss}")
+	return "\n".join(lines)
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog='python -m s4l_sweep',
+		description="Run a plane wave sweep from a JSON or YAML sweep specification without the GUI.")
+	parser.add_argument('spec', help="sweep specification file (.json, .yaml or .yml)")
+	parser.add_argument('--output-dir', help="override output_dir of the specification")
+	parser.add_argument('--dry-run', action='store_true',
+		help="validate the specification and show the expanded sweep without running it")
+	args = parser.parse_args(argv)
+
+	spec, problems = sweep_spec.load_spec(args.spec)
+	if problems:
+		for problem in problems:
+			print(f"ERROR: {problem}", file=sys.stderr)
+		return 2
+	if args.output_dir:
+		spec['output_dir'] = os.path.abspath(args.output_dir)
+
+	n_configs = sweep_spec.count_simulation_configs(spec)
+	if args.dry_run:
+		print(f"INFO: {n_configs} directions x {len(spec['frequencies_mhz'])} frequencies "
+			f"= {n_configs * len(spec['frequencies_mhz'])} simulations. Output: '{spec['output_dir']}'.")
+		for model_file in sweep_spec.expand_model_files(spec):
+			print(f"INFO:   Model: {model_file}")
+		for frequency_mhz in spec['frequencies_mhz']:
+			for config in itertools.islice(sweep_spec.iter_simulation_configs(spec, frequency_mhz), DRY_RUN_PREVIEW):
+				print(f"INFO:   {config[0]} (Theta={config[1]}, Phi={config[2]}, Psi={config[3]})")
+		return 0
+
+	sweep_logging.configure_logging(os.path.join(spec['output_dir'], "sweep_log.jsonl"),
+		console_interval_s=spec['log_console_interval_s'])
+	_log.info("Python Version: %s", sys.version)
+	_log.info("Sweep specification: %s", os.path.abspath(args.spec))
+	try:
+		if spec['model_files'] is not None:
+			rows = run_batch(spec)
+			_log.info("--- Batch Summary ---\n%s", format_batch_summary(rows))
+			return 0 if all(row['ok'] for row in rows) else 1
+		n_results = run_spec(spec)
+		_log.info("Sweep finished with %d SAR results.", n_results)
+		return 0
+	except Exception:
+		_log.exception("Sweep failed.")
+		return 1
+	finally:
+		sweep_logging.shutdown_logging()
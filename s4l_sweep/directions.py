@@ -0,0 +1,145 @@
+"""
+全球面の入射方向のサンプリングと、求積の重みによる等方平均SARの計算です。
+
+Theta=90度の水平面だけのスイープでは、等方的な (ランダムな方向からの) 曝露の平均を求められません。
+Lebedev求積 (6, 14, 26, 50点) は球面上の低次の多項式を厳密に積分する点と重みの組で、
+少ない方向数で球面平均を精度よく求められます。Fibonacci球面の点は任意の点数で一様に近く、重みは等しくします。
+
+方向の Theta と Phi は、平面波が到来する方向 (原点から見た波源の方向) の極角と方位角です。
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+import itertools
+import math
+
+import _sweep_logging as sweep_logging
+
+_log = sweep_logging.get_logger('directions')
+
+SPHERE_SCHEMES = ('lebedev', 'fibonacci')
+# Lebedev求積の点数 -> 対称な点の組 (軌道) ごとの重み。重みの合計は1
+_LEBEDEV_ORBIT_WEIGHTS = {
+	6: {'a1': 1.0 / 6.0},
+	14: {'a1': 1.0 / 15.0, 'a3': 3.0 / 40.0},
+	26: {'a1': 1.0 / 21.0, 'a2': 4.0 / 105.0, 'a3': 9.0 / 280.0},
+	50: {'a1': 4.0 / 315.0, 'a2': 64.0 / 2835.0, 'a3': 27.0 / 1280.0, 'b': 14641.0 / 725760.0},
+}
+LEBEDEV_ORDERS = tuple(sorted(_LEBEDEV_ORBIT_WEIGHTS))
+# 50点の求積の (l, l, m) 型の軌道の座標 (l^2 + l^2 + m^2 = 1)
+_LEBEDEV_50_L = 1.0 / math.sqrt(11.0)
+_LEBEDEV_50_M = 3.0 / math.sqrt(11.0)
+_GOLDEN_ANGLE = math.pi * (3.0 - math.sqrt(5.0))
+
+
+def _signed(vector):
+	"""
+	vector の0でない成分の符号をすべての組み合わせで反転した点を返します。
+	"""
+	choices = [(v, -v) if v != 0.0 else (v,) for v in vector]
+	return list(itertools.product(*choices))
+
+
+def _orbit(name):
+	if name == 'a1':
+		bases = [(1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0)]
+	elif name == 'a2':
+		s = 1.0 / math.sqrt(2.0)
+		bases = [(0.0, s, s), (s, 0.0, s), (s, s, 0.0)]
+	elif name == 'a3':
+		s = 1.0 / math.sqrt(3.0)
+		bases = [(s, s, s)]
+	else:
+		l, m = _LEBEDEV_50_L, _LEBEDEV_50_M
+		bases = [(l, l, m), (l, m, l), (m, l, l)]
+	return [point for base in bases for point in _signed(base)]
+
+
+def lebedev_points(order):
+	"""
+	order 点のLebedev求積の ((x, y, z), 重み) のリストを返します。重みの合計は1です。
+
+	Raises:
+		ValueError: order が LEBEDEV_ORDERS にない場合。
+	"""
+	if order not in _LEBEDEV_ORBIT_WEIGHTS:
+		raise ValueError(f"Lebedev order must be one of {LEBEDEV_ORDERS} (got {order!r}).")
+	return [(point, weight) for name, weight in _LEBEDEV_ORBIT_WEIGHTS[order].items() for point in _orbit(name)]
+
+
+def fibonacci_points(n_points):
+	"""
+	Fibonacci球面上の n_points 点の ((x, y, z), 重み) のリストを返します。重みはすべて 1 / n_points です。
+	"""
+	points = []
+	for index in range(n_points):
+		z = 1.0 - (2.0 * index + 1.0) / n_points
+		radius = math.sqrt(max(0.0, 1.0 - z * z))
+		angle = index * _GOLDEN_ANGLE
+		points.append(((radius * math.cos(angle), radius * math.sin(angle), z), 1.0 / n_points))
+	return points
+
+
+def sphere_points(scheme, order):
+	"""
+	scheme ('lebedev' または 'fibonacci') の order 点の ((x, y, z), 重み) のリストを返します。
+	"""
+	if scheme == 'lebedev':
+		return lebedev_points(order)
+	if scheme == 'fibonacci':
+		return fibonacci_points(order)
+	raise ValueError(f"Unknown direction scheme '{scheme}'.")
+
+
+def direction_angles(point):
+	"""
+	単位ベクトルの (Theta, Phi) [度] を返します。Phiは [0, 360) で、極 (Theta=0, 180度) では0です。
+	角度は有効数字9桁に丸め、シミュレーション名が計算誤差で変わらないようにします。
+	"""
+	x, y, z = point
+	theta = math.degrees(math.acos(max(-1.0, min(1.0, z))))
+	phi = math.degrees(math.atan2(y, x)) % 360.0 if math.hypot(x, y) > 1e-12 else 0.0
+	return float(f"{theta:.9g}"), float(f"{phi:.9g}") % 360.0
+
+
+def iter_sphere_directions(scheme, order):
+	"""
+	(Theta, Phi, 重み) を1つずつ返すジェネレーターです。
+	"""
+	for point, weight in sphere_points(scheme, order):
+		theta, phi = direction_angles(point)
+		yield theta, phi, weight
+
+
+def isotropic_average(results, weights, sar_field='MassAveragedSAR'):
+	"""
+	方向ごとのSAR結果の、求積の重みによる等方平均を返します。
+
+	Args:
+		results (list): 'Direction' と sar_field を持つ結果の辞書のリスト (CSVから読んだ文字列の値も可)。
+		weights (dict): 名前サフィックス ('Direction' の値) -> 重み (spec.simulation_config_weights() の値)。
+		sar_field (str): SAR値の列名。
+
+	Returns:
+		dict: 'IsotropicAverageSAR' (平均), 'WeightCovered' (結果が得られた方向の重みの割合), 'Directions' (使用した方向数)。
+		結果が1件もない場合はNone。一部の方向が欠けている場合は、得られた方向の重みで正規化し警告を記録します。
+	"""
+	total_weight = sum(weights.values())
+	weighted_sum = 0.0
+	covered = 0.0
+	used = set()
+	for row in results:
+		name = row.get('Direction')
+		value = row.get(sar_field)
+		if name not in weights or name in used or value in (None, ''):
+			continue
+		weighted_sum += weights[name] * float(value)
+		covered += weights[name]
+		used.add(name)
+	if not used:
+		_log.error("No results matched the quadrature directions.")
+		return None
+	if len(used) < len(weights):
+		_log.warning("%d of %d quadrature directions have no result. The average is renormalized over %.1f%% of the weight.",
+			len(weights) - len(used), len(weights), 100.0 * covered / total_weight)
+	return {'IsotropicAverageSAR': weighted_sum / covered, 'WeightCovered': covered / total_weight,
+		'Directions': len(used)}
@@ -0,0 +1,470 @@
+"""
+解析したシミュレーションの電界とSARのボリュームを、Sim4Lifeの外で後処理できる形式で保存・読み込みます。
+
+フィールドは <output_dir>/<モデル名>_fields/ のフォルダー (FieldStore) に、方向 (名前サフィックス) ごとに保存します。
+
+	<方向>.json          メタデータ (Theta, Phi, Psi, 周波数, 格子のハッシュ, 配列の一覧)
+	<方向>.<配列名>.npy  配列。e_field は形状 (nx, ny, nz, 3) の複素電界 [V/m] (ピーク値)、sar は形状 (nx, ny, nz) のSAR [W/kg]
+	_grid_<ハッシュ>.npz 格子点の座標 x, y, z [m]。同じ格子の方向で共有する
+
+配列は .npy で保存するため、読み込み時にメモリマップでき、全体をメモリに載せずにボクセルのブロックごとに処理できます。
+
+保存形式 (storage) は配列ごとに選べます。書き込み時に復元した値との誤差を求めてメタデータに記録し、
+読み込み時 (read(), read_rows()) には元の形状の浮動小数点数に戻します。
+
+	native  抽出した値のまま (通常は倍精度)。誤差なし
+	single  complex64 / float32。相対誤差は要素ごとに約 6e-8 以下
+	half    ボクセルのブロック (QUANT_BLOCK_VOXELS 個) ごとの最大値で正規化した float16 (複素数は実部と虚部の組)。
+	        ブロックの最大値の 6.1e-5 倍以上の要素は相対誤差が約 4.9e-4 以下、それより小さい要素 (float16の非正規化数) は
+	        絶対誤差がブロックの最大値の 3e-8 倍以下
+	int16   ブロックごとの最大値で正規化した16ビット整数。誤差はブロックの最大値の 1/65534 以下
+
+half と int16 はブロックの最大値で正規化するため、値の絶対的な大きさ (1 V/m の平面波のSAR 1e-6 W/kg など) によらず
+同じ精度になります。
+
+容量は倍精度に比べて single で1/2、half と int16 で1/4 (int16はブロックごとの倍率を別のファイルに持つ) です。
+
+sparse=True で保存した配列は、人体 (組織) のボクセルの値だけを持ちます。人体のボクセルの平坦化した番号 (C順) は
+_body_<ハッシュ>.npy に格子ごとに1つ保存し、同じ格子のすべての方向で共有します。計算領域の大部分は空気のため、
+容量と読み込みの量はおおむね空気の割合だけ減ります。read() と read_rows() は密な格子に戻した値を返し、
+read_voxels() は保存したボクセルの番号と値をそのまま返します (多重波の合成、ホットスポット、組織ごとの内訳はこちらを使用します)。
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import _sweep_logging as sweep_logging
+from s4l_sweep import analysis
+
+_log = sweep_logging.get_logger('fields')
+
+# メタデータの形式のバージョン
+FIELD_FORMAT_VERSION = 1
+STORAGE_MODES = ('native', 'single', 'half', 'int16')
+# int16 の量子化で倍率を共有するボクセル数
+QUANT_BLOCK_VOXELS = 4096
+# 誤差を求めるときに1度に復元するボクセル数
+_ERROR_CHUNK_VOXELS = 1 << 20
+_INT16_MAX = 32767
+
+
+def fields_dir(output_dir, model_name):
+	return os.path.join(output_dir, f"{model_name}_fields")
+
+
+def grid_hash(axes):
+	"""
+	格子点の座標 (X, Y, Z) のハッシュ (16進数16文字) を返します。
+	"""
+	digest = hashlib.sha1()
+	for axis in axes:
+		axis = np.ascontiguousarray(axis, dtype=np.float64)
+		digest.update(np.int64(len(axis)).tobytes())
+		digest.update(axis.tobytes())
+	return digest.hexdigest()[:16]
+
+
+class FieldStore(object):
+	"""
+	方向ごとのフィールドのボリュームを保存するフォルダーです。
+	"""
+
+	def __init__(self, directory):
+		self.directory = directory
+		self._metadata = {}
+		self._axes = {}
+		self._mapped = {}
+
+	def _path(self, name):
+		return os.path.join(self.directory, name)
+
+	def _mapped_array(self, filename):
+		"""
+		保存した .npy をメモリマップした配列を返します。ブロックごとの読み込みでヘッダーを読み直さないよう保持します。
+		"""
+		if filename not in self._mapped:
+			self._mapped[filename] = np.load(self._path(filename), mmap_mode='r')
+		return self._mapped[filename]
+
+	def directions(self):
+		"""
+		保存されている方向の名前を名前順に返します。
+		"""
+		names = [os.path.basename(path)[:-len(".json")] for path in glob.glob(self._path("*.json"))]
+		return sorted(name for name in names if not name.startswith('_'))
+
+	def metadata(self, direction):
+		if direction not in self._metadata:
+			with open(self._path(f"{direction}.json"), 'r', encoding='utf-8') as f:
+				self._metadata[direction] = json.load(f)
+		return self._metadata[direction]
+
+	def write(self, direction, arrays, axes, storage='native', sparse=False, **metadata):
+		"""
+		方向のフィールドを保存します。arrays は配列名 -> 配列の辞書、axes は格子点の座標 (X, Y, Z) [m] です。
+		storage は STORAGE_MODES の保存形式です。sparse=True の場合は人体のボクセルの値だけを保存します。
+		格子の人体のボクセルの番号がまだない場合は、保存済みの組織ラベル (0以外)、なければ arrays の 'sar' (正の値) から決めます。
+		metadata (theta, phi, psi, frequency_mhz など) はメタデータのJSONに記録します。
+		"""
+		if storage not in STORAGE_MODES:
+			raise ValueError(f"storage must be one of {STORAGE_MODES} (got {storage!r}).")
+		if not os.path.exists(self.directory):
+			os.makedirs(self.directory)
+		key = grid_hash(axes)
+		grid_path = self._path(f"_grid_{key}.npz")
+		if not os.path.exists(grid_path):
+			np.savez(grid_path, x=axes[0], y=axes[1], z=axes[2])
+		body = self._body_index_for(key, arrays) if sparse else None
+		if sparse and body is None:
+			raise ValueError("Sparse storage needs a 'sar' array or stored tissue labels to find the body voxels.")
+		entries = {}
+		for name, values in arrays.items():
+			values = np.ascontiguousarray(values)
+			if body is None:
+				entries[name] = self._write_array(direction, name, values, storage)
+				continue
+			n_voxels = int(np.prod(values.shape[:3]))
+			flat = values.reshape((n_voxels,) + values.shape[3:])
+			if name == 'sar':
+				outside = np.ones(n_voxels, dtype=bool)
+				outside[body] = False
+				if np.any(flat[outside] > 0.0):
+					_log.warning("SAR of '%s' is positive at %d voxels outside the body index. They are not stored.",
+						direction, int(np.count_nonzero(flat[outside] > 0.0)))
+			entry = self._write_array(direction, name, np.ascontiguousarray(flat[body]), storage)
+			entries[name] = dict(entry, shape=list(values.shape), rows=int(len(body)), body=key)
+		self._save_metadata(direction, dict(metadata, version=FIELD_FORMAT_VERSION, direction=direction, grid=key,
+			arrays=entries))
+
+	def update_metadata(self, direction, **items):
+		"""
+		保存済みの方向のメタデータに項目を追加 (または上書き) します。
+		"""
+		self._save_metadata(direction, dict(self.metadata(direction), **items))
+
+	def _save_metadata(self, direction, document):
+		temp_path = self._path(f"{direction}.json.tmp")
+		with open(temp_path, 'w', encoding='utf-8') as f:
+			json.dump(document, f, indent=1)
+		os.replace(temp_path, self._path(f"{direction}.json"))
+		self._metadata[direction] = document
+
+	def _write_array(self, direction, name, values, storage):
+		"""
+		配列を storage の形式で保存し、メタデータの項目 (ファイル名、元の型と形状、誤差) を返します。
+		"""
+		n_voxels = len(values) if values.ndim < 3 else int(np.prod(values.shape[:3]))
+		peak = float(np.abs(values).max()) if values.size else 0.0
+		entry = {'file': f"{direction}.{name}.npy", 'dtype': str(values.dtype), 'shape': list(values.shape),
+			'storage': storage}
+		if values.ndim < 3:
+			# 人体のボクセルの行 (sparse)。形状の先頭3軸はボクセルではないため、復元する前に行数を記録する
+			entry['rows'] = n_voxels
+		# 上書きする前に、前に保存した配列のメモリマップを手放す
+		self._mapped.pop(entry['file'], None)
+		self._mapped.pop(f"{direction}.{name}.scale.npy", None)
+		if storage == 'native':
+			stored = values
+		elif storage == 'single':
+			stored = values.astype(np.complex64 if np.iscomplexobj(values) else np.float32)
+		else:
+			rows = _real_rows(values, n_voxels)
+			scales, row_scales = _block_scales(rows, 1.0 if storage == 'half' else _INT16_MAX)
+			if storage == 'half':
+				stored = (rows / row_scales).astype(np.float16)
+			else:
+				stored = np.clip(np.rint(rows / row_scales), -_INT16_MAX, _INT16_MAX).astype(np.int16)
+			entry['scale_file'] = f"{direction}.{name}.scale.npy"
+			entry['block_voxels'] = QUANT_BLOCK_VOXELS
+			np.save(self._path(entry['scale_file']), scales)
+		np.save(self._path(entry['file']), stored)
+		entry.update(self._error_bounds(entry, values.reshape(n_voxels, -1), peak))
+		return entry
+
+	def _error_bounds(self, entry, original_rows, peak):
+		"""
+		保存した値を復元し、元の値との誤差 (最大絶対誤差、ピークに対する最大相対誤差、RMSの相対誤差) を返します。
+		"""
+		if entry['storage'] == 'native':
+			return {'max_abs_error': 0.0, 'max_rel_error': 0.0, 'rms_rel_error': 0.0}
+		max_error = 0.0
+		squared_error = 0.0
+		squared_value = 0.0
+		n_voxels = len(original_rows)
+		for start in range(0, n_voxels, _ERROR_CHUNK_VOXELS):
+			stop = min(start + _ERROR_CHUNK_VOXELS, n_voxels)
+			original = original_rows[start:stop]
+			error = np.abs(self._decode_rows(entry, start, stop).reshape(original.shape) - original)
+			if error.size:
+				max_error = max(max_error, float(error.max()))
+			squared_error += float((error ** 2).sum())
+			squared_value += float((np.abs(original) ** 2).sum())
+		return {'max_abs_error': max_error, 'max_rel_error': max_error / peak if peak > 0.0 else 0.0,
+			'rms_rel_error': float(np.sqrt(squared_error / squared_value)) if squared_value > 0.0 else 0.0}
+
+	def _decode_rows(self, entry, start, stop):
+		"""
+		ボクセル start から stop までの保存値を、形状 (ボクセル数, 成分数) の浮動小数点数に復元します。
+		"""
+		stored = self._mapped_array(entry['file'])
+		storage = entry.get('storage', 'native')
+		if storage in ('native', 'single'):
+			return np.asarray(stored.reshape(_row_count(entry), -1)[start:stop])
+		rows = np.asarray(stored[start:stop], dtype=np.float32)
+		# 以前の版の half (ブロックの倍率なし) は倍率を掛けない
+		if 'scale_file' in entry:
+			scales = self._mapped_array(entry['scale_file'])
+			rows *= scales[np.arange(start, stop) // entry['block_voxels']][:, np.newaxis]
+		if np.issubdtype(np.dtype(entry['dtype']), np.complexfloating):
+			rows = rows.view(np.complex64)
+		return rows
+
+	def has_array(self, direction, name):
+		return name in self.metadata(direction)['arrays']
+
+	def array_info(self, direction, name):
+		"""
+		配列のメタデータ (ファイル名、元の型と形状、保存形式、誤差) を返します。
+		"""
+		return self.metadata(direction)['arrays'][name]
+
+	def read(self, direction, name, mmap_mode='r'):
+		"""
+		配列を元の形状で読み込みます。native と single の形式で mmap_mode='r' (既定) の場合は、
+		メモリマップした読み取り専用の配列を返します。half と int16 の形式は復元した配列をメモリに読み込みます。
+		"""
+		entry = self.array_info(direction, name)
+		if 'body' in entry:
+			values = self._decode_rows(entry, 0, entry['rows']).reshape((entry['rows'],) + tuple(entry['shape'][3:]))
+			return scatter(values, self._body(entry['body']), entry['shape'])
+		if entry.get('storage', 'native') in ('native', 'single'):
+			return np.load(self._path(entry['file']), mmap_mode=mmap_mode)
+		return self._decode_rows(entry, 0, _row_count(entry)).reshape(entry['shape'])
+
+	def read_rows(self, direction, name, start=0, stop=None):
+		"""
+		平坦化したボクセル番号 (C順) の start から stop までの値を、形状 (ボクセル数,) + 成分の形状 で返します。
+		保存形式によらず、必要な範囲だけを読み込んで復元します。
+		"""
+		entry = self.array_info(direction, name)
+		n_voxels = int(np.prod(entry['shape'][:3]))
+		stop = n_voxels if stop is None else min(stop, n_voxels)
+		component_shape = tuple(entry['shape'][3:])
+		if 'body' not in entry:
+			return self._decode_rows(entry, start, stop).reshape((stop - start,) + component_shape)
+		body = self._body(entry['body'])
+		first, last = np.searchsorted(body, (start, stop))
+		values = self._decode_rows(entry, first, last).reshape((last - first,) + component_shape)
+		rows = np.zeros((stop - start,) + component_shape, dtype=values.dtype)
+		rows[body[first:last] - start] = values
+		return rows
+
+	def voxel_count(self, direction, name):
+		"""
+		配列が保存しているボクセルの数 (sparse の場合は人体のボクセル数) を返します。
+		"""
+		return _row_count(self.array_info(direction, name))
+
+	def read_voxels(self, direction, name, start=0, stop=None):
+		"""
+		保存したボクセルの start 番目から stop 番目までについて、(平坦化したボクセル番号 (C順), 値) を返します。
+		sparse の配列では人体のボクセルだけを、密な配列ではすべてのボクセルを順に返します。
+		"""
+		entry = self.array_info(direction, name)
+		n_rows = _row_count(entry)
+		stop = n_rows if stop is None else min(stop, n_rows)
+		values = self._decode_rows(entry, start, stop).reshape((stop - start,) + tuple(entry['shape'][3:]))
+		if 'body' in entry:
+			return self._body(entry['body'])[start:stop], values
+		return np.arange(start, stop), values
+
+	def voxel_layout(self, direction, name):
+		"""
+		配列のボクセルの並び (格子のハッシュ, sparse の場合は人体のボクセルの番号のハッシュ、密な場合はNone) を返します。
+		並びが同じ配列どうしは read_voxels() の値の位置が対応します。
+		"""
+		return self.metadata(direction)['grid'], self.array_info(direction, name).get('body')
+
+	def _body(self, key):
+		return self._mapped_array(f"_body_{key}.npy")
+
+	def body_index(self, direction):
+		"""
+		方向の格子の人体のボクセルの平坦化した番号 (C順、昇順) を返します。決まっていない場合はNoneです。
+		"""
+		key = self.metadata(direction)['grid']
+		return self._body(key) if os.path.exists(self._path(f"_body_{key}.npy")) else None
+
+	def write_body_index(self, axes, flat_indices):
+		"""
+		格子 axes の人体のボクセルの番号を保存します。その格子で sparse に保存済みの配列がある場合は変更できません。
+		"""
+		key = grid_hash(axes)
+		if any(entry.get('body') == key for direction in self.directions()
+				for entry in self.metadata(direction)['arrays'].values()):
+			raise ValueError(f"Arrays on grid {key} are already stored sparsely with the current body index.")
+		if not os.path.exists(self.directory):
+			os.makedirs(self.directory)
+		self._mapped.pop(f"_body_{key}.npy", None)
+		np.save(self._path(f"_body_{key}.npy"), np.unique(np.asarray(flat_indices, dtype=np.int64)))
+
+	def _body_index_for(self, key, arrays):
+		path = self._path(f"_body_{key}.npy")
+		if not os.path.exists(path):
+			if os.path.exists(self._path(f"_labels_{key}.npy")):
+				body = np.flatnonzero(self._mapped_array(f"_labels_{key}.npy").reshape(-1) > 0)
+			elif 'sar' in arrays:
+				body = np.flatnonzero(np.asarray(arrays['sar']).reshape(-1) > 0.0)
+			else:
+				return None
+			np.save(path, body.astype(np.int64))
+			_log.info("Body index of %d voxels created for grid %s.", len(body), key)
+		return self._body(key)
+
+	def axes(self, direction):
+		"""
+		方向の格子点の座標 (X, Y, Z) [m] を返します。同じ格子の方向では同じ配列を返します。
+		"""
+		key = self.metadata(direction)['grid']
+		if key not in self._axes:
+			with np.load(self._path(f"_grid_{key}.npz")) as grid:
+				self._axes[key] = (grid['x'], grid['y'], grid['z'])
+		return self._axes[key]
+
+	def write_labels(self, labels, axes, names=None, densities=None):
+		"""
+		格子 axes の組織ラベル (形状 (nx, ny, nz) の整数のボリューム。0は空気など組織以外) を保存します。
+		names はラベル -> 組織名、densities はラベル -> 質量密度 [kg/m^3] の辞書です。同じ格子の方向で共有します。
+		"""
+		labels = np.asarray(labels)
+		shape = tuple(len(axis) - 1 for axis in axes)
+		if labels.shape != shape:
+			raise ValueError(f"Label volume shape {labels.shape} does not match the grid {shape}.")
+		if not os.path.exists(self.directory):
+			os.makedirs(self.directory)
+		key = grid_hash(axes)
+		self._mapped.pop(f"_labels_{key}.npy", None)
+		np.save(self._path(f"_labels_{key}.npy"), np.ascontiguousarray(labels, dtype=np.int32))
+		table = {'names': {str(label): name for label, name in (names or {}).items()},
+			'densities': {str(label): float(density) for label, density in (densities or {}).items()}}
+		with open(self._path(f"_labels_{key}.json"), 'w', encoding='utf-8') as f:
+			json.dump(table, f, indent=1)
+
+	def _label_table(self, direction):
+		key = self.metadata(direction)['grid']
+		if not os.path.exists(self._path(f"_labels_{key}.npy")):
+			return None, {'names': {}, 'densities': {}}
+		with open(self._path(f"_labels_{key}.json"), 'r', encoding='utf-8') as f:
+			table = json.load(f)
+		return f"_labels_{key}.npy", table
+
+	def read_labels(self, direction):
+		"""
+		方向の格子の組織ラベルのボリュームと、ラベル -> 組織名の辞書を返します。保存されていない場合は (None, {}) です。
+		"""
+		filename, table = self._label_table(direction)
+		names = {int(label): name for label, name in table['names'].items()}
+		return (self._mapped_array(filename) if filename is not None else None), names
+
+	def read_densities(self, direction):
+		"""
+		方向の格子の組織ラベル -> 質量密度 [kg/m^3] の辞書を返します。
+		"""
+		return {int(label): density for label, density in self._label_table(direction)[1]['densities'].items()}
+
+
+def _row_count(entry):
+	return entry['rows'] if 'rows' in entry else int(np.prod(entry['shape'][:3]))
+
+
+def gather(volume, flat_indices):
+	"""
+	形状 (nx, ny, nz) + 成分の形状 のボリュームから、平坦化したボクセル番号 (C順) の値を取り出します。
+	"""
+	volume = np.asarray(volume)
+	return volume.reshape((-1,) + volume.shape[3:])[flat_indices]
+
+
+def scatter(values, flat_indices, shape):
+	"""
+	ボクセル番号 (C順) の値を、形状 shape の密なボリューム (他のボクセルは0) に戻します。
+	"""
+	shape = tuple(shape)
+	volume = np.zeros((int(np.prod(shape[:3])),) + shape[3:], dtype=np.asarray(values).dtype)
+	volume[flat_indices] = values
+	return volume.reshape(shape)
+
+
+def _real_rows(values, n_voxels):
+	"""
+	配列を形状 (ボクセル数, 列数) の実数に並べ替えます。複素数は実部と虚部を隣り合う列にします。
+	"""
+	rows = values.reshape(n_voxels, -1)
+	if np.iscomplexobj(rows):
+		rows = np.ascontiguousarray(rows).view(rows.real.dtype)
+	return rows
+
+
+def _block_scales(rows, full_scale):
+	"""
+	行 (ボクセル) のブロックごとの最大値を full_scale に対応させる倍率 (float32) と、行ごとの倍率 (形状 (ボクセル数, 1)) を返します。
+	保存値は 行 / 行ごとの倍率 です。
+	"""
+	n_voxels = len(rows)
+	starts = np.arange(0, n_voxels, QUANT_BLOCK_VOXELS)
+	peaks = np.maximum.reduceat(np.abs(rows).max(axis=1), starts) if n_voxels else np.zeros(0)
+	scales = (peaks / full_scale).astype(np.float32)
+	scales[scales == 0.0] = 1.0
+	return scales, np.repeat(scales, QUANT_BLOCK_VOXELS)[:n_voxels, np.newaxis]
+
+
+def export_simulation_fields(sim, store, direction, storage='native', sparse=False, **metadata):
+	"""
+	シミュレーションの Overall Field の電界とSARをストアに storage の形式で保存します (sparse は FieldStore.write() を参照)。
+	SARが取得できない場合は電界だけを保存します。
+
+	Returns:
+		bool: 電界を保存できた場合はTrue。
+	"""
+	extracted = analysis.extract_e_field_array(sim)
+	if extracted is None:
+		return False
+	e_field, axes = extracted
+	arrays = {'e_field': e_field}
+	sar = analysis.extract_sar_array(sim)
+	if sar is not None:
+		arrays['sar'] = sar[0]
+	store.write(direction, arrays, axes, storage=storage, sparse=sparse, **metadata)
+	return True
+
+
+def export_sweep_fields(sar_results, directory, frequency_mhz=None, storage='native', sparse=False):
+	"""
+	スイープの結果 (production ティアの行) のシミュレーションのフィールドを directory のストアに
+	storage の形式で (sparse=True の場合は人体のボクセルだけを) 保存します。
+
+	Returns:
+		int: 保存した方向の数。
+	"""
+	import s4l_v1.document as document
+
+	store = FieldStore(directory)
+	sim_map = {sim.Name: sim for sim in document.AllSimulations}
+	exported = 0
+	for row in sar_results:
+		if row.get('FidelityTier', 'production') != 'production':
+			continue
+		sim = sim_map.get(row['SimulationName'])
+		if sim is None:
+			_log.warning("Simulation '%s' not found for field export.", row['SimulationName'])
+			continue
+		if export_simulation_fields(sim, store, row['Direction'], storage=storage, sparse=sparse, theta=row['Theta'],
+				phi=row['Phi'], psi=row['Psi'], frequency_mhz=frequency_mhz, simulation=row['SimulationName']):
+			exported += 1
+	_log.info("Exported fields of %d simulations to '%s'.", exported, directory)
+	return exported
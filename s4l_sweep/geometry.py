@@ -0,0 +1,111 @@
+"""
+非一様な格子の幾何量 (セルの体積、セルの中心、ボクセルの質量) のキャッシュです。
+
+Automatic の格子は非一様なため、体積や質量で重みを付けた平均には3軸の np.diff の外積が必要で、
+フル解像度の人体モデルではこの計算が集計そのものと同じくらいの量になります。
+get_geometry() は格子点の座標のハッシュ (fields.grid_hash()) ごとに GridGeometry を1つだけ作成して保持し、
+同じモデルの格子のすべての方向と集計 (多重波の合成、ピラミッド、ホットスポット、組織ごとの内訳) で共有します。
+保持する格子は最近使用した MAX_CACHED_GEOMETRIES 個までで、モデルを閉じるとき (model.close_model()) にすべて破棄します。
+
+GridGeometry が返す配列は読み取り専用で、呼び出し側はコピーせずにそのまま (平坦化したビューやインデックスで) 使用します。
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+from collections import OrderedDict
+
+import numpy as np
+
+import _sweep_logging as sweep_logging
+from s4l_sweep import fields
+
+_log = sweep_logging.get_logger('geometry')
+
+# 保持する格子と、格子ごとのボクセルの質量 (ラベルの配列と密度の組み合わせ) の最大数
+MAX_CACHED_GEOMETRIES = 2
+MAX_CACHED_MASSES = 2
+
+# 格子のハッシュ -> GridGeometry (最近使用した順)
+_geometries = OrderedDict()
+
+
+def _read_only(array):
+	array.setflags(write=False)
+	return array
+
+
+class GridGeometry(object):
+	"""
+	1つの格子の幾何量です。各量は最初に参照した時点で計算し、以後は同じ配列を返します。
+	"""
+
+	def __init__(self, axes):
+		self.axes = tuple(_read_only(np.array(axis, dtype=np.float64)) for axis in axes)
+		self.key = fields.grid_hash(self.axes)
+		self.shape = tuple(len(axis) - 1 for axis in self.axes)
+		self.spacing = tuple(_read_only(np.diff(axis)) for axis in self.axes)
+		self.centers = tuple(_read_only(0.5 * (axis[:-1] + axis[1:])) for axis in self.axes)
+		self._volumes = None
+		self._masses = OrderedDict()
+
+	@property
+	def volumes(self):
+		"""
+		形状 (nx, ny, nz) のセルの体積 [m^3] です。
+		"""
+		if self._volumes is None:
+			dx, dy, dz = self.spacing
+			self._volumes = _read_only(dx[:, np.newaxis, np.newaxis] * dy[np.newaxis, :, np.newaxis]
+				* dz[np.newaxis, np.newaxis, :])
+		return self._volumes
+
+	@property
+	def flat_volumes(self):
+		"""
+		平坦化 (C順) したセルの体積 [m^3] です (volumes のビュー)。
+		"""
+		return self.volumes.reshape(-1)
+
+	def voxel_mass(self, labels, densities):
+		"""
+		組織ラベルと質量密度 (ラベル -> [kg/m^3]) から求めた、平坦化 (C順) したボクセルの質量 [kg] を返します。
+		密度のないラベル (0 を含む) の質量は0です。同じラベルの配列と密度の組み合わせでは同じ配列を返します。
+		保持するのは最近使用した MAX_CACHED_MASSES 個までで、古いものはラベルの配列への参照とともに破棄します。
+		"""
+		key = (id(labels), tuple(sorted(densities.items())))
+		if key in self._masses:
+			self._masses.move_to_end(key)
+		else:
+			flat_labels = np.asarray(labels).reshape(-1)
+			density_table = np.zeros(int(flat_labels.max()) + 1 if flat_labels.size else 1)
+			for label, density in densities.items():
+				if 0 <= label < len(density_table):
+					density_table[label] = density
+			# ラベルの配列への参照を保持し、id() が別の配列に再利用されないようにする
+			self._masses[key] = (labels, _read_only(self.flat_volumes * density_table[flat_labels]))
+			while len(self._masses) > MAX_CACHED_MASSES:
+				self._masses.popitem(last=False)
+		return self._masses[key][1]
+
+
+def get_geometry(axes):
+	"""
+	格子点の座標 (X, Y, Z) [m] の GridGeometry を返します。キャッシュにある間は同じ座標の格子で同じオブジェクトを返します。
+	"""
+	key = fields.grid_hash(axes)
+	if key in _geometries:
+		_geometries.move_to_end(key)
+		return _geometries[key]
+	_geometries[key] = GridGeometry(axes)
+	_log.debug("Grid geometry %s created for %s cells.", key, _geometries[key].shape)
+	while len(_geometries) > MAX_CACHED_GEOMETRIES:
+		evicted, _ = _geometries.popitem(last=False)
+		_log.debug("Grid geometry %s evicted from the cache.", evicted)
+	return _geometries[key]
+
+
+def clear_geometry_cache():
+	"""
+	格子の幾何量のキャッシュを破棄します。
+	"""
+	_geometries.clear()
@@ -0,0 +1,170 @@
+"""
+保存したSARのボリューム (FieldStore) の、全方向にわたるホットスポット (SARの大きいボクセル) の索引です。
+
+方向ごとに np.argpartition で上位 k 個のボクセルを取り出し、格子の位置、セルの中心の座標、組織ラベル、値、方向を
+コンパクトな表 (NumPyの構造化配列) にまとめます。全方向の表を値の降順に並べた索引を <ストア>/_hotspots_<配列名>.npz に保存し、
+「全入射方向で最もSARの大きい10か所」のような問い合わせは索引の先頭を読むだけで答えられます。
+
+組織ラベルはストアに保存したラベルのボリューム (FieldStore.write_labels()) から取り、ない場合は -1 です。
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+import csv
+import os
+
+import numpy as np
+
+import _sweep_logging as sweep_logging
+from s4l_sweep import fields
+from s4l_sweep import geometry
+
+_log = sweep_logging.get_logger('hotspots')
+
+HOTSPOT_DTYPE = np.dtype([('direction', np.int32), ('flat_index', np.int64), ('i', np.int32), ('j', np.int32),
+	('k', np.int32), ('x', np.float32), ('y', np.float32), ('z', np.float32), ('tissue', np.int32),
+	('value', np.float32)])
+HOTSPOT_FIELDNAMES = ['Rank', 'Direction', 'Value', 'X', 'Y', 'Z', 'I', 'J', 'K', 'TissueID', 'Tissue']
+DEFAULT_TOP_K = 10
+DEFAULT_BLOCK_VOXELS = 1 << 20
+
+
+def index_filename(name='sar'):
+	return f"_hotspots_{name}.npz"
+
+
+def _top_k(values, k):
+	"""
+	値の大きい順の上位 k 個の位置を返します (並びは値の降順)。
+	"""
+	if len(values) > k:
+		candidates = np.argpartition(values, len(values) - k)[-k:]
+	else:
+		candidates = np.arange(len(values))
+	return candidates[np.argsort(values[candidates])[::-1]]
+
+
+def direction_hotspots(store, direction, k=DEFAULT_TOP_K, name='sar', direction_id=0,
+		block_voxels=DEFAULT_BLOCK_VOXELS):
+	"""
+	方向の配列 name の上位 k 個のボクセルを、値の降順の HOTSPOT_DTYPE の配列で返します。
+	ボリュームはブロックごとに読み、ブロックの上位 k 個の候補から全体の上位 k 個を選びます。
+	人体のボクセルだけを保存した (sparse) 配列では、人体のボクセルだけを調べます。
+	"""
+	shape = tuple(store.array_info(direction, name)['shape'][:3])
+	n_voxels = store.voxel_count(direction, name)
+	candidate_indices = []
+	candidate_values = []
+	for start in range(0, n_voxels, block_voxels):
+		flat_indices, values = store.read_voxels(direction, name, start, start + block_voxels)
+		values = np.asarray(values, dtype=np.float64)
+		top = _top_k(values, k)
+		candidate_indices.append(flat_indices[top])
+		candidate_values.append(values[top])
+	indices = np.concatenate(candidate_indices)
+	values = np.concatenate(candidate_values)
+	top = _top_k(values, k)
+	indices, values = indices[top], values[top]
+
+	table = np.zeros(len(indices), dtype=HOTSPOT_DTYPE)
+	table['direction'] = direction_id
+	table['flat_index'] = indices
+	i, j, kk = np.unravel_index(indices, shape)
+	table['i'], table['j'], table['k'] = i, j, kk
+	for label, centers, position in zip('xyz', geometry.get_geometry(store.axes(direction)).centers, (i, j, kk)):
+		table[label] = centers[position]
+	labels, _ = store.read_labels(direction)
+	table['tissue'] = labels.reshape(-1)[indices] if labels is not None else -1
+	table['value'] = values
+	return table
+
+
+class HotspotIndex(object):
+	"""
+	全方向のホットスポットを値の降順に並べた索引です。
+	"""
+
+	def __init__(self, table, directions, tissue_names=None, name='sar'):
+		self.table = table
+		self.directions = list(directions)
+		self.tissue_names = tissue_names or {}
+		self.name = name
+
+	@classmethod
+	def build(cls, store, k=DEFAULT_TOP_K, name='sar', directions=None, block_voxels=DEFAULT_BLOCK_VOXELS):
+		"""
+		ストアの各方向の上位 k 個を求め、値の降順に並べた索引を作成します。
+		"""
+		directions = [d for d in (directions if directions is not None else store.directions())
+			if store.has_array(d, name)]
+		tables = [direction_hotspots(store, direction, k, name, direction_id, block_voxels)
+			for direction_id, direction in enumerate(directions)]
+		table = np.concatenate(tables) if tables else np.zeros(0, dtype=HOTSPOT_DTYPE)
+		table = table[np.argsort(table['value'], kind='stable')[::-1]]
+		tissue_names = {}
+		for direction in directions:
+			tissue_names.update(store.read_labels(direction)[1])
+		_log.info("Indexed %d hotspots of %d directions.", len(table), len(directions))
+		return cls(table, directions, tissue_names, name)
+
+	def save(self, directory):
+		path = os.path.join(directory, index_filename(self.name))
+		labels = sorted(self.tissue_names)
+		np.savez(path, table=self.table, directions=np.array(self.directions),
+			tissue_labels=np.array(labels, dtype=np.int32), tissue_names=np.array([self.tissue_names[l] for l in labels]))
+		return path
+
+	@classmethod
+	def load(cls, directory, name='sar'):
+		"""
+		保存した索引を読み込みます。ない場合はNoneを返します。
+		"""
+		path = os.path.join(directory, index_filename(name))
+		if not os.path.exists(path):
+			return None
+		with np.load(path) as saved:
+			tissue_names = dict(zip(saved['tissue_labels'].tolist(), saved['tissue_names'].tolist()))
+			return cls(saved['table'], saved['directions'].tolist(), tissue_names, name)
+
+	def top(self, n=10, direction=None, tissue=None):
+		"""
+		値の大きい順に n 個のホットスポットを辞書のリストで返します。direction (方向の名前) や
+		tissue (組織ラベル) を指定した場合は、その方向や組織のホットスポットに絞ります。
+		"""
+		table = self.table
+		if direction is not None:
+			if direction not in self.directions:
+				return []
+			table = table[table['direction'] == self.directions.index(direction)]
+		if tissue is not None:
+			table = table[table['tissue'] == tissue]
+		return [self._row(rank + 1, entry) for rank, entry in enumerate(table[:n])]
+
+	def _row(self, rank, entry):
+		tissue = int(entry['tissue'])
+		return {'Rank': rank, 'Direction': self.directions[entry['direction']], 'Value': float(entry['value']),
+			'X': float(entry['x']), 'Y': float(entry['y']), 'Z': float(entry['z']), 'I': int(entry['i']),
+			'J': int(entry['j']), 'K': int(entry['k']), 'TissueID': tissue, 'Tissue': self.tissue_names.get(tissue, '')}
+
+	def write_csv(self, filename, n=None):
+		"""
+		索引 (n を指定した場合は上位 n 個) をCSVに書き出します。
+		"""
+		with open(filename, 'w', newline='') as f:
+			writer = csv.DictWriter(f, fieldnames=HOTSPOT_FIELDNAMES)
+			writer.writeheader()
+			writer.writerows(self.top(len(self.table) if n is None else n))
+		_log.info("Hotspot index written to %s", filename)
+
+
+def build_hotspot_index(output_dir, model_name, k=DEFAULT_TOP_K, name='sar'):
+	"""
+	<output_dir>/<モデル名>_fields のストアの索引を作成して保存し、<モデル名>_hotspots.csv に書き出します。
+
+	Returns:
+		HotspotIndex: 作成した索引。
+	"""
+	store = fields.FieldStore(fields.fields_dir(output_dir, model_name))
+	index = HotspotIndex.build(store, k, name)
+	index.save(store.directory)
+	index.write_csv(os.path.join(output_dir, f"{model_name}_hotspots.csv"))
+	return index
@@ -0,0 +1,126 @@
+from __future__ import absolute_import
+from __future__ import print_function
+
+import _sweep_logging as sweep_logging
+
+_log = sweep_logging.get_logger('materials')
+
+# 材料データベースのライブラリ名
+DATABASE_NAME = "IT'IS 4.1"
+# データベースにリンクできない場合の特性 (質量密度[kg/m^3], 導電率[S/m], 比誘電率)。1 GHzでの値
+FALLBACK_PROPERTIES = {
+	'Fat': (911.0, 0.11638198214029223, 11.29425354244377),
+	'Skin': (1109.0, 0.8997924135002646, 40.936135452253346),
+	'Muscle': (1090.4, 0.9782042083052804, 54.81107626413944),
+}
+# 組織エンティティへの材料の割り当て。Noneの材料には、他の材料に割り当てていない組織をすべて割り当てる
+TISSUE_MATERIALS = [
+	('Fat', ["Tissue_50"]),
+	('Skin', ["Tissue_47"]),
+	('Muscle', None),
+]
+# デバッグ用シンプルモデルの材料の特性 (質量密度[kg/m^3], 導電率[S/m], 比誘電率)
+DEBUG_MATERIAL_PROPERTIES = (1000.0, 0.5, 50.0)
+
+# 材料名 -> データベースの材料 (見つからなかった場合はその例外)。データベースはモデルに依存しないため、
+# 同じプロセスで開くすべてのモデルのシミュレーションで再利用する
+_database_materials = {}
+
+
+def _set_properties(material_settings, name, properties):
+	from s4l_v1 import Unit
+
+	mass_density, conductivity, relative_permittivity = properties
+	material_settings.Name = name
+	material_settings.MassDensity = mass_density, Unit("kg/m^3")
+	material_settings.ElectricProps.Conductivity = conductivity, Unit("S/m")
+	material_settings.ElectricProps.RelativePermittivity = relative_permittivity
+
+
+def get_database_material(name):
+	"""
+	データベースの材料 name を返します。検索結果はキャッシュし、2回目以降はデータベースを検索しません。
+	見つからない場合は、検索時の例外を送出します。
+	"""
+	if name not in _database_materials:
+		import s4l_v1.materials.database as database
+
+		try:
+			_database_materials[name] = database[DATABASE_NAME][name]
+		except Exception as e:
+			_database_materials[name] = e
+	material = _database_materials[name]
+	if isinstance(material, Exception):
+		raise material
+	return material
+
+
+def clear_material_cache():
+	"""
+	データベースの材料のキャッシュを破棄します。
+	"""
+	_database_materials.clear()
+
+
+def add_material(sim, name, components):
+	"""
+	データベースの材料 name にリンクしたMaterialSettingsを作成し、componentsに割り当てます。
+	リンクできない場合は FALLBACK_PROPERTIES の値を使用します。componentsが空の場合は追加しません。
+
+	Returns:
+		MaterialSettings: 作成した材料設定。
+	"""
+	import s4l_v1.simulation.emfdtd as fdtd
+
+	material_settings = fdtd.MaterialSettings()
+	try:
+		sim.LinkMaterialWithDatabase(material_settings, get_database_material(name))
+	except Exception as e:
+		_log.warning("'%s' material not found in database or linking failed (%s). Using fallback values for %s.",
+			name, e, sim.Name)
+		_set_properties(material_settings, name, FALLBACK_PROPERTIES[name])
+	if components:
+		sim.Add(material_settings, components)
+	return material_settings
+
+
+def add_tissue_materials(sim, mapped_entities):
+	"""
+	TISSUE_MATERIALS に従って組織エンティティに材料を割り当てます。
+
+	Args:
+		sim: FDTDシミュレーション。
+		mapped_entities (dict): 名前 -> エンティティの辞書 (model.map_entities() の結果)。
+
+	Returns:
+		list: グリッド計画用の (MaterialSettings, コンポーネントのリスト) のリスト。
+			コンポーネントがない材料は含みません。
+	"""
+	assigned = set()
+	for _, names in TISSUE_MATERIALS:
+		assigned.update(names or [])
+
+	material_groups = []
+	for name, names in TISSUE_MATERIALS:
+		if names is None:
+			names = [n for n in mapped_entities if n.startswith("Tissue_") and n not in assigned]
+		components = [mapped_entities[n] for n in names if n in mapped_entities]
+		material_settings = add_material(sim, name, components)
+		if components:
+			material_groups.append((material_settings, components))
+	return material_groups
+
+
+def add_debug_material(sim, components):
+	"""
+	デバッグ用シンプルモデルの材料を作成してcomponentsに割り当てます。
+
+	Returns:
+		list: グリッド計画用の (MaterialSettings, コンポーネントのリスト) のリスト。
+	"""
+	import s4l_v1.simulation.emfdtd as fdtd
+
+	material_settings = fdtd.MaterialSettings()
+	_set_properties(material_settings, "DebugMaterial", DEBUG_MATERIAL_PROPERTIES)
+	sim.Add(material_settings, components)
+	return [(material_settings, components)]
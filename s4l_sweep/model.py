@@ -0,0 +1,212 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import gc
+import os
+
+import _domain_planner as domain_planner
+import _resource_estimator as resource_estimator
+import _sweep_logging as sweep_logging
+
+_log = sweep_logging.get_logger('model')
+
+# 平面波ソースと計算領域を兼ねるWire Blockの名前
+SOURCE_ENTITY_NAME = "Wire Block 1"
+# 人体モデルの組織エンティティの名前 (欠番の Tissue_3, 16, 27, 36, 40, 41 はモデルに存在しない)
+TISSUE_ENTITY_NAMES = [
+	"Tissue_0", "Tissue_1", "Tissue_10", "Tissue_11", "Tissue_12", "Tissue_13", "Tissue_14", "Tissue_15",
+	"Tissue_17", "Tissue_18", "Tissue_19", "Tissue_2", "Tissue_20", "Tissue_21", "Tissue_22", "Tissue_23",
+	"Tissue_24", "Tissue_25", "Tissue_26", "Tissue_28", "Tissue_29", "Tissue_30", "Tissue_31", "Tissue_32",
+	"Tissue_33", "Tissue_34", "Tissue_35", "Tissue_37", "Tissue_38", "Tissue_39", "Tissue_4", "Tissue_42",
+	"Tissue_43", "Tissue_44", "Tissue_45", "Tissue_46", "Tissue_47", "Tissue_48", "Tissue_49", "Tissue_5",
+	"Tissue_50", "Tissue_51", "Tissue_52", "Tissue_53", "Tissue_54", "Tissue_55", "Tissue_56", "Tissue_6",
+	"Tissue_7", "Tissue_8", "Tissue_9",
+]
+# デバッグ用シンプルモデルのエンティティの名前
+DEBUG_BOX_NAME = "Debug Box"
+DEBUG_SOURCE_NAME = "Debug Source Wire"
+# ドキュメントが未保存の場合のモデル名
+DEFAULT_MODEL_NAME = "Standing Model"
+
+# 名前 -> エンティティの索引と、索引を作成したドキュメントのファイル名。
+# モデルを開く・閉じる・このモジュールでエンティティを作り直すたびに破棄する
+_entity_index = None
+_entity_index_file = None
+
+
+def get_model_name():
+	"""
+	Sim4Lifeドキュメントのファイル名 (拡張子なし) をモデル名として返します。
+	ドキュメントが未保存の場合は DEFAULT_MODEL_NAME を返します。
+	"""
+	import s4l_v1.document as document
+
+	smash_file_path = document.FileName
+	if not smash_file_path:
+		_log.info("Document not saved. Using default model name: '%s'.", DEFAULT_MODEL_NAME)
+		return DEFAULT_MODEL_NAME
+	model_name = os.path.splitext(os.path.basename(smash_file_path))[0]
+	_log.info("Document saved at '%s'. Using model name: '%s'.", smash_file_path, model_name)
+	return model_name
+
+
+def open_model(smash_path):
+	"""
+	smash_path のプロジェクトを開きます。開いているドキュメントは閉じられます。
+
+	Returns:
+		str: 開いたドキュメントのモデル名 (get_model_name() の値)。
+	"""
+	import s4l_v1.document as document
+
+	_log.info("Opening project '%s'.", smash_path)
+	clear_entity_index()
+	document.Open(smash_path)
+	return get_model_name()
+
+
+def close_model():
+	"""
+	開いているドキュメントを空の新しいドキュメントに置き換え、エンティティの索引と格子の幾何量のキャッシュを破棄してメモリを解放します。
+	"""
+	import s4l_v1.document as document
+	from s4l_sweep import geometry
+
+	clear_entity_index()
+	geometry.clear_geometry_cache()
+	document.New()
+	gc.collect()
+
+
+def save_model(smash_path=None):
+	"""
+	ドキュメントを保存します。smash_path を指定した場合はそのパスに別名で保存し、
+	以後のシミュレーションの結果もそのプロジェクトの結果フォルダーに書き出されます。
+	"""
+	import s4l_v1.document as document
+
+	if smash_path is None:
+		document.Save()
+		return
+	directory = os.path.dirname(smash_path)
+	if directory and not os.path.exists(directory):
+		os.makedirs(directory)
+	_log.info("Saving project as '%s'.", smash_path)
+	document.SaveAs(smash_path)
+
+
+def clear_entity_index():
+	"""
+	エンティティの索引を破棄します。このモジュールの外でエンティティを追加・削除・改名した場合に呼び出します。
+	"""
+	global _entity_index
+	_entity_index = None
+
+
+def _get_entity_index():
+	global _entity_index, _entity_index_file
+	import s4l_v1.document as document
+
+	if _entity_index is None or _entity_index_file != document.FileName:
+		import s4l_v1.model as model
+
+		_entity_index = {}
+		for entity in model.AllEntities():
+			_entity_index.setdefault(entity.Name, entity)
+		_entity_index_file = document.FileName
+	return _entity_index
+
+
+def map_entities(names):
+	"""
+	名前のリストに対応するモデルエンティティを取得します。
+	モデルのエンティティは最初の呼び出しで索引にまとめ、以後のシミュレーションでは索引を再利用します。
+
+	Returns:
+		tuple: (名前 -> エンティティの辞書, モデルに存在しない名前のリスト)。
+	"""
+	entity_index = _get_entity_index()
+	mapped_entities = {}
+	missing_names = []
+	for name in names:
+		if name in entity_index:
+			mapped_entities[name] = entity_index[name]
+		else:
+			missing_names.append(name)
+	return mapped_entities, missing_names
+
+
+def get_tissue_entities():
+	"""
+	モデル内の 'Tissue_' で始まる名前のエンティティのリストを返します。
+	"""
+	return [e for name, e in _get_entity_index().items() if name.startswith("Tissue_")]
+
+
+def create_model(fit_to_phantom=True, frequency_mhz=1000.0):
+	"""
+	Sim4Lifeドキュメントに SOURCE_ENTITY_NAME のエンティティが存在しない場合に、
+	新しいWire Blockを作成します。
+	fit_to_phantom=Trueの場合は、組織エンティティの和集合に波長と吸収境界に基づく余白を加えた
+	大きさで作成し、既存のボックスも同じ大きさに合わせます。
+	"""
+	import s4l_v1.model as model
+	from s4l_v1.model import Vec3
+
+	# スイープの開始時に呼ばれるため、ここで索引を作り直してスイープ中は再利用する
+	clear_entity_index()
+	entities = model.AllEntities()
+
+	if fit_to_phantom:
+		tissue_bboxes = resource_estimator.get_entity_bounding_boxes(get_tissue_entities())
+		domain_bbox = domain_planner.plan_domain(tissue_bboxes, frequency_mhz * 1e6)
+		if domain_bbox is not None:
+			domain_planner.fit_source_box(domain_bbox, SOURCE_ENTITY_NAME)
+			clear_entity_index()
+			return
+		_log.warning("No tissue entities found. Falling back to the fixed-size '%s'.", SOURCE_ENTITY_NAME)
+
+	if SOURCE_ENTITY_NAME in entities:
+		_log.info("'%s' already exists in the document. Skipping creation.", SOURCE_ENTITY_NAME)
+	else:
+		_log.info("'%s' not found. Creating a new one.", SOURCE_ENTITY_NAME)
+		wire = model.CreateWireBlock(p0=Vec3(-100, -100, -100), p1=Vec3(1800, 1800, 1800), parametrized=True)
+		wire.Name = SOURCE_ENTITY_NAME
+		clear_entity_index()
+
+
+def create_debug_model():
+	"""
+	シンプルなデバッグ用ボックスとワイヤーを作り直します。既存のデバッグ用エンティティは削除します。
+	"""
+	import s4l_v1.model as model
+	from s4l_v1.model import Vec3
+
+	entities_to_delete, _ = map_entities([DEBUG_BOX_NAME, DEBUG_SOURCE_NAME])
+	if entities_to_delete:
+		model.Delete(list(entities_to_delete.values()))
+		_log.info("Deleted existing debug model entities.")
+
+	wire = model.CreateWireBlock(p0=Vec3(-10, -10, -10), p1=Vec3(10, 10, 10), parametrized=True)
+	box = model.CreateSolidBlock(p0=Vec3(-50, -50, -50), p1=Vec3(50, 50, 50), parametrized=True)
+	box.Name = DEBUG_BOX_NAME
+	wire.Name = DEBUG_SOURCE_NAME
+	clear_entity_index()
+	_log.info("%s and %s created.", DEBUG_BOX_NAME, DEBUG_SOURCE_NAME)
+
+
+def delete_all_simulations():
+	"""
+	ドキュメント内のすべてのシミュレーションを削除します。
+	"""
+	import s4l_v1.document as document
+
+	_log.info("--- Deleting existing simulations in document ---")
+	# 反復中にコレクションを変更しないよう、先にリストに変換する
+	sims_to_delete = list(document.AllSimulations)
+	if not sims_to_delete:
+		_log.info("No existing simulations to delete.")
+		return
+	for sim_to_delete in sims_to_delete:
+		_log.info("Deleting simulation: %s", sim_to_delete.Name)
+		document.AllSimulations.Remove(sim_to_delete)
+	_log.info("All existing simulations deleted.")
@@ -0,0 +1,220 @@
+"""
+保存済みの単一平面波のフィールドを重ね合わせた、多重波 (マルチパス) 環境のモンテカルロ合成です。
+
+現実の曝露は、ランダムな位相と方向から到来する多数の平面波の和です (standing* のスクリプトの定在波環境など)。
+フィールドは入射波の振幅に対して線形なので、方向・偏波ごとに1回ずつ計算した電界 E_i を保存しておけば、
+任意の複素係数 c_i の環境の電界は E = Σ c_i E_i で、ソルバーを追加で実行せずに求められます。
+
+ボクセルごとのSARは |E|² に比例するため、保存したSARと電界から係数 k = SAR / |E|² (= σ / 2ρ) を求め、
+合成した電界から SAR = k |E|² を計算します。人体の外 (SARが0のボクセル) は k = 0 です。
+
+全身平均SARは吸収電力 / 質量 (Σ SAR m / Σ m) で、ボクセルの質量はストアに保存した組織ラベルと質量密度
+(FieldStore.write_labels()) から求めます。ラベルがない場合は質量を求められないため、体積平均SAR
+(Σ SAR V / Σ V) を 'VolumeAverageSAR' として出力します。
+
+実現値 (realization) の係数は行列 C (実現値数, 波数) にまとめ、ボクセルのブロックごとに C @ E[:, ブロック] の
+行列積で全実現値の電界を一度に求めます。必要なメモリは実現値のバッチ × ブロックのボクセル数で抑えられ、
+フィールドは FieldStore からブロックの範囲だけを読むため、ボリューム全体をメモリに載せません。
+人体のボクセルだけを保存した (sparse) フィールドでは、空気のボクセルを読まずに人体のボクセルのブロックだけを処理します。
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+import csv
+import os
+
+import numpy as np
+
+import _sweep_logging as sweep_logging
+from s4l_sweep import fields
+from s4l_sweep import geometry
+from s4l_sweep import tissues
+
+_log = sweep_logging.get_logger('multipath')
+
+AMPLITUDE_MODELS = ('rayleigh', 'constant')
+PERCENTILES = (5, 50, 95, 99)
+MULTIPATH_FIELDNAMES = ['ModelName', 'Quantity', 'Realizations', 'Waves', 'Mean', 'P5', 'P50', 'P95', 'P99', 'Max']
+DEFAULT_BLOCK_VOXELS = 16384
+DEFAULT_REALIZATION_BATCH = 256
+# |E|² がこれ以下のボクセルは係数 k を0とする (人体の外や電界がほぼ0の点)
+_MIN_E_SQUARED = 1e-30
+
+
+def realization_coefficients(n_realizations, weights, amplitude='rayleigh', seed=None):
+	"""
+	多重波の実現値ごとの複素係数 (実現値数, 波数) を返します。
+
+	位相はすべて一様乱数です。amplitude='rayleigh' では振幅がレイリー分布 (係数が複素正規分布) に従い、
+	波ごとの電力の配分も実現値ごとにランダムになります。'constant' では振幅を sqrt(重み) に固定します。
+	どちらも波の平均電力は weights に比例し、実現値ごとに Σ|c_i|² = 1 (入射電力の合計が1波分) に正規化します。
+	"""
+	if amplitude not in AMPLITUDE_MODELS:
+		raise ValueError(f"amplitude must be one of {AMPLITUDE_MODELS} (got {amplitude!r}).")
+	rng = np.random.default_rng(seed)
+	weights = np.asarray(weights, dtype=float)
+	weights = weights / weights.sum()
+	shape = (n_realizations, len(weights))
+	phases = np.exp(2j * np.pi * rng.random(shape))
+	if amplitude == 'rayleigh':
+		magnitudes = np.sqrt(rng.exponential(1.0, shape) * weights)
+	else:
+		magnitudes = np.broadcast_to(np.sqrt(weights), shape)
+	coefficients = magnitudes * phases
+	coefficients /= np.sqrt((np.abs(coefficients) ** 2).sum(axis=1, keepdims=True))
+	return coefficients.astype(np.complex64)
+
+
+def _check_same_layout(store, directions):
+	"""
+	すべての方向の電界とSARが同じ格子で、保存したボクセルの並び (密、または同じ人体のボクセル) が同じか確認します。
+	"""
+	layouts = set(store.voxel_layout(direction, name) for direction in directions for name in ('e_field', 'sar'))
+	if len(layouts) > 1:
+		_log.error("Stored fields use %d different grids or voxel layouts. Multipath synthesis needs a single layout.",
+			len(layouts))
+		return False
+	return True
+
+
+def _voxel_weights(store, direction):
+	"""
+	平均SARの重み (平坦化したボクセルの値) と、その平均の量の名前を返します。
+	組織ラベルが保存されている場合はボクセルの質量 [kg] と 'WholeBodyAverageSAR'、ない場合はセルの体積 [m^3] と
+	'VolumeAverageSAR' です。
+	"""
+	grid = geometry.get_geometry(store.axes(direction))
+	labels, names = store.read_labels(direction)
+	if labels is None:
+		_log.warning("No tissue labels stored for '%s'. Reporting the volume-average SAR instead of the whole-body "
+			"(mass-average) SAR.", store.directory)
+		return grid.flat_volumes, 'VolumeAverageSAR'
+	densities = store.read_densities(direction) or tissues.default_densities(names)
+	return grid.voxel_mass(labels, densities), 'WholeBodyAverageSAR'
+
+
+def synthesize(store, directions=None, weights=None, n_realizations=1000, amplitude='rayleigh', seed=None,
+		frequency_mhz=None, block_voxels=DEFAULT_BLOCK_VOXELS, realization_batch=DEFAULT_REALIZATION_BATCH):
+	"""
+	保存済みのフィールドを重ね合わせた多重波環境の実現値ごとのSARを計算します。
+
+	Args:
+		store (FieldStore): 電界 ('e_field') とSAR ('sar') を保存したストア。
+		directions (list): 重ね合わせる方向 (名前サフィックス) のリスト。Noneの場合はストアのすべての方向。
+		weights (dict): 方向 -> 平均電力の重み (spec.simulation_config_weights() の値など)。Noneの場合は等しい重み。
+		n_realizations (int): 実現値の数。
+		amplitude (str): 振幅のモデル ('rayleigh' または 'constant')。
+		seed (int): 乱数のシード。
+		frequency_mhz (float): 指定した場合は、この周波数で保存した方向だけを使用します。
+		block_voxels (int): 1回の行列積で処理するボクセル数。
+		realization_batch (int): 1回の行列積で処理する実現値の数。
+
+	Returns:
+		dict: 'peak_sar' (実現値ごとのボクセルの最大SAR), 'mean_sar' (実現値ごとの人体の平均SAR),
+		'mean_quantity' (平均SARの量の名前。_voxel_weights() を参照), 'directions' (使用した方向),
+		'coefficients' (係数の行列)。計算できない場合はNone。
+	"""
+	directions = list(directions) if directions is not None else store.directions()
+	directions = [d for d in directions if store.has_array(d, 'e_field') and store.has_array(d, 'sar')]
+	if frequency_mhz is not None:
+		directions = [d for d in directions if store.metadata(d).get('frequency_mhz') == frequency_mhz]
+	if not directions:
+		_log.error("No stored fields with both E and SAR found in '%s'.", store.directory)
+		return None
+	frequencies = set(store.metadata(d).get('frequency_mhz') for d in directions)
+	if len(frequencies) > 1:
+		_log.error("Stored fields have %d different frequencies. Specify frequency_mhz.", len(frequencies))
+		return None
+	if not _check_same_layout(store, directions):
+		return None
+	if weights is None:
+		wave_weights = np.ones(len(directions))
+	else:
+		missing = [d for d in directions if d not in weights]
+		if missing:
+			_log.warning("%d stored directions have no weight and are skipped.", len(missing))
+		directions = [d for d in directions if d in weights]
+		wave_weights = np.array([weights[d] for d in directions], dtype=float)
+	coefficients = realization_coefficients(n_realizations, wave_weights, amplitude, seed)
+
+	voxel_weights, mean_quantity = _voxel_weights(store, directions[0])
+	e_shape = store.array_info(directions[0], 'e_field')['shape']
+	n_voxels = store.voxel_count(directions[0], 'e_field')
+	n_components = int(np.prod(e_shape[3:]))
+	n_waves = len(directions)
+
+	peak_sar = np.zeros(n_realizations)
+	absorbed = np.zeros(n_realizations)
+	body_weight = 0.0
+	for start in range(0, n_voxels, block_voxels):
+		stop = min(start + block_voxels, n_voxels)
+		block = np.empty((n_waves, stop - start, n_components), dtype=np.complex64)
+		sar_sum = np.zeros(stop - start)
+		for index, direction in enumerate(directions):
+			flat_indices, values = store.read_voxels(direction, 'e_field', start, stop)
+			block[index] = values.reshape(stop - start, n_components)
+			sar_sum += store.read_voxels(direction, 'sar', start, stop)[1]
+		e_squared_sum = (np.abs(block) ** 2).sum(axis=(0, 2))
+		# 方向によって電界がほぼ0の点があるため、全方向の和の比として係数を求める
+		body = (sar_sum > 0.0) & (e_squared_sum > _MIN_E_SQUARED)
+		if not body.any():
+			continue
+		block = block[:, body].reshape(n_waves, -1)
+		factor = sar_sum[body] / e_squared_sum[body]
+		weights_in_block = voxel_weights[flat_indices[body]]
+		body_weight += weights_in_block.sum()
+		for r_start in range(0, n_realizations, realization_batch):
+			r_stop = min(r_start + realization_batch, n_realizations)
+			total = (coefficients[r_start:r_stop] @ block).reshape(r_stop - r_start, -1, n_components)
+			sar = factor * (np.abs(total) ** 2).sum(axis=2)
+			np.maximum(peak_sar[r_start:r_stop], sar.max(axis=1), out=peak_sar[r_start:r_stop])
+			absorbed[r_start:r_stop] += sar @ weights_in_block
+	if body_weight == 0.0:
+		_log.error("No tissue voxels found in the stored SAR.")
+		return None
+	_log.info("Synthesized %d multipath realizations from %d plane waves over %d voxels.", n_realizations, n_waves,
+		n_voxels)
+	return {'peak_sar': peak_sar, 'mean_sar': absorbed / body_weight, 'mean_quantity': mean_quantity,
+		'directions': directions, 'coefficients': coefficients}
+
+
+def summarize(samples):
+	"""
+	サンプルの平均、パーセンタイル (PERCENTILES) と最大値の辞書を返します。
+	"""
+	summary = {'Mean': float(np.mean(samples)), 'Max': float(np.max(samples))}
+	for percentile, value in zip(PERCENTILES, np.percentile(samples, PERCENTILES)):
+		summary[f"P{percentile}"] = float(value)
+	return summary
+
+
+def run_multipath_analysis(output_dir, model_name, weights=None, n_realizations=1000, amplitude='rayleigh', seed=None,
+		frequency_mhz=None, block_voxels=DEFAULT_BLOCK_VOXELS, realization_batch=DEFAULT_REALIZATION_BATCH):
+	"""
+	<output_dir>/<モデル名>_fields のフィールドから多重波環境のSARの分布を求め、
+	パーセンタイルを <モデル名>_multipath_sar.csv に、実現値ごとのサンプルを <モデル名>_multipath_sar.npz に書き出します。
+	frequency_mhz を指定した場合は、ファイル名のモデル名の後に周波数 (例: _900MHz) を付けます。
+
+	Returns:
+		dict: synthesize() の結果。計算できない場合はNone。
+	"""
+	store = fields.FieldStore(fields.fields_dir(output_dir, model_name))
+	result = synthesize(store, weights=weights, n_realizations=n_realizations, amplitude=amplitude, seed=seed,
+		frequency_mhz=frequency_mhz, block_voxels=block_voxels, realization_batch=realization_batch)
+	if result is None:
+		return None
+	prefix = model_name if frequency_mhz is None else f"{model_name}_{frequency_mhz:g}MHz"
+	rows = []
+	for quantity, key in (('PeakSAR', 'peak_sar'), (result['mean_quantity'], 'mean_sar')):
+		row = {'ModelName': model_name, 'Quantity': quantity, 'Realizations': n_realizations,
+			'Waves': len(result['directions'])}
+		row.update(summarize(result[key]))
+		rows.append(row)
+	csv_path = os.path.join(output_dir, f"{prefix}_multipath_sar.csv")
+	with open(csv_path, 'w', newline='') as f:
+		writer = csv.DictWriter(f, fieldnames=MULTIPATH_FIELDNAMES)
+		writer.writeheader()
+		writer.writerows(rows)
+	np.savez(os.path.join(output_dir, f"{prefix}_multipath_sar.npz"), peak_sar=result['peak_sar'],
+		mean_sar=result['mean_sar'], directions=np.array(result['directions']))
+	_log.info("Multipath SAR distribution written to %s", csv_path)
+	return result
@@ -0,0 +1,79 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import csv
+import os
+
+import _sweep_logging as sweep_logging
+
+_log = sweep_logging.get_logger('output')
+
+# スイープ結果のCSVの列
+SAR_FIELDNAMES = ['ModelName', 'SimulationName', 'Direction', 'Theta', 'Phi', 'Psi', 'FidelityTier', 'MassAveragedSAR']
+# 求積による等方平均SARのCSVの列
+ISOTROPIC_FIELDNAMES = ['ModelName', 'FrequencyMHz', 'DirectionScheme', 'DirectionOrder', 'Directions', 'WeightCovered',
+	'IsotropicAverageSAR']
+# アドミッション制御で除いたシミュレーション設定のCSVの列
+DROPPED_CONFIG_FIELDNAMES = ['ModelName', 'Direction', 'Theta', 'Phi', 'Psi', 'Reason']
+
+
+def _read_header(filename):
+	"""
+	CSVファイルのヘッダー行 (列名のリスト) を返します。空のファイルの場合は空のリストです。
+	"""
+	with open(filename, 'r', newline='', encoding='utf-8') as csvfile:
+		return next(csv.reader(csvfile), [])
+
+
+def _rotate_file(filename):
+	"""
+	filename を <名前>.<番号><拡張子> (使われていない最小の番号) に名前を変更し、変更後のパスを返します。
+	"""
+	base, ext = os.path.splitext(filename)
+	index = 1
+	while os.path.exists(f"{base}.{index}{ext}"):
+		index += 1
+	rotated = f"{base}.{index}{ext}"
+	os.rename(filename, rotated)
+	return rotated
+
+
+def write_sar_results_to_csv(results_list, filename, fieldnames=SAR_FIELDNAMES):
+	"""
+	SAR解析結果のリストをCSVファイルに書き込みます。
+	ファイルが存在しない場合はヘッダー行を作成し、存在する場合はデータを追記します。
+	既存のファイルの列が fieldnames と異なる場合 (以前の版で作成した列の少ないファイルなど) は、
+	行がずれないよう既存のファイルを <名前>.<番号>.csv に名前を変更して退避し、新しいファイルに書き込みます。
+
+	Args:
+		results_list (list): 各要素がSAR結果の辞書のリスト。fieldnamesにない列は空欄になります。
+		filename (str): 出力するCSVファイルのパス。
+		fieldnames (list): CSVの列名。
+	"""
+	file_exists = os.path.exists(filename)
+	if file_exists:
+		header = _read_header(filename)
+		if header != list(fieldnames):
+			rotated = _rotate_file(filename)
+			_log.warning("Columns of '%s' (%s) differ from %s. Existing file moved to '%s'.", filename,
+				", ".join(header), ", ".join(fieldnames), rotated)
+			file_exists = False
+	with open(filename, 'a' if file_exists else 'w', newline='', encoding='utf-8') as csvfile:
+		writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+		if not file_exists:
+			writer.writeheader()
+		for row in results_list:
+			writer.writerow(row)
+	_log.info("Results successfully written to '%s'.", filename)
+
+
+def read_committed_simulation_names(filename):
+	"""
+	CSVファイルに書き込み済みの SimulationName の集合を返します。ファイルが読めない場合は空の集合です。
+	生の出力を削除する前に、抽出した値がCSVに保存されていることの確認に使用します。
+	"""
+	try:
+		with open(filename, 'r', newline='', encoding='utf-8') as csvfile:
+			return {row['SimulationName'] for row in csv.DictReader(csvfile) if row.get('SimulationName')}
+	except (OSError, KeyError, csv.Error) as e:
+		_log.error("Failed to read committed results from '%s': %s", filename, e)
+		return set()
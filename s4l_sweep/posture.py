@@ -0,0 +1,312 @@
+"""
+複数のエンティティをまとめて姿勢 (ポーズ) ごとに移動する変換エンジンと、ポーズのスイープです。
+
+_rotate_and_translate.rotate_and_translate_object() は1つのオブジェクトを名前で探し、回転してから平行移動します。
+ここでは同じ「回転してから平行移動」の変換を NumPy の4x4同次変換行列で合成し、エンティティのグループ
+(例: 右腕の組織) ごとに基準姿勢からの変換としてポーズを定義します。長さの単位はモデルと同じ mm です。
+
+ポーズを切り替えるときは、現在のポーズからの差分の変換だけをグループの全エンティティに適用します。
+差分の変換はポーズの組み合わせごとにキャッシュし、同じ切り替えでは作り直しません。
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+import functools
+import itertools
+import math
+import os
+
+import numpy as np
+
+import _domain_planner as domain_planner
+import _resource_estimator as resource_estimator
+import _sweep_logging as sweep_logging
+from s4l_sweep import model as sweep_model
+from s4l_sweep import output
+
+_log = sweep_logging.get_logger('posture')
+
+# 基準姿勢 (読み込んだままのモデル) のポーズ名
+REFERENCE_POSE = 'reference'
+# ポーズスイープの結果のCSVの列
+POSE_SAR_FIELDNAMES = ['Pose'] + output.SAR_FIELDNAMES
+# 単位行列とみなす差分の許容誤差
+_IDENTITY_TOLERANCE = 1e-9
+
+
+def rotation_matrix(axis, angle_deg, center_mm=None):
+	"""
+	center_mm (Noneの場合は原点) を通る axis 周りに angle_deg [度] 回転する4x4行列を返します。
+	"""
+	u = np.asarray(axis, dtype=float)
+	u = u / np.linalg.norm(u)
+	angle = math.radians(angle_deg)
+	cross = np.array([[0.0, -u[2], u[1]], [u[2], 0.0, -u[0]], [-u[1], u[0], 0.0]])
+	matrix = np.identity(4)
+	matrix[:3, :3] = np.identity(3) + math.sin(angle) * cross + (1.0 - math.cos(angle)) * cross.dot(cross)
+	if center_mm is not None:
+		center = np.asarray(center_mm, dtype=float)
+		matrix[:3, 3] = center - matrix[:3, :3].dot(center)
+	return matrix
+
+
+def translation_matrix(vector_mm):
+	matrix = np.identity(4)
+	matrix[:3, 3] = np.asarray(vector_mm, dtype=float)
+	return matrix
+
+
+def compose(*matrices):
+	"""
+	変換を合成します。引数の順に適用する変換になります (compose(a, b) は a を適用してから b を適用)。
+	"""
+	return functools.reduce(lambda applied, matrix: np.dot(matrix, applied), matrices, np.identity(4))
+
+
+def rigid_transform(axis=(0.0, 0.0, 1.0), angle_deg=0.0, translation_mm=(0.0, 0.0, 0.0), center_mm=None):
+	"""
+	rotate_and_translate_object() と同じく、回転してから平行移動する4x4行列を返します。
+	"""
+	return compose(rotation_matrix(axis, angle_deg, center_mm), translation_matrix(translation_mm))
+
+
+def to_s4l_transform(matrix):
+	"""
+	剛体変換の4x4行列を、Sim4Lifeの Translation * Rotation の変換に変換します。
+	"""
+	import s4l_v1 as s4l
+
+	rotation = matrix[:3, :3]
+	angle = math.acos(max(-1.0, min(1.0, (np.trace(rotation) - 1.0) / 2.0)))
+	axis = np.array([rotation[2, 1] - rotation[1, 2], rotation[0, 2] - rotation[2, 0], rotation[1, 0] - rotation[0, 1]])
+	if np.linalg.norm(axis) < _IDENTITY_TOLERANCE:
+		if angle < _IDENTITY_TOLERANCE:
+			axis = np.array([0.0, 0.0, 1.0])
+		else:
+			# 180度回転では反対称部分が0になるため、対称部分の最大の列から回転軸を求める
+			symmetric = (rotation + np.identity(3)) / 2.0
+			axis = symmetric[:, np.argmax(np.diag(symmetric))]
+	axis = axis / np.linalg.norm(axis)
+	translation = matrix[:3, 3]
+	return s4l.Translation(s4l.Vec3(*translation)) * s4l.Rotation(s4l.Vec3(*axis), angle)
+
+
+def _transform_bbox(matrix, bbox):
+	"""
+	バウンディングボックスの8つの角を変換した、軸平行のバウンディングボックスを返します。
+	"""
+	(x0, y0, z0), (x1, y1, z1) = bbox
+	corners = np.array([[x, y, z, 1.0] for x in (x0, x1) for y in (y0, y1) for z in (z0, z1)])
+	moved = corners.dot(matrix.T)[:, :3]
+	return tuple(moved.min(axis=0)), tuple(moved.max(axis=0))
+
+
+def pose_sweep(group, axis, angles_deg, center_mm=None, key_prefix=None):
+	"""
+	group を center_mm を通る axis 周りに angles_deg の各角度だけ回転したポーズを
+	(ポーズ名, {グループ名: 行列}) の形で順に返すジェネレーターです。
+	"""
+	prefix = key_prefix if key_prefix is not None else group
+	for angle_deg in angles_deg:
+		yield f"{prefix}_{angle_deg:+04g}", {group: rotation_matrix(axis, angle_deg, center_mm)}
+
+
+def combine_pose_sweeps(*sweeps):
+	"""
+	複数のポーズスイープのすべての組み合わせのポーズを返すジェネレーターです。
+	同じグループの変換は、引数の順に適用するよう合成します。
+	"""
+	for combination in itertools.product(*(list(sweep) for sweep in sweeps)):
+		transforms = {}
+		for _, pose in combination:
+			for group, matrix in pose.items():
+				transforms[group] = compose(transforms[group], matrix) if group in transforms else matrix
+		yield "_".join(key for key, _ in combination), transforms
+
+
+class PoseEngine(object):
+	"""
+	エンティティのグループをポーズごとにまとめて移動するエンジンです。
+
+	groups はグループ名 -> エンティティ名のリストの辞書で、定義しないグループは基準姿勢のままです。
+	エンジンはモデルが基準姿勢の状態で作成し、以後のエンティティの移動はすべてこのエンジンで行ってください。
+	"""
+
+	def __init__(self, groups):
+		self.groups = {group: list(names) for group, names in groups.items()}
+		self.current_pose = REFERENCE_POSE
+		self._poses = {REFERENCE_POSE: {}}
+		self._transforms = {}
+		self._voxel_caches = {}
+		self._reference_bboxes = None
+
+	@property
+	def poses(self):
+		return list(self._poses)
+
+	def define_pose(self, key, transforms):
+		"""
+		ポーズを定義します。transforms はグループ名 -> 基準姿勢からの4x4行列の辞書です。
+		既存のポーズを異なる変換で定義し直した場合は、そのポーズのキャッシュを破棄します。
+
+		Returns:
+			bool: 定義できた場合はTrue。未知のグループがある場合や現在のポーズを変更しようとした場合はFalse。
+		"""
+		unknown = [group for group in transforms if group not in self.groups]
+		if unknown:
+			_log.error("Pose '%s' refers to unknown groups: %s", key, unknown)
+			return False
+		matrices = {group: np.asarray(matrix, dtype=float) for group, matrix in transforms.items()}
+		previous = self._poses.get(key)
+		if previous is not None:
+			if set(previous) == set(matrices) and all(np.allclose(previous[g], matrices[g]) for g in matrices):
+				return True
+			if key == self.current_pose:
+				_log.error("Cannot redefine pose '%s' while it is applied.", key)
+				return False
+			self._transforms = {k: t for k, t in self._transforms.items() if key not in k[:2]}
+			self._voxel_caches = {k: c for k, c in self._voxel_caches.items() if k[0] != key}
+		self._poses[key] = matrices
+		return True
+
+	def define_poses(self, poses):
+		"""
+		(ポーズ名, 変換の辞書) のイテラブルをすべて定義し、定義できたポーズ名のリストを返します。
+		"""
+		return [key for key, transforms in poses if self.define_pose(key, transforms)]
+
+	def pose_matrix(self, key, group):
+		return self._poses[key].get(group, np.identity(4))
+
+	def _delta_transform(self, from_key, to_key, group):
+		cache_key = (from_key, to_key, group)
+		if cache_key not in self._transforms:
+			delta = self.pose_matrix(to_key, group).dot(np.linalg.inv(self.pose_matrix(from_key, group)))
+			if np.allclose(delta, np.identity(4), atol=_IDENTITY_TOLERANCE):
+				self._transforms[cache_key] = None
+			else:
+				self._transforms[cache_key] = to_s4l_transform(delta)
+		return self._transforms[cache_key]
+
+	def _capture_reference_bboxes(self):
+		if self._reference_bboxes is not None:
+			return
+		grouped_names = [name for names in self.groups.values() for name in names]
+		mapped, _ = sweep_model.map_entities(grouped_names)
+		entities = {e.Name: e for e in sweep_model.get_tissue_entities()}
+		entities.update(mapped)
+		names = list(entities)
+		self._reference_bboxes = dict(zip(names,
+			resource_estimator.get_entity_bounding_boxes([entities[name] for name in names])))
+
+	def apply_pose(self, key):
+		"""
+		モデルを key のポーズにします。現在のポーズと変換が異なるグループのエンティティだけを移動します。
+
+		Returns:
+			int: 移動したエンティティの数。未定義のポーズの場合はNone。
+		"""
+		if key not in self._poses:
+			_log.error("Pose '%s' is not defined.", key)
+			return None
+		if key == self.current_pose:
+			return 0
+		self._capture_reference_bboxes()
+		moved = 0
+		for group, names in self.groups.items():
+			transform = self._delta_transform(self.current_pose, key, group)
+			if transform is None:
+				continue
+			mapped, missing = sweep_model.map_entities(names)
+			if missing:
+				_log.warning("Entities of group '%s' not found: %s", group, missing)
+			for entity in mapped.values():
+				entity.ApplyTransform(transform)
+			moved += len(mapped)
+		_log.info("Pose changed from '%s' to '%s' (%d entities moved).", self.current_pose, key, moved)
+		self.current_pose = key
+		return moved
+
+	def pose_bounding_boxes(self, key):
+		"""
+		key のポーズでの組織とグループのエンティティのバウンディングボックスのリストを、モデルを動かさずに返します。
+		"""
+		self._capture_reference_bboxes()
+		group_of = {name: group for group, names in self.groups.items() for name in names}
+		bboxes = []
+		for name, bbox in self._reference_bboxes.items():
+			if bbox is not None and name in group_of:
+				bbox = _transform_bbox(self.pose_matrix(key, group_of[name]), bbox)
+			bboxes.append(bbox)
+		return bboxes
+
+	def plan_domain(self, pose_keys, frequency_mhz):
+		"""
+		すべてのポーズのエンティティを含む計算領域 (p0, p1) [mm] を返します。エンティティがない場合はNoneです。
+		ポーズによらず同じ計算領域とグリッドになるため、ポーズごとのボクセル化を再利用できます。
+		"""
+		bboxes = [bbox for key in pose_keys for bbox in self.pose_bounding_boxes(key)]
+		return domain_planner.plan_domain(bboxes, frequency_mhz * 1e6)
+
+	def voxel_cache(self, key, signature=None):
+		"""
+		key のポーズでボクセル化したシミュレーション名の集合を返します
+		(sweep.run_simulation_configs() の voxel_cache に渡します)。
+		signature には、グリッドが変わる設定 (周波数、グリッドモードなど) の組を指定します。
+		"""
+		return self._voxel_caches.setdefault((key, signature), set())
+
+	def clear_voxel_caches(self):
+		self._voxel_caches.clear()
+
+
+def run_pose_sweep(engine, pose_keys, simulation_configs, output_dir, concurrency=1, frequency_mhz=None,
+		grid_mode='automatic', kernel=None, monitor_memory=False, return_to_reference=True):
+	"""
+	pose_keys の各ポーズについて、simulation_configs ((名前サフィックス, Theta, Phi, Psi) のリスト) の
+	シミュレーションを作成・実行・解析し、Pose列付きの結果を <モデル名>_pose_wbsar_results.csv に書き出します。
+
+	計算領域はすべてのポーズを含む大きさで1回だけ合わせ、シミュレーションは削除せずに残します。
+	同じポーズを再び訪れた場合は、そのポーズでボクセル化したシミュレーションを再利用して
+	作成・グリッド・ボクセル化を省略します。
+
+	Returns:
+		list: CSVに書き出したSAR結果の辞書のリスト。計算領域を決められない場合はNone。
+	"""
+	from s4l_sweep import sweep
+
+	model_name = sweep_model.get_model_name()
+	estimate_frequency_mhz = frequency_mhz if frequency_mhz is not None else sweep.DEFAULT_FREQUENCY_MHZ
+	domain_bbox = engine.plan_domain(pose_keys, estimate_frequency_mhz)
+	if domain_bbox is None:
+		_log.error("No entities found to plan the computational domain of the pose sweep.")
+		return None
+	if not domain_planner.source_box_fits(domain_bbox, sweep_model.SOURCE_ENTITY_NAME):
+		# Wire Blockを作り直す前に、それを参照するシミュレーションを削除する
+		sweep_model.delete_all_simulations()
+		engine.clear_voxel_caches()
+		domain_planner.fit_source_box(domain_bbox, sweep_model.SOURCE_ENTITY_NAME)
+		sweep_model.clear_entity_index()
+
+	timer, monitor = sweep.create_sweep_instrumentation(output_dir, model_name, monitor_memory)
+	try:
+		all_sar_results = []
+		for key in pose_keys:
+			_log.info("--- Pose '%s' ---", key)
+			if engine.apply_pose(key) is None:
+				continue
+			pose_configs = [(f"{key} - {name_suffix}", theta, phi, psi) for name_suffix, theta, phi, psi in simulation_configs]
+			pose_results = sweep.run_simulation_configs(model_name, pose_configs, concurrency,
+				frequency_mhz=frequency_mhz, grid_mode=grid_mode, kernel=kernel, timer=timer,
+				voxel_cache=engine.voxel_cache(key, (frequency_mhz, grid_mode)))
+			for row in pose_results:
+				row['Pose'] = key
+			all_sar_results.extend(pose_results)
+		if return_to_reference:
+			engine.apply_pose(REFERENCE_POSE)
+		sweep.print_sweep_instrumentation(timer, monitor)
+	finally:
+		sweep.close_sweep_instrumentation(monitor)
+
+	output_filename = os.path.join(output_dir, f"{model_name}_pose_wbsar_results.csv")
+	output.write_sar_results_to_csv(all_sar_results, output_filename, fieldnames=POSE_SAR_FIELDNAMES)
+	return all_sar_results
@@ -0,0 +1,150 @@
+"""
+保存したボリューム (FieldStore) の多重解像度ピラミッドの作成と読み込みです。
+
+各方向の配列について、2×、4×、8× に間引いたレベルを <方向>.<配列名>.pyramid.npz に保存します。
+レベルごとに、ブロック内の最大値 (max、ピークを保つプレビュー用) と体積加重平均 (mean、平均値の比較用) を持ちます。
+電界のようにボクセルごとに成分を持つ配列は、大きさ (成分の二乗和の平方根) をプールします。
+
+read_level() は要求された解像度を満たす最も粗いレベルだけを読み込むため、全方向の概観や方向どうしの比較が
+フル解像度のボリュームを読まずに行えます。
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+
+import numpy as np
+
+import _sweep_logging as sweep_logging
+from s4l_sweep import geometry
+
+_log = sweep_logging.get_logger('pyramid')
+
+LEVEL_FACTORS = (2, 4, 8)
+REDUCERS = ('max', 'mean')
+
+
+def pyramid_filename(direction, name):
+	return f"{direction}.{name}.pyramid.npz"
+
+
+def coarse_axis(axis, factor):
+	"""
+	格子点の座標を factor セルごとにまとめた粗い格子点の座標を返します。端の余ったセルは1つの小さいセルにします。
+	"""
+	coarse = axis[::factor]
+	if (len(axis) - 1) % factor:
+		coarse = np.append(coarse, axis[-1])
+	return coarse
+
+
+def _pool(values, volumes, factor):
+	"""
+	値と体積のボリュームを factor^3 のブロックごとにプールし、(最大値, 体積加重平均, 体積の合計) を返します。
+	形状が factor で割り切れない場合は端を体積0で埋めます。
+	"""
+	padded_shape = tuple(-(-n // factor) * factor for n in values.shape)
+	padding = [(0, p - n) for n, p in zip(values.shape, padded_shape)]
+	values = np.pad(values, padding, constant_values=-np.inf)
+	volumes = np.pad(volumes, padding, constant_values=0.0)
+	blocks_shape = []
+	for n in padded_shape:
+		blocks_shape.extend((n // factor, factor))
+	values = values.reshape(blocks_shape)
+	volumes = volumes.reshape(blocks_shape)
+	peaks = values.max(axis=(1, 3, 5))
+	total_volume = volumes.sum(axis=(1, 3, 5))
+	weighted = np.where(volumes > 0.0, values, 0.0) * volumes
+	means = weighted.sum(axis=(1, 3, 5)) / np.where(total_volume > 0.0, total_volume, 1.0)
+	return peaks, means, total_volume
+
+
+def build_pyramid(store, direction, name='sar', factors=LEVEL_FACTORS):
+	"""
+	方向の配列 name のピラミッドを作成し、メタデータの 'pyramids' に倍率を記録します。
+
+	レベルは前のレベルから作成します (最大値の最大値と、体積で重みを付けた平均値の平均は、フル解像度から求めた値と一致します)。
+
+	Returns:
+		list: 作成したレベルの倍率のリスト。配列がない場合はNone。
+	"""
+	if not store.has_array(direction, name):
+		_log.error("'%s' of '%s' not found in '%s'.", name, direction, store.directory)
+		return None
+	values = np.asarray(store.read(direction, name), dtype=np.float64)
+	if values.ndim == 4:
+		values = np.sqrt((np.abs(values) ** 2).sum(axis=3))
+	axes = store.axes(direction)
+	volumes = geometry.get_geometry(axes).volumes
+
+	arrays = {}
+	peaks, means, previous = values, values, 1
+	for factor in sorted(factors):
+		if factor % previous:
+			raise ValueError(f"Pyramid factors must divide each other (got {sorted(factors)}).")
+		step = factor // previous
+		peaks, _, _ = _pool(peaks, volumes, step)
+		_, means, volumes = _pool(means, volumes, step)
+		level_axes = [coarse_axis(axis, factor) for axis in axes]
+		arrays[f"max_{factor}"] = peaks.astype(np.float32)
+		arrays[f"mean_{factor}"] = means.astype(np.float32)
+		for label, axis in zip('xyz', level_axes):
+			arrays[f"{label}_{factor}"] = axis
+		previous = factor
+	np.savez(os.path.join(store.directory, pyramid_filename(direction, name)), **arrays)
+	pyramids = dict(store.metadata(direction).get('pyramids', {}))
+	pyramids[name] = sorted(factors)
+	store.update_metadata(direction, pyramids=pyramids)
+	return sorted(factors)
+
+
+def build_pyramids(store, name='sar', factors=LEVEL_FACTORS):
+	"""
+	ストアのすべての方向の配列 name のピラミッドを作成します。
+
+	Returns:
+		int: 作成した方向の数。
+	"""
+	built = 0
+	for direction in store.directions():
+		if store.has_array(direction, name) and build_pyramid(store, direction, name, factors) is not None:
+			built += 1
+	_log.info("Built %s pyramids of %d directions in '%s'.", name, built, store.directory)
+	return built
+
+
+def _cell_size(axes):
+	return max(float(np.diff(axis).max()) for axis in axes)
+
+
+def read_level(store, direction, resolution_m=None, name='sar', reducer='max'):
+	"""
+	セルの最大の大きさが resolution_m [m] 以下になる最も粗いレベルを読み込みます。
+	条件を満たすレベルがない場合、resolution_m がNoneの場合、ピラミッドがない場合はフル解像度を返します。
+
+	Returns:
+		tuple: (形状 (nx, ny, nz) の値, 格子点の座標 (X, Y, Z) [m], 倍率 (フル解像度は1))。
+	"""
+	if reducer not in REDUCERS:
+		raise ValueError(f"reducer must be one of {REDUCERS} (got {reducer!r}).")
+	factors = store.metadata(direction).get('pyramids', {}).get(name, [])
+	axes = store.axes(direction)
+	if resolution_m is not None and factors:
+		with np.load(os.path.join(store.directory, pyramid_filename(direction, name))) as pyramid:
+			for factor in sorted(factors, reverse=True):
+				level_axes = tuple(pyramid[f"{label}_{factor}"] for label in 'xyz')
+				if _cell_size(level_axes) <= resolution_m:
+					return pyramid[f"{reducer}_{factor}"], level_axes, factor
+	values = np.asarray(store.read(direction, name))
+	if values.ndim == 4:
+		values = np.sqrt((np.abs(values) ** 2).sum(axis=3))
+	return values, axes, 1
+
+
+def iter_overview(store, resolution_m, name='sar', reducer='max', directions=None):
+	"""
+	方向ごとに read_level() の (方向, 値, 格子点の座標, 倍率) を返すジェネレーターです。
+	"""
+	for direction in (directions if directions is not None else store.directions()):
+		if store.has_array(direction, name):
+			values, axes, factor = read_level(store, direction, resolution_m, name, reducer)
+			yield direction, values, axes, factor
@@ -0,0 +1,163 @@
+"""
+抽出が終わったシミュレーションの生の出力 (_Output.h5) を保持ポリシーに従って整理します。
+
+全領域のフィールドを出力するシミュレーションは1本で数GBになりますが、スイープで残すのは方向ごとの数値だけです。
+ポリシーは次のいずれかです。
+
+	keep        生の出力をそのまま残す (既定)
+	downsample  電界を stride セルおきに間引いたコピー (.npz) を残し、生の出力を削除する
+	crop        電界を roi_m の範囲 [m] に切り出したコピー (.npz) を残し、生の出力を削除する
+	compress    生の出力を gzip で圧縮したコピー (.h5.gz) を残し、元のファイルを削除する
+	delete      生の出力を削除する
+
+生の出力を変更する前に、そのシミュレーションの結果が結果のCSVに書き込まれていることを確認し、
+書き込まれていないシミュレーションは変更しません。
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+import gzip
+import os
+import re
+import shutil
+
+import numpy as np
+
+import _sweep_logging as sweep_logging
+from s4l_sweep import analysis
+from s4l_sweep import geometry
+from s4l_sweep import output
+
+_log = sweep_logging.get_logger('retention')
+
+RETENTION_POLICIES = ('keep', 'downsample', 'crop', 'compress', 'delete')
+# 既定の間引き間隔 [セル]
+DEFAULT_STRIDE = 2
+# ファイル名に使えない文字
+_UNSAFE_FILENAME_CHARS = re.compile(r'[<>:"/\\|?*]')
+
+
+def retained_dir(output_dir, model_name):
+	"""
+	間引き・切り出し・圧縮したコピーを保存するフォルダーのパスを返します。
+	"""
+	return os.path.join(output_dir, f"{model_name}_retained")
+
+
+def _retained_path(directory, sim_name, extension):
+	return os.path.join(directory, _UNSAFE_FILENAME_CHARS.sub('_', sim_name) + extension)
+
+
+def reduce_field(values, axes, stride=1, roi_m=None):
+	"""
+	セルごとの電界を roi_m の範囲に切り出し、stride セルおきに間引きます。
+
+	Args:
+		values (numpy.ndarray): 形状 (nx, ny, nz, 成分数) の電界。
+		axes (tuple): (X, Y, Z) の格子点の座標 [m]。各軸の長さはセル数 + 1。
+		stride (int): 間引き間隔 [セル]。
+		roi_m (list): [[xmin, xmax], [ymin, ymax], [zmin, zmax]] の範囲 [m]。Noneの場合は全領域。
+
+	Returns:
+		tuple: (間引いた電界, 残したセルの中心座標 [m] の (X, Y, Z) のタプル)。範囲にセルがない場合はNone。
+	"""
+	slices = []
+	centers = []
+	for dim, center in enumerate(geometry.get_geometry(axes).centers):
+		if roi_m is not None:
+			inside = np.nonzero((center >= roi_m[dim][0]) & (center <= roi_m[dim][1]))[0]
+			if len(inside) == 0:
+				return None
+			start, stop = inside[0], inside[-1] + 1
+		else:
+			start, stop = 0, len(center)
+		slices.append(slice(start, stop, stride))
+		centers.append(center[slices[-1]])
+	return values[tuple(slices)], tuple(centers)
+
+
+def _save_reduced_field(sim, path, stride, roi_m):
+	extracted = analysis.extract_e_field_array(sim)
+	if extracted is None:
+		return False
+	reduced = reduce_field(*extracted, stride=stride, roi_m=roi_m)
+	if reduced is None:
+		_log.error("ROI %s contains no cells of '%s'.", roi_m, sim.Name)
+		return False
+	values, (x, y, z) = reduced
+	np.savez_compressed(path, e_field=values.astype(np.complex64), x=x, y=y, z=z,
+		stride=stride, roi_m=np.asarray(roi_m if roi_m is not None else [], dtype=float))
+	return True
+
+
+def _compress_file(source_path, path):
+	with open(source_path, 'rb') as source, gzip.open(path, 'wb', compresslevel=6) as target:
+		shutil.copyfileobj(source, target, 16 * 1024 * 1024)
+	return True
+
+
+def apply_retention(simulations, results_filename, policy='keep', retained_directory=None,
+		stride=DEFAULT_STRIDE, roi_m=None):
+	"""
+	CSVに結果が書き込まれたシミュレーションの生の出力にポリシーを適用します。
+	1本の処理に失敗しても、生の出力はそのまま残して残りのシミュレーションを続けます。
+
+	Args:
+		simulations (list): 対象のシミュレーション。
+		results_filename (str): 結果のCSVファイルのパス。
+		policy (str): RETENTION_POLICIES のいずれか。
+		retained_directory (str): コピーの保存先。policyが 'downsample'、'crop'、'compress' の場合に必要です。
+		stride (int): policy='downsample' の場合の間引き間隔 [セル]。
+		roi_m (list): 切り出す範囲 [m]。policy='crop' の場合は必須で、'downsample' の場合も指定できます。
+
+	Returns:
+		dict: 'processed' (処理した本数), 'skipped' (変更しなかった本数), 'freed_bytes' (削減したバイト数)。
+	"""
+	summary = {'processed': 0, 'skipped': 0, 'freed_bytes': 0}
+	if policy == 'keep':
+		return summary
+	if policy not in RETENTION_POLICIES:
+		_log.error("Unknown retention policy '%s'. Raw outputs are kept.", policy)
+		summary['skipped'] = len(simulations)
+		return summary
+	if policy == 'crop' and roi_m is None:
+		_log.error("Retention policy 'crop' requires roi_m. Raw outputs are kept.")
+		summary['skipped'] = len(simulations)
+		return summary
+
+	committed_names = output.read_committed_simulation_names(results_filename)
+	if policy != 'delete' and not os.path.exists(retained_directory):
+		os.makedirs(retained_directory)
+	for sim in simulations:
+		if sim.Name not in committed_names:
+			_log.warning("Results of '%s' are not in '%s'. Keeping its raw output.", sim.Name, results_filename)
+			summary['skipped'] += 1
+			continue
+		raw_path = sim.GetOutputFileName()
+		if not raw_path or not os.path.exists(raw_path):
+			summary['skipped'] += 1
+			continue
+		raw_bytes = os.path.getsize(raw_path)
+		retained_path = None
+		try:
+			if policy in ('downsample', 'crop'):
+				retained_path = _retained_path(retained_directory, sim.Name, ".npz")
+				ok = _save_reduced_field(sim, retained_path, stride if policy == 'downsample' else 1, roi_m)
+			elif policy == 'compress':
+				retained_path = _retained_path(retained_directory, sim.Name, ".h5.gz")
+				ok = _compress_file(raw_path, retained_path)
+			else:
+				ok = True
+			if not ok:
+				summary['skipped'] += 1
+				continue
+			os.remove(raw_path)
+		except (OSError, ValueError) as e:
+			_log.error("Retention policy '%s' failed for '%s': %s. Keeping its raw output.", policy, sim.Name, e)
+			summary['skipped'] += 1
+			continue
+		retained_bytes = os.path.getsize(retained_path) if retained_path else 0
+		summary['processed'] += 1
+		summary['freed_bytes'] += raw_bytes - retained_bytes
+	_log.info("Retention policy '%s' applied to %d simulations (%d kept as is). %.1f MB freed.", policy,
+		summary['processed'], summary['skipped'], summary['freed_bytes'] / 1024.0 ** 2)
+	return summary
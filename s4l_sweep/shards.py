@@ -0,0 +1,153 @@
+"""
+スイープのシミュレーションを複数のプロジェクトファイル (シャード) に分けて保存するための補助です。
+
+1つのプロジェクトにすべての方向のシミュレーションを入れると、プロジェクトを開く・保存する時間が
+シミュレーションの本数に比例して長くなります。シャードごとに本数を抑えることで、この時間を一定に保ちます。
+どの設定がどのシャードに入っているかは、JSONの索引ファイルに記録します。
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+import itertools
+import json
+import os
+
+import _sweep_logging as sweep_logging
+
+_log = sweep_logging.get_logger('shards')
+
+# 索引ファイルの形式のバージョン
+INDEX_VERSION = 1
+
+
+def iter_shards(configs, shard_by='count', shard_size=None):
+	"""
+	設定のイテラブルをシャードに分け、(シャードのキー, 設定のリスト) を1つずつ返すジェネレーターです。
+
+	shard_by='count' の場合は shard_size 件ずつに分け、キーは "0000" からの通し番号です。
+	shard_by='polarization' の場合は Psi角が同じ連続した設定をまとめ、キーは "Psi_090" の形式です
+	(shard_sizeを指定した場合は、さらにその件数ずつに分けます)。
+	"""
+	if shard_by == 'count':
+		groups = [(None, iter(configs))]
+	elif shard_by == 'polarization':
+		groups = ((f"Psi_{psi:03g}", group) for psi, group in itertools.groupby(configs, key=lambda config: config[3]))
+	else:
+		raise ValueError(f"Unknown shard_by '{shard_by}'.")
+
+	index = 0
+	for key, group in groups:
+		part = 0
+		while True:
+			shard = list(itertools.islice(group, shard_size)) if shard_size else list(group)
+			if not shard:
+				break
+			if key is None:
+				shard_key = f"{index:04d}"
+			else:
+				shard_key = f"{key}_{part:02d}" if shard_size else key
+			yield shard_key, shard
+			index += 1
+			part += 1
+			if not shard_size:
+				break
+
+
+class ShardIndex(object):
+	"""
+	シミュレーション名からシャードのプロジェクトファイルを引く索引です。
+
+	索引はJSONファイルに保存し、シャードを追加するたびに書き直します (一時ファイルに書いてから置き換えるため、
+	スイープが途中で止まっても、それまでに完了したシャードの索引は読めます)。
+	シャードのパスは索引ファイルのフォルダからの相対パスで記録するため、フォルダごと移動できます。
+	"""
+
+	def __init__(self, index_path, model_name=None):
+		self.index_path = os.path.abspath(index_path)
+		self.model_name = model_name
+		self.shards = []
+		self._members = None
+
+	@classmethod
+	def load(cls, index_path):
+		"""
+		保存した索引を読み込みます。読み込めない場合はエラーを記録してNoneを返します。
+		"""
+		try:
+			with open(index_path, 'r', encoding='utf-8') as f:
+				data = json.load(f)
+		except (OSError, ValueError) as e:
+			_log.error("Failed to read shard index '%s': %s", index_path, e)
+			return None
+		index = cls(index_path, data.get('model_name'))
+		index.shards = data.get('shards', [])
+		return index
+
+	def next_project_path(self, shard_dir, model_name):
+		"""
+		次のシャードのプロジェクトのパス <shard_dir>/<モデル名>_shard_<番号>.smash を返します。
+		番号は索引のシャード数から始め、既存のファイル (索引に追加する前に止まったスイープのシャードなど) は上書きしないよう飛ばします。
+		"""
+		number = len(self.shards)
+		while True:
+			project_path = os.path.join(shard_dir, f"{model_name}_shard_{number:03d}.smash")
+			if not os.path.exists(project_path):
+				return project_path
+			number += 1
+
+	def shard_path(self, shard):
+		return os.path.normpath(os.path.join(os.path.dirname(self.index_path), shard['file']))
+
+	def add_shard(self, project_path, key, simulation_names, frequency_mhz=None):
+		"""
+		保存したシャードを索引に追加し、索引ファイルを書き直します。
+		"""
+		self.shards.append({
+			'file': os.path.relpath(os.path.abspath(project_path), os.path.dirname(self.index_path)),
+			'key': key,
+			'frequency_mhz': frequency_mhz,
+			'members': list(simulation_names),
+		})
+		self._members = None
+		self.save()
+
+	def save(self):
+		directory = os.path.dirname(self.index_path)
+		if not os.path.exists(directory):
+			os.makedirs(directory)
+		temp_path = self.index_path + ".tmp"
+		with open(temp_path, 'w', encoding='utf-8') as f:
+			json.dump({'version': INDEX_VERSION, 'model_name': self.model_name, 'shards': self.shards}, f, indent=1)
+		os.replace(temp_path, self.index_path)
+
+	def shard_for(self, simulation_name):
+		"""
+		シミュレーションが入っているシャードのプロジェクトのパスを返します。索引にない場合はNoneです。
+		同じ名前のシミュレーションが複数のシャードにある場合 (同じ出力先でスイープをやり直した場合) は、最後に追加したシャードを返します。
+		"""
+		if self._members is None:
+			self._members = {}
+			for shard in self.shards:
+				for name in shard['members']:
+					self._members[name] = shard
+		shard = self._members.get(simulation_name)
+		return self.shard_path(shard) if shard is not None else None
+
+	def resolve(self, simulation_name):
+		"""
+		シミュレーションが入っているシャードを開き、そのシミュレーションを返します。
+		シャードがすでに開いている場合は開き直しません。見つからない場合はエラーを記録してNoneを返します。
+		"""
+		import s4l_v1.document as document
+		from s4l_sweep import model as sweep_model
+
+		project_path = self.shard_for(simulation_name)
+		if project_path is None:
+			_log.error("Simulation '%s' is not in shard index '%s'.", simulation_name, self.index_path)
+			return None
+		if not document.FileName or os.path.normpath(document.FileName) != project_path:
+			sweep_model.open_model(project_path)
+		for sim in document.AllSimulations:
+			if sim.Name == simulation_name:
+				return sim
+		_log.error("Simulation '%s' not found in shard '%s'.", simulation_name, project_path)
+		return None
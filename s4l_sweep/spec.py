@@ -0,0 +1,336 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import glob
+import itertools
+import json
+import math
+import os
+
+try:
+	import yaml
+except ImportError:
+	yaml = None
+
+from s4l_sweep import directions
+
+# スイープ仕様の既定値。仕様ファイルにないキーはこの値を使用する
+DEFAULT_SPEC = {
+	'model_file': None,  # 開くプロジェクト (.smash)。Noneの場合は開いているドキュメントを使用する
+	'model_files': None,  # 順に開いてスイープするプロジェクトのリスト (globのパターンも可)。model_fileとは併用しない
+	'output_dir': '.',  # 結果の出力先。相対パスは仕様ファイルのフォルダからの相対パス
+	'theta_deg': [90.0],
+	'phi_deg': {'start': 0.0, 'stop': 360.0, 'step': 30.0},
+	'direction_scheme': 'grid',  # 'lebedev' または 'fibonacci' の場合は theta_deg と phi_deg の代わりに球面全体の求積点を使用する
+	'direction_order': 26,  # 求積点の数。'lebedev' の場合は 6, 14, 26, 50 のいずれか
+	'polarizations': ['VPol', 'HPol'],
+	'psi_deg': None,  # 指定した場合は polarizations の代わりにこのPsi角を使用する
+	'frequencies_mhz': [None],  # Noneの場合はCenterFrequencyを変更しない
+	'kernel': 'auto',
+	'concurrency': None,
+	'grid_mode': 'automatic',
+	'sweep_mode': 'full',
+	'top_k': 3,
+	'margin_fraction': 0.1,
+	'active_objective': 'worst_case',  # sweep_mode='active' で次の方向を選ぶ基準 ('worst_case' または 'uncertainty')
+	'active_iterations': 10,  # 代理モデルで方向を選ぶ回数の上限
+	'active_batch_size': 2,  # 1回に選ぶ設定の数
+	'active_tolerance': 0.01,  # 期待改善量 (または標準偏差) が最大SARのこの割合を下回ったら終了する
+	'ram_budget_gb': None,
+	'disk_budget_gb': None,
+	'admission_policy': 'downscale',
+	'adaptive_periods': False,
+	'steady_state_tolerance': 1e-3,  # adaptive_periods で定常状態とみなす、周期ごとの位相振幅の相対変化の上限
+	'stable_periods': 3,  # 相対変化が steady_state_tolerance 未満の状態が続く必要がある周期数
+	'convergence_level_db': -30.0,  # adaptive_periods のシミュレーションのソルバーの自動終了の収束レベル [dB] (負の値)
+	'monitor_memory': False,  # Trueの場合はフェーズ前後のメモリ使用量を記録する (tracemallocで遅くなるため、リークの調査用)
+	'chunk_size': None,  # 指定した場合は、この本数ずつ作成・実行・解析してCSVに追記する
+	'shard_by': None,  # 'count' または 'polarization' の場合は、シャードごとに別のプロジェクトに保存する (chunk_sizeより優先)
+	'shard_size': None,  # 1シャードのシミュレーション数。shard_by='polarization'の場合は偏波ごとのシャードをさらに分割する
+	'retention_policy': 'keep',  # 解析後の生の出力の扱い。s4l_sweep.retention を参照
+	'retention_stride': 2,  # retention_policy='downsample' の間引き間隔 [セル]
+	'retention_roi_m': None,  # 残す範囲 [[xmin, xmax], [ymin, ymax], [zmin, zmax]] [m]。'crop' の場合は必須
+	'export_fields': False,  # Trueの場合は電界とSARを <output_dir>/<モデル名>_fields に保存する (s4l_sweep.fields)
+	'field_storage': 'native',  # 保存するフィールドの形式 ('native', 'single', 'half', 'int16')。s4l_sweep.fields を参照
+	'field_sparse': False,  # Trueの場合は人体のボクセルの値だけを保存する (空気のボクセルを除く)
+	'field_pyramid': False,  # Trueの場合は保存したSARの 2×, 4×, 8× のピラミッドを作成する (s4l_sweep.pyramid)
+	'hotspot_top_k': 0,  # 1以上の場合は、保存したSARの方向ごとの上位この個数のボクセルの索引を作成する (s4l_sweep.hotspots)
+	'tissue_labels': None,  # 組織ラベルのnpzファイル (s4l_sweep.tissues.load_label_file())。ホットスポットと組織ごとの内訳に使用する
+	'tissue_breakdown': False,  # Trueの場合は、保存したSARの組織ごとの内訳を <モデル名>_tissue_sar.csv に書き出す
+	'multipath_realizations': 0,  # 1以上の場合は、保存したフィールドから多重波環境のSARの分布を求める (s4l_sweep.multipath)
+	'multipath_amplitude': 'rayleigh',  # 多重波の振幅のモデル ('rayleigh' または 'constant')
+	'multipath_seed': None,  # 多重波の乱数のシード
+	'log_console_interval_s': 10.0,
+}
+# 偏波名と対応するPsi角 [度]
+POLARIZATION_PSI = {'VPol': 90.0, 'HPol': 0.0}
+
+_CHOICES = {
+	'kernel': ('auto', 'AXware', 'Cuda', 'Software'),
+	'grid_mode': ('automatic', 'planned'),
+	'sweep_mode': ('full', 'screened', 'active'),
+	'active_objective': ('worst_case', 'uncertainty'),
+	'admission_policy': ('downscale', 'refuse'),
+	'shard_by': (None, 'count', 'polarization'),
+	'direction_scheme': ('grid',) + directions.SPHERE_SCHEMES,
+	'retention_policy': ('keep', 'downsample', 'crop', 'compress', 'delete'),
+	'multipath_amplitude': ('rayleigh', 'constant'),
+	'export_fields': (False, True),
+	'field_storage': ('native', 'single', 'half', 'int16'),
+	'field_sparse': (False, True),
+	'field_pyramid': (False, True),
+	'tissue_breakdown': (False, True),
+}
+# 角度の範囲指定で、終了値と重なった点を除外するための許容誤差 [度]
+_ANGLE_EPSILON = 1e-9
+
+
+def load_spec(path):
+	"""
+	JSONまたはYAML (拡張子が .yaml / .yml の場合。PyYAMLが必要) のスイープ仕様を読み込み、
+	既定値を補って返します。output_dir、model_file、model_files の相対パスは仕様ファイルのフォルダを基準に解決します。
+
+	Returns:
+		tuple: (仕様の辞書, 問題の説明のリスト)。問題がある場合、辞書はNoneです。
+	"""
+	is_yaml = os.path.splitext(path)[1].lower() in ('.yaml', '.yml')
+	if is_yaml and yaml is None:
+		return None, [f"'{path}' is a YAML file but PyYAML is not installed. Use a JSON spec or install PyYAML."]
+	try:
+		with open(path, 'r', encoding='utf-8') as f:
+			loaded = yaml.safe_load(f) if is_yaml else json.load(f)
+	except (OSError, ValueError) as e:
+		return None, [f"Failed to read '{path}': {e}"]
+	if not isinstance(loaded, dict):
+		return None, [f"'{path}' must contain a mapping of sweep settings."]
+
+	spec = dict(DEFAULT_SPEC)
+	spec.update(loaded)
+	base_dir = os.path.dirname(os.path.abspath(path))
+	for key in ('output_dir', 'model_file', 'tissue_labels'):
+		if isinstance(spec[key], str):
+			spec[key] = os.path.normpath(os.path.join(base_dir, spec[key]))
+	if isinstance(spec['model_files'], list):
+		spec['model_files'] = [os.path.normpath(os.path.join(base_dir, pattern)) if isinstance(pattern, str) else pattern
+			for pattern in spec['model_files']]
+
+	problems = validate_spec(spec)
+	return (None if problems else spec), problems
+
+
+def validate_spec(spec):
+	"""
+	仕様の問題の説明のリストを返します。問題がない場合は空のリストです。
+	"""
+	problems = [f"Unknown key '{key}'." for key in spec if key not in DEFAULT_SPEC]
+	for key, choices in _CHOICES.items():
+		if spec.get(key) not in choices:
+			problems.append(f"'{key}' must be one of {', '.join(map(str, choices))} (got {spec.get(key)!r}).")
+	for key in ('theta_deg', 'phi_deg'):
+		problems.extend(_validate_angles(key, spec.get(key)))
+	if not (_is_number(spec.get('active_tolerance')) and spec['active_tolerance'] >= 0):
+		problems.append("'active_tolerance' must be a non-negative number.")
+	if not (_is_number(spec.get('steady_state_tolerance')) and 0 < spec['steady_state_tolerance'] < 1):
+		problems.append("'steady_state_tolerance' must be a number between 0 and 1.")
+	if not (_is_number(spec.get('convergence_level_db')) and spec['convergence_level_db'] < 0):
+		problems.append("'convergence_level_db' must be a negative number (dB).")
+	order = spec.get('direction_order')
+	if spec.get('direction_scheme') == 'lebedev' and order not in directions.LEBEDEV_ORDERS:
+		problems.append(f"'direction_order' must be one of {', '.join(map(str, directions.LEBEDEV_ORDERS))} "
+			f"for the Lebedev scheme (got {order!r}).")
+	elif spec.get('direction_scheme') == 'fibonacci' and not (isinstance(order, int) and order > 0):
+		problems.append("'direction_order' must be a positive integer for the Fibonacci scheme.")
+	if spec.get('psi_deg') is not None:
+		problems.extend(_validate_angles('psi_deg', spec['psi_deg']))
+	else:
+		polarizations = spec.get('polarizations')
+		if not isinstance(polarizations, list) or not polarizations:
+			problems.append("'polarizations' must be a non-empty list.")
+		else:
+			problems.extend(f"Unknown polarization '{name}'. Use {', '.join(POLARIZATION_PSI)} or psi_deg."
+				for name in polarizations if name not in POLARIZATION_PSI)
+	frequencies = spec.get('frequencies_mhz')
+	if not isinstance(frequencies, list) or not frequencies:
+		problems.append("'frequencies_mhz' must be a non-empty list.")
+	elif any(f is not None and not (_is_number(f) and f > 0) for f in frequencies):
+		problems.append("'frequencies_mhz' must contain positive numbers or null.")
+	if not (isinstance(spec.get('stable_periods'), int) and spec['stable_periods'] > 0):
+		problems.append("'stable_periods' must be a positive integer.")
+	for key in ('concurrency', 'chunk_size', 'shard_size', 'top_k', 'retention_stride', 'active_iterations',
+			'active_batch_size'):
+		value = spec.get(key)
+		if value is not None and not (isinstance(value, int) and value > 0):
+			problems.append(f"'{key}' must be a positive integer or null.")
+	if spec.get('shard_by') is not None:
+		if spec.get('sweep_mode') != 'full':
+			problems.append("'shard_by' requires sweep_mode 'full'.")
+		if spec.get('shard_by') == 'count' and spec.get('shard_size') is None:
+			problems.append("'shard_by' 'count' requires 'shard_size'.")
+	roi = spec.get('retention_roi_m')
+	if roi is not None and not (isinstance(roi, list) and len(roi) == 3 and all(isinstance(bounds, list)
+			and len(bounds) == 2 and all(_is_number(v) for v in bounds) and bounds[0] < bounds[1] for bounds in roi)):
+		problems.append("'retention_roi_m' must be [[xmin, xmax], [ymin, ymax], [zmin, zmax]] in meters.")
+	if spec.get('retention_policy') == 'crop' and roi is None:
+		problems.append("'retention_policy' 'crop' requires 'retention_roi_m'.")
+	realizations = spec.get('multipath_realizations')
+	if not (isinstance(realizations, int) and realizations >= 0):
+		problems.append("'multipath_realizations' must be a non-negative integer.")
+	elif realizations and not spec.get('export_fields'):
+		problems.append("'multipath_realizations' requires 'export_fields'.")
+	elif realizations and spec.get('sweep_mode') == 'active':
+		problems.append("'multipath_realizations' requires sweep_mode 'full' or 'screened'.")
+	if spec.get('field_pyramid') and not spec.get('export_fields'):
+		problems.append("'field_pyramid' requires 'export_fields'.")
+	top_k = spec.get('hotspot_top_k')
+	if not (isinstance(top_k, int) and top_k >= 0):
+		problems.append("'hotspot_top_k' must be a non-negative integer.")
+	elif top_k and not spec.get('export_fields'):
+		problems.append("'hotspot_top_k' requires 'export_fields'.")
+	for key in ('tissue_labels', 'tissue_breakdown'):
+		if spec.get(key) and not spec.get('export_fields'):
+			problems.append(f"'{key}' requires 'export_fields'.")
+	if spec.get('tissue_breakdown') and spec.get('tissue_labels') is None:
+		problems.append("'tissue_breakdown' requires 'tissue_labels'.")
+	if spec.get('tissue_labels') is not None and not os.path.exists(spec['tissue_labels']):
+		problems.append(f"Tissue label file '{spec['tissue_labels']}' does not exist.")
+	if spec.get('model_file') is not None and not os.path.exists(spec['model_file']):
+		problems.append(f"Model file '{spec['model_file']}' does not exist.")
+	model_files = spec.get('model_files')
+	if model_files is not None:
+		if spec.get('model_file') is not None:
+			problems.append("Use either 'model_file' or 'model_files', not both.")
+		if not isinstance(model_files, list) or not model_files or not all(isinstance(p, str) for p in model_files):
+			problems.append("'model_files' must be a non-empty list of paths or glob patterns.")
+		else:
+			problems.extend(f"'{pattern}' in 'model_files' matches no file." for pattern in model_files
+				if not glob.glob(pattern))
+	return problems
+
+
+def expand_model_files(spec):
+	"""
+	model_files のパターンを展開したプロジェクトのパスのリストを返します。
+	パターンごとに名前順に並べ、重複したパスは最初の1回だけ含めます。
+	"""
+	paths = []
+	for pattern in spec['model_files'] or []:
+		for path in sorted(glob.glob(pattern)):
+			if path not in paths:
+				paths.append(path)
+	return paths
+
+
+def _is_number(value):
+	return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _validate_angles(key, value):
+	if isinstance(value, dict):
+		if set(value) != {'start', 'stop', 'step'} or not all(_is_number(v) for v in value.values()):
+			return [f"'{key}' range must have numeric start, stop and step."]
+		if value['step'] <= 0 or value['stop'] <= value['start']:
+			return [f"'{key}' range must have step > 0 and stop > start."]
+		return []
+	if isinstance(value, list) and value and all(_is_number(v) for v in value):
+		return []
+	return [f"'{key}' must be a non-empty list of angles or a {{start, stop, step}} range."]
+
+
+def _angle_count(value):
+	if isinstance(value, dict):
+		return int(math.ceil((value['stop'] - value['start']) / value['step'] - _ANGLE_EPSILON))
+	return len(value)
+
+
+def _iter_angles(value):
+	"""
+	角度のリスト、または終了値を含まない {start, stop, step} の範囲の角度を順に返します。
+	"""
+	if isinstance(value, dict):
+		for index in range(_angle_count(value)):
+			yield float(value['start'] + index * value['step'])
+	else:
+		for angle in value:
+			yield float(angle)
+
+
+def polarization_angles(spec):
+	if spec.get('psi_deg') is not None:
+		return [(f"Psi_{psi:03g}", psi) for psi in _iter_angles(spec['psi_deg'])]
+	return [(name, POLARIZATION_PSI[name]) for name in spec['polarizations']]
+
+
+def direction_name(theta_deg, phi_deg, polarization_name):
+	"""
+	シミュレーション名のサフィックスを返します。Theta=90度の場合は従来どおり "Phi_030_VPol" の形式です。
+	"""
+	if theta_deg == 90.0:
+		return f"Phi_{phi_deg:03g}_{polarization_name}"
+	return f"Theta_{theta_deg:03g}_Phi_{phi_deg:03g}_{polarization_name}"
+
+
+def _direction_count(spec):
+	if spec.get('direction_scheme', 'grid') != 'grid':
+		return spec['direction_order']
+	return _angle_count(spec['theta_deg']) * _angle_count(spec['phi_deg'])
+
+
+def _iter_directions(spec):
+	"""
+	(Theta, Phi, 重み) を1つずつ返します。direction_scheme が 'grid' の場合、重みはNoneです。
+	"""
+	if spec.get('direction_scheme', 'grid') != 'grid':
+		for direction in directions.iter_sphere_directions(spec['direction_scheme'], spec['direction_order']):
+			yield direction
+		return
+	for theta, phi in itertools.product(_iter_angles(spec['theta_deg']), _iter_angles(spec['phi_deg'])):
+		yield theta, phi, None
+
+
+def count_simulation_configs(spec):
+	"""
+	1つの周波数当たりのシミュレーション設定の数を、設定を展開せずに返します。
+	"""
+	return _direction_count(spec) * len(polarization_angles(spec))
+
+
+def frequency_tag(spec, frequency_mhz):
+	if len(spec['frequencies_mhz']) > 1 and frequency_mhz is not None:
+		return f"_{frequency_mhz:g}MHz"
+	return ""
+
+
+def iter_simulation_configs(spec, frequency_mhz=None):
+	"""
+	仕様の (名前サフィックス, Theta, Phi, Psi) を偏波、方向 (Theta、Phiの順) の順に1件ずつ返すジェネレーターです。
+	周波数が複数ある場合は、名前サフィックスの末尾に周波数を付けて区別します。
+	"""
+	name_tag = frequency_tag(spec, frequency_mhz)
+	for (pol_name, psi), (theta, phi, _) in itertools.product(polarization_angles(spec), _iter_directions(spec)):
+		yield (direction_name(theta, phi, pol_name) + name_tag, theta, phi, float(psi))
+
+
+def simulation_config_weights(spec, frequency_mhz=None):
+	"""
+	名前サフィックス -> 等方平均の重みの辞書を返します。方向の重みは偏波の数で等分し、合計は1です。
+	direction_scheme が 'grid' の場合はNoneです。
+	"""
+	if spec.get('direction_scheme', 'grid') == 'grid':
+		return None
+	name_tag = frequency_tag(spec, frequency_mhz)
+	polarizations = polarization_angles(spec)
+	return {direction_name(theta, phi, pol_name) + name_tag: weight / len(polarizations)
+		for (pol_name, _), (theta, phi, weight) in itertools.product(polarizations, _iter_directions(spec))}
+
+
+def iter_config_chunks(configs, chunk_size):
+	"""
+	設定のイテラブルを chunk_size 件ずつのリストにして返します。chunk_sizeがNoneの場合は全件を1つのリストにします。
+	"""
+	configs = iter(configs)
+	while True:
+		chunk = list(itertools.islice(configs, chunk_size)) if chunk_size else list(configs)
+		if not chunk:
+			return
+		yield chunk
+		if not chunk_size:
+			return
@@ -0,0 +1,253 @@
+"""
+完了した方向のSAR結果から任意の入射方向のSARを予測するガウス過程の代理モデルと、
+次に計算する方向を選ぶ能動学習です。
+
+方向 (到来方向の単位ベクトル d) と偏波 (電界の向きの単位ベクトル p) の類似度を
+	k = σ² exp((d·d' - 1) / ℓd²) exp(((p·p')² - 1) / ℓp²)
+のカーネルで表します。SARは電界の符号によらないため、偏波は (p·p')² で比較します (Psi と Psi+180度は同じ)。
+長さスケールは対数周辺尤度が最大になる値を候補の格子から選びます。
+
+次の方向は、候補の方向 (Fibonacci球面の点 × 偏波) から
+	'worst_case'   最大SARの期待改善量 (expected improvement) が大きい方向
+	'uncertainty'  予測の標準偏差が大きい方向
+を選びます。複数選ぶ場合は、選んだ方向の予測値を仮の観測値として加えてから次を選びます。
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+import itertools
+import math
+
+import numpy as np
+
+import _sweep_logging as sweep_logging
+from s4l_sweep import directions
+from s4l_sweep import spec as sweep_spec
+
+_log = sweep_logging.get_logger('surrogate')
+
+OBJECTIVES = ('worst_case', 'uncertainty')
+# 長さスケールの候補 (方向, 偏波)
+DIRECTION_LENGTH_SCALES = (0.3, 0.5, 0.8, 1.2, 2.0)
+POLARIZATION_LENGTH_SCALES = (0.5, 1.0, 2.0)
+# 観測値の分散に対するノイズの分散の割合 (数値的な安定化を兼ねる)
+DEFAULT_NOISE = 1e-4
+# 候補の方向の数 (Fibonacci球面の点数)
+DEFAULT_CANDIDATE_DIRECTIONS = 400
+# 期待改善量の探索の余裕 (正規化したSARの単位)
+DEFAULT_EXPLORATION = 0.01
+
+
+def _unit_vectors(theta_deg, phi_deg, psi_deg):
+	"""
+	到来方向と偏波の単位ベクトル (それぞれ形状 (n, 3)) を返します。偏波は cosψ e_phi + sinψ e_theta です。
+	"""
+	theta = np.radians(np.asarray(theta_deg, dtype=float))
+	phi = np.radians(np.asarray(phi_deg, dtype=float))
+	psi = np.radians(np.asarray(psi_deg, dtype=float))
+	d = np.stack([np.sin(theta) * np.cos(phi), np.sin(theta) * np.sin(phi), np.cos(theta)], axis=-1)
+	e_theta = np.stack([np.cos(theta) * np.cos(phi), np.cos(theta) * np.sin(phi), -np.sin(theta)], axis=-1)
+	e_phi = np.stack([-np.sin(phi), np.cos(phi), np.zeros_like(phi)], axis=-1)
+	p = np.cos(psi)[:, np.newaxis] * e_phi + np.sin(psi)[:, np.newaxis] * e_theta
+	return d, p
+
+
+def _normal_cdf(z):
+	return 0.5 * (1.0 + np.array([math.erf(v / math.sqrt(2.0)) for v in np.ravel(z)]).reshape(np.shape(z)))
+
+
+def _normal_pdf(z):
+	return np.exp(-0.5 * z * z) / math.sqrt(2.0 * math.pi)
+
+
+class DirectionSurrogate(object):
+	"""
+	(Theta, Phi, Psi) [度] から SAR を予測するガウス過程回帰です。fit() してから predict() を使います。
+	"""
+
+	def __init__(self, noise=DEFAULT_NOISE):
+		self.noise = noise
+		self.length_scales = None
+		self._d = None
+		self._p = None
+		self._alpha = None
+		self._cholesky = None
+		self._y_mean = 0.0
+		self._y_std = 1.0
+
+	def _kernel(self, d1, p1, d2, p2, length_scales):
+		ld, lp = length_scales
+		return np.exp((d1.dot(d2.T) - 1.0) / ld ** 2 + (p1.dot(p2.T) ** 2 - 1.0) / lp ** 2)
+
+	def _factorize(self, length_scales):
+		"""
+		カーネル行列をCholesky分解し、(分解, α, 対数周辺尤度) を返します。分解できない場合はNoneです。
+		"""
+		gram = self._kernel(self._d, self._p, self._d, self._p, length_scales)
+		gram[np.diag_indices_from(gram)] += self.noise
+		try:
+			cholesky = np.linalg.cholesky(gram)
+		except np.linalg.LinAlgError:
+			return None
+		alpha = np.linalg.solve(cholesky.T, np.linalg.solve(cholesky, self._y))
+		log_likelihood = -0.5 * self._y.dot(alpha) - np.log(np.diag(cholesky)).sum()
+		return cholesky, alpha, log_likelihood
+
+	def fit(self, theta_deg, phi_deg, psi_deg, sar, length_scales=None):
+		"""
+		観測した方向とSARで学習します。length_scales を指定しない場合は対数周辺尤度が最大の候補を選びます。
+
+		Returns:
+			bool: 学習できた場合はTrue。観測がない場合やカーネル行列を分解できない場合はFalse。
+		"""
+		sar = np.asarray(sar, dtype=float)
+		if len(sar) == 0:
+			_log.error("No results to fit the surrogate model.")
+			return False
+		self._d, self._p = _unit_vectors(theta_deg, phi_deg, psi_deg)
+		self._y_mean = sar.mean()
+		self._y_std = sar.std() if sar.std() > 0.0 else 1.0
+		self._y = (sar - self._y_mean) / self._y_std
+
+		candidates = [length_scales] if length_scales is not None else itertools.product(
+			DIRECTION_LENGTH_SCALES, POLARIZATION_LENGTH_SCALES)
+		best = None
+		for scales in candidates:
+			factorized = self._factorize(scales)
+			if factorized is not None and (best is None or factorized[2] > best[1][2]):
+				best = (scales, factorized)
+		if best is None:
+			_log.error("Surrogate kernel matrix is not positive definite.")
+			return False
+		self.length_scales, (self._cholesky, self._alpha, _) = best
+		return True
+
+	def predict(self, theta_deg, phi_deg, psi_deg):
+		"""
+		方向ごとのSARの予測値と標準偏差 (それぞれ形状 (n,)) を返します。
+		"""
+		d, p = _unit_vectors(theta_deg, phi_deg, psi_deg)
+		cross = self._kernel(d, p, self._d, self._p, self.length_scales)
+		mean = cross.dot(self._alpha)
+		v = np.linalg.solve(self._cholesky, cross.T)
+		variance = np.maximum(1.0 - (v * v).sum(axis=0), 0.0)
+		return self._y_mean + self._y_std * mean, self._y_std * np.sqrt(variance)
+
+	def expected_improvement(self, theta_deg, phi_deg, psi_deg, best_sar, exploration=DEFAULT_EXPLORATION):
+		"""
+		最大SAR best_sar に対する期待改善量を返します。
+		"""
+		mean, std = self.predict(theta_deg, phi_deg, psi_deg)
+		improvement = mean - best_sar - exploration * self._y_std
+		with np.errstate(divide='ignore', invalid='ignore'):
+			z = np.where(std > 0.0, improvement / std, 0.0)
+		return np.where(std > 0.0, improvement * _normal_cdf(z) + std * _normal_pdf(z), np.maximum(improvement, 0.0))
+
+
+def results_to_arrays(results, sar_field='MassAveragedSAR'):
+	"""
+	結果の辞書のリスト (CSVから読んだ文字列の値も可) から、(Theta, Phi, Psi, SAR) の配列と名前のリストを返します。
+	SAR値がない行は除きます。
+	"""
+	rows = [row for row in results if row.get(sar_field) not in (None, '')]
+	columns = [np.array([float(row[key]) for row in rows]) for key in ('Theta', 'Phi', 'Psi', sar_field)]
+	return columns, [row.get('Direction') for row in rows]
+
+
+def candidate_configs(polarizations=(('VPol', 90.0), ('HPol', 0.0)), n_directions=DEFAULT_CANDIDATE_DIRECTIONS,
+		name_tag=""):
+	"""
+	Fibonacci球面の n_directions 方向と偏波の組み合わせの (名前サフィックス, Theta, Phi, Psi) のリストを返します。
+	"""
+	return [(sweep_spec.direction_name(theta, phi, pol_name) + name_tag, theta, phi, float(psi))
+		for (pol_name, psi), (theta, phi, _) in itertools.product(polarizations,
+			directions.iter_sphere_directions('fibonacci', n_directions))]
+
+
+def suggest_next_configs(results, n_configs=1, objective='worst_case', candidates=None, sar_field='MassAveragedSAR'):
+	"""
+	完了した結果で代理モデルを学習し、次に計算する設定を選びます。計算済みの名前の候補は除きます。
+
+	Returns:
+		tuple: (設定のリスト, 情報の辞書)。情報は 'best_sar' (観測の最大値), 'score' (最初の設定の期待改善量または標準偏差),
+		'predicted_max' (候補の予測の最大値), 'length_scales'。学習できない場合は (空のリスト, None)。
+	"""
+	if objective not in OBJECTIVES:
+		_log.error("Unknown surrogate objective '%s'. Use one of %s.", objective, ", ".join(OBJECTIVES))
+		return [], None
+	(theta, phi, psi, sar), names = results_to_arrays(results, sar_field)
+	done = set(names)
+	candidates = [c for c in (candidates if candidates is not None else candidate_configs()) if c[0] not in done]
+	model = DirectionSurrogate()
+	if not candidates or not model.fit(theta, phi, psi, sar):
+		return [], None
+	length_scales = model.length_scales
+
+	c_theta, c_phi, c_psi = (np.array([c[i] for c in candidates]) for i in (1, 2, 3))
+	best_sar = sar.max()
+	info = {'best_sar': best_sar, 'length_scales': length_scales}
+	chosen = []
+	for _ in range(min(n_configs, len(candidates))):
+		if objective == 'worst_case':
+			scores = model.expected_improvement(c_theta, c_phi, c_psi, best_sar)
+		else:
+			scores = model.predict(c_theta, c_phi, c_psi)[1]
+		if chosen:
+			scores[chosen] = -np.inf
+		index = int(np.argmax(scores))
+		if not chosen:
+			info['score'] = float(scores[index])
+			info['predicted_max'] = float(model.predict(c_theta, c_phi, c_psi)[0].max())
+		chosen.append(index)
+		# 選んだ方向の予測値を仮の観測値として加え、次の候補の不確かさを下げる
+		predicted = model.predict(c_theta[[index]], c_phi[[index]], c_psi[[index]])[0]
+		theta, phi, psi = np.append(theta, c_theta[index]), np.append(phi, c_phi[index]), np.append(psi, c_psi[index])
+		sar = np.append(sar, predicted)
+		model.fit(theta, phi, psi, sar, length_scales=length_scales)
+	return [candidates[index] for index in chosen], info
+
+
+def run_active_learning(run_configs, initial_configs, max_iterations=10, batch_size=2, objective='worst_case',
+		tolerance=0.01, candidates=None, initial_results=None):
+	"""
+	代理モデルで次の設定を選び、run_configs で計算して学習し直すことを繰り返します。
+
+	Args:
+		run_configs: 設定のリストを受け取り、SAR結果の辞書のリスト (失敗した場合はNone) を返す関数
+			(例: sweep.run_multiple_plane_wave_simulations を simulation_configs で呼ぶ関数)。
+		initial_configs (list): 最初に計算する設定。initial_results で計算済みの名前は除きます。
+		max_iterations (int): 代理モデルで選ぶ回数の上限。
+		batch_size (int): 1回に選ぶ設定の数。
+		objective (str): OBJECTIVES のいずれか。
+		tolerance (float): 'worst_case' では期待改善量が観測の最大値の tolerance 倍を、'uncertainty' では
+			標準偏差が観測の最大値の tolerance 倍を下回ったら終了します。
+		candidates (list): 候補の設定。Noneの場合は candidate_configs() の値。
+		initial_results (list): 計算済みの結果 (例: 結果のCSVを読んだ行)。
+
+	Returns:
+		list: 計算したすべての結果 (initial_results を含む)。
+	"""
+	results = list(initial_results or [])
+	done = {row.get('Direction') for row in results}
+	initial_configs = [config for config in initial_configs if config[0] not in done]
+	if initial_configs:
+		_log.info("Running %d initial configurations for the surrogate model.", len(initial_configs))
+		results.extend(run_configs(initial_configs) or [])
+
+	for iteration in range(max_iterations):
+		configs, info = suggest_next_configs(results, batch_size, objective, candidates)
+		if not configs:
+			_log.warning("Surrogate model could not suggest further configurations. Stopping.")
+			break
+		_log.info("Surrogate iteration %d: max SAR %.6g, predicted max %.6g, %s %.3g. Next: %s", iteration + 1,
+			info['best_sar'], info['predicted_max'],
+			'expected improvement' if objective == 'worst_case' else 'max std', info['score'],
+			[config[0] for config in configs])
+		if info['score'] < tolerance * abs(info['best_sar']):
+			_log.info("Surrogate converged after %d iterations (%d solver runs).", iteration, len(results))
+			break
+		new_results = run_configs(configs) or []
+		if not new_results:
+			_log.warning("No results for the suggested configurations. Stopping.")
+			break
+		results.extend(new_results)
+	return results
@@ -0,0 +1,882 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+
+import numpy as np
+
+import _grid_planner as grid_planner
+import _kernel_benchmark as kernel_benchmark
+import _memory_monitor as memory_monitor
+import _resource_estimator as resource_estimator
+import _steady_state_monitor as steady_state_monitor
+import _sweep_logging as sweep_logging
+import _sweep_timing as sweep_timing
+from s4l_sweep import analysis as sar_analysis
+from s4l_sweep import fields
+from s4l_sweep import materials
+from s4l_sweep import model as sweep_model
+from s4l_sweep import output
+from s4l_sweep import retention
+
+_log = sweep_logging.get_logger('sweep')
+
+# 各シミュレーションのSimulationTime [周期]
+SIMULATION_TIME_PERIODS = 30.0
+# CenterFrequencyを指定していない場合に見積もりと計算領域の決定で使用する周波数 [MHz]
+DEFAULT_FREQUENCY_MHZ = 1000.0
+# 同時実行のバッチの完了を待つ時間の上限 [s] と、結果の確認間隔 [s]
+BATCH_TIMEOUT_S = 24 * 3600.0
+POLL_INTERVAL_S = 10.0
+
+# 方向スクリーニングの忠実度ティア
+# grid_modeがNoneの場合は、スイープで指定されたgrid_modeを使用する
+FIDELITY_TIERS = {
+	'coarse': {'grid_mode': 'planned', 'cells_per_wavelength': 5, 'simulation_time_periods': 10.0},
+	'production': {'grid_mode': None, 'cells_per_wavelength': grid_planner.DEFAULT_CELLS_PER_WAVELENGTH,
+		'simulation_time_periods': SIMULATION_TIME_PERIODS},
+}
+
+
+def create_single_simulation_instance(sim_name, theta_deg, phi_deg, psi_deg, use_simple_model=False,
+		frequency_mhz=None, grid_mode='automatic', cells_per_wavelength=grid_planner.DEFAULT_CELLS_PER_WAVELENGTH,
+		simulation_time_periods=SIMULATION_TIME_PERIODS, kernel=None, steady_state_tolerance=None,
+		convergence_level_db=steady_state_monitor.DEFAULT_CONVERGENCE_LEVEL_DB):
+	"""
+	指定された名前と平面波の到来方向を持つ単一のFDTDシミュレーションインスタンスを作成します。
+	use_simple_modelフラグに基づいて、使用するエンティティと材料を切り替えます。
+	frequency_mhzを指定した場合は平面波のCenterFrequencyを設定します。
+	grid_mode='planned'の場合は、実行周波数での材料の波長から材料グループごとの手動グリッドを作成し、
+	'automatic'の場合は従来どおり自動グリッドを使用します。
+	simulation_time_periodsはSimulationTime [周期] です。
+	kernelにカーネル名 ('AXware', 'Cuda', 'Software') を指定した場合はそのカーネルを使用し (設定できない場合はNoneを返します)、
+	Noneの場合はAXwareを試してSoftwareにフォールバックします。
+	steady_state_toleranceを指定した場合は、組織内に定常状態監視用の点センサーを配置し、
+	収束レベル convergence_level_db [dB] のユーザー定義の自動終了条件を設定します
+	(収束レベルはソルバーのエネルギーの収束の閾値で、位相振幅の許容値とは別に指定します)。
+	"""
+	import s4l_v1.simulation.emfdtd as fdtd
+	import s4l_v1.units as units
+	from s4l_v1 import ReleaseVersion
+
+	ReleaseVersion.set_active(ReleaseVersion.version7_2)
+
+	sim = fdtd.Simulation()
+	sim.Name = sim_name
+
+	if use_simple_model:
+		mapped_entities, missing_names = sweep_model.map_entities(
+			[sweep_model.DEBUG_BOX_NAME, sweep_model.DEBUG_SOURCE_NAME])
+		if missing_names:
+			_log.error("Debug model entities %s not found for %s. Ensure model.create_debug_model() was called.",
+				missing_names, sim_name)
+			return None
+		tissue_components = [mapped_entities[sweep_model.DEBUG_BOX_NAME]]
+		components_source = [mapped_entities[sweep_model.DEBUG_SOURCE_NAME]]
+		material_groups = materials.add_debug_material(sim, tissue_components)
+	else:
+		mapped_entities, missing_names = sweep_model.map_entities(
+			sweep_model.TISSUE_ENTITY_NAMES + [sweep_model.SOURCE_ENTITY_NAME])
+		if missing_names:
+			# エンティティごとではなく、シミュレーションごとに1件だけ記録する
+			_log.warning("%d entities not found in model. Skipping: %s", len(missing_names), ", ".join(missing_names))
+		material_groups = materials.add_tissue_materials(sim, mapped_entities)
+		tissue_components = [e for _, components in material_groups for e in components]
+		source = mapped_entities.get(sweep_model.SOURCE_ENTITY_NAME)
+		components_source = [source] if source is not None else []
+	components_grid_all = list(mapped_entities.values())
+
+	# Setup
+	setup_settings = sim.SetupSettings
+	setup_settings.GlobalAutoTermination = setup_settings.GlobalAutoTermination.enum.GlobalAutoTerminationStrict
+	setup_settings.SimulationTime = simulation_time_periods, units.Periods
+	if steady_state_tolerance is not None:
+		# 予算より早く定常状態に達した計算をソルバーの自動終了で打ち切る
+		setup_settings.GlobalAutoTermination = setup_settings.GlobalAutoTermination.enum.GlobalAutoTerminationUserDefined
+		setup_settings.ConvergenceLevel = convergence_level_db
+
+	# Sources
+	if not components_source:
+		_log.error("No source components available for %s. Cannot set up plane wave source.", sim_name)
+		return None
+	plane_wave_source_settings = fdtd.PlaneWaveSourceSettings()
+	plane_wave_source_settings.Theta = theta_deg, units.Degrees
+	plane_wave_source_settings.Phi = phi_deg, units.Degrees
+	plane_wave_source_settings.Psi = psi_deg, units.Degrees
+	if frequency_mhz is not None:
+		plane_wave_source_settings.CenterFrequency = frequency_mhz, units.MHz
+	sim.Add(plane_wave_source_settings, components_source)
+
+	# Sensors (Overall Field Sensor、および定常状態監視用の点センサー)
+	if steady_state_tolerance is not None:
+		steady_state_monitor.add_probe_sensors(sim, tissue_components)
+
+	# Boundary Conditions
+	options = sim.GlobalBoundarySettings.GlobalBoundaryType.enum
+	sim.GlobalBoundarySettings.GlobalBoundaryType = options.UpmlCpml
+
+	# Grid
+	if grid_mode == 'planned':
+		# 実行周波数での材料特性を確定させてから、材料グループごとのセルサイズを決める
+		sim.UpdateAllMaterials()
+		frequency_hz = (frequency_mhz if frequency_mhz is not None else DEFAULT_FREQUENCY_MHZ) * 1e6
+		grid_plan = grid_planner.plan_grid(material_groups, frequency_hz, components_source,
+			cells_per_wavelength=cells_per_wavelength)
+		grid_planner.apply_grid_plan(sim, grid_plan)
+		for line in grid_planner.format_plan(grid_plan):
+			_log.info("Planned grid for %s: %s", sim_name, line)
+		domain_bbox = resource_estimator.get_entity_bounding_boxes(components_source)[0]
+		if domain_bbox is not None:
+			planned_cells, uniform_cells = grid_planner.estimate_cell_reduction(grid_plan, domain_bbox)
+			_log.info("Planned grid ~%.1f MCells vs. uniform worst-case ~%.1f MCells (%.1fx fewer cells).",
+				planned_cells / 1e6, uniform_cells / 1e6, uniform_cells / planned_cells)
+	else:
+		automatic_grid_settings = [x for x in sim.AllSettings if isinstance(x, fdtd.AutomaticGridSettings) and x.Name == "Automatic"][0]
+		sim.Add(automatic_grid_settings, components_grid_all)
+
+	# Voxels
+	automatic_voxeler_settings = [x for x in sim.AllSettings if isinstance(x, fdtd.AutomaticVoxelerSettings) and x.Name == "Automatic Voxeler Settings"][0]
+	sim.Add(automatic_voxeler_settings, components_grid_all)
+
+	# Solver: 指定されたカーネルを使用する。指定がない場合はAXwareを試し、失敗した場合はSoftwareにフォールバックする
+	solver_settings = sim.SolverSettings
+	options = solver_settings.Kernel.enum
+	requested_kernel = kernel if kernel is not None else 'AXware'
+	try:
+		solver_settings.Kernel = getattr(options, requested_kernel)
+		_log.info("Attempting to use %s solver.", requested_kernel)
+	except Exception as e:
+		if kernel is not None:
+			# 明示的に指定されたカーネルは別のカーネルに置き換えない
+			_log.error("Failed to set %s solver for %s: %s", kernel, sim_name, e)
+			return None
+		# ライセンスエラーなどが発生した場合にSoftwareにフォールバック
+		_log.warning("Failed to set %s solver due to: %s. Falling back to Software (CPU) solver.", requested_kernel, e)
+		solver_settings.Kernel = options.Software
+
+	sim.UpdateAllMaterials()
+	sim.UpdateGrid()
+	return sim
+
+
+def debug_analyze_sar(output_dir):
+	"""
+	ドキュメントの最初のシミュレーションについてSAR解析を実行し、結果をCSVに書き出します。
+	既存のプロジェクトでの解析処理の確認用です。
+
+	Returns:
+		bool: SAR値を取得できた場合はTrue。
+	"""
+	import s4l_v1.document as document
+
+	sim_names = [sim.Name for sim in document.AllSimulations]
+	if not sim_names:
+		_log.error("No simulations found in the current document. Please load a project file with completed simulations.")
+		return False
+
+	sim_name = sim_names[0]
+	sim_to_analyze = document.AllSimulations[sim_name]
+	_log.info("--- Starting SAR analysis for: %s ---", sim_to_analyze.Name)
+	extracted_sar = sar_analysis.analyze_wbsar(sim_to_analyze)
+	if extracted_sar is None:
+		_log.error("Failed to extract SAR value.")
+		return False
+
+	_log.info("Successfully extracted Mass-Averaged SAR: %s W/kg", extracted_sar)
+	model_name = sweep_model.get_model_name()
+	output_filename = os.path.join(output_dir, f"{model_name}_single_wbsar_results.csv")
+	output.write_sar_results_to_csv([{
+		'ModelName': model_name,
+		'SimulationName': sim_name,
+		'Direction': sim_name.split(' - ')[-1] if ' - ' in sim_name else 'N/A',
+		'MassAveragedSAR': extracted_sar,
+	}], output_filename)
+	return True
+
+
+def plan_estimate_grid(frequency_mhz=DEFAULT_FREQUENCY_MHZ, cells_per_wavelength=grid_planner.DEFAULT_CELLS_PER_WAVELENGTH):
+	"""
+	見積もり用に、ドキュメントに追加しない一時的なシミュレーションで材料を実行周波数に更新し、
+	create_single_simulation_instance(grid_mode='planned') と同じグリッド計画を作成します。
+
+	Returns:
+		list: grid_planner.plan_grid() の結果。'Wire Block 1' が見つからない場合はNone。
+	"""
+	import s4l_v1.simulation.emfdtd as fdtd
+	import s4l_v1.units as units
+
+	mapped_entities, _ = sweep_model.map_entities(sweep_model.TISSUE_ENTITY_NAMES + [sweep_model.SOURCE_ENTITY_NAME])
+	source = mapped_entities.pop(sweep_model.SOURCE_ENTITY_NAME, None)
+	if source is None:
+		return None
+	sim = fdtd.Simulation()
+	sim.Name = "Grid Estimate"
+	plane_wave_source_settings = fdtd.PlaneWaveSourceSettings()
+	plane_wave_source_settings.CenterFrequency = frequency_mhz, units.MHz
+	sim.Add(plane_wave_source_settings, [source])
+	material_groups = materials.add_tissue_materials(sim, mapped_entities)
+	sim.UpdateAllMaterials()
+	return grid_planner.plan_grid(material_groups, frequency_mhz * 1e6, [source],
+		cells_per_wavelength=cells_per_wavelength)
+
+
+def estimate_single_simulation_resources(frequency_mhz=DEFAULT_FREQUENCY_MHZ, periods=SIMULATION_TIME_PERIODS, kernel='AXware',
+		throughput_mcells=None, grid_mode='automatic', cells_per_wavelength=grid_planner.DEFAULT_CELLS_PER_WAVELENGTH):
+	"""
+	'Wire Block 1' と組織エンティティのバウンディングボックスから、
+	シミュレーション1本当たりのセル数・メモリ・ディスク・実行時間を見積もります。
+	grid_mode='planned'の場合は、plan_estimate_grid() の材料グループごとのセルサイズで見積もり、
+	'automatic'の場合は一様な組織のセルサイズ (Resolution 2 mm、空気の MaxStep 9 mm) で見積もります。
+	'Wire Block 1' が見つからない場合はNoneを返します。
+	"""
+	mapped_entities, missing_names = sweep_model.map_entities([sweep_model.SOURCE_ENTITY_NAME])
+	if missing_names:
+		_log.warning("'%s' not found. Skipping resource estimation.", sweep_model.SOURCE_ENTITY_NAME)
+		return None
+
+	domain_bbox = resource_estimator.get_entity_bounding_boxes([mapped_entities[sweep_model.SOURCE_ENTITY_NAME]])[0]
+	if domain_bbox is None:
+		return None
+
+	if grid_mode == 'planned':
+		grid_plan = plan_estimate_grid(frequency_mhz, cells_per_wavelength)
+		if grid_plan is not None:
+			regions, air_step = grid_planner.plan_regions(grid_plan)
+			return resource_estimator.estimate_simulation_resources(
+				domain_bbox, frequency_mhz * 1e6, periods, regions=regions, max_step_mm=air_step,
+				resolution_mm=min([step for _, step in regions] + [air_step]),
+				kernel=kernel, throughput_mcells=throughput_mcells)
+
+	tissue_bboxes = resource_estimator.get_entity_bounding_boxes(sweep_model.get_tissue_entities())
+	tissue_bboxes = [b for b in tissue_bboxes if b is not None]
+
+	return resource_estimator.estimate_simulation_resources(
+		domain_bbox, frequency_mhz * 1e6, periods,
+		refined_bboxes=tissue_bboxes, kernel=kernel, throughput_mcells=throughput_mcells)
+
+
+def _has_results(sim):
+	"""
+	シミュレーションが結果を持つ場合はTrue、まだ持たない場合はFalse、状態を取得できない (ソルバーの異常終了など) 場合はNoneを返します。
+	"""
+	try:
+		return bool(sim.HasResults())
+	except Exception as e:
+		_log.error("Could not get the status of simulation '%s': %s", sim.Name, e)
+		return None
+
+
+def _stop_simulation(sim):
+	"""
+	実行中のシミュレーションを停止します。StopSimulation() を試し、ない場合や失敗した場合は Abort() を試します。
+
+	Returns:
+		bool: 停止できた場合はTrue。
+	"""
+	for method_name in ('StopSimulation', 'Abort'):
+		method = getattr(sim, method_name, None)
+		if method is None:
+			continue
+		try:
+			method()
+			return True
+		except Exception as e:
+			_log.error("Could not stop simulation '%s' with %s(): %s", sim.Name, method_name, e)
+	_log.error("Simulation '%s' could not be stopped.", sim.Name)
+	return False
+
+
+def run_simulations(sims, concurrency=1, before_run=None, after_run=None, timer=None,
+		batch_timeout_s=BATCH_TIMEOUT_S, poll_interval_s=POLL_INTERVAL_S):
+	"""
+	シミュレーションのリストを実行します。
+	concurrency が1の場合は1本ずつ完了を待ち、2以上の場合はその本数ずつ投入して完了を待ちます。
+	before_run / after_run を指定した場合は、各シミュレーションの投入直前と完了後に呼び出します。
+	timerを指定した場合は、1本ずつの実行ではシミュレーションごと、同時実行ではバッチごとに
+	'run' フェーズの所要時間を記録します。
+
+	投入や実行に失敗したシミュレーション、実行後も結果を持たないシミュレーション、バッチの投入から
+	batch_timeout_s [s] 以内に結果を持たなかったシミュレーションは、エラーを記録して除きます
+	(after_run は呼び出しません)。タイムアウトしたシミュレーションは次のバッチを投入する前に停止し、
+	'stop' フェーズとして timer に記録します (停止できたかどうかは ok)。停止できなかったシミュレーションが
+	ある場合は、同時実行数を超えないよう、それが結果を持つか状態を取得できなくなるまで次のバッチを投入しません。
+
+	Returns:
+		list: 結果を持って完了したシミュレーションのリスト。
+	"""
+	import time
+
+	if timer is None:
+		timer = sweep_timing.SweepTimer()
+
+	finished = []
+	if concurrency <= 1:
+		for sim in sims:
+			if before_run is not None:
+				before_run(sim)
+			_log.info("Running simulation: %s...", sim.Name)
+			try:
+				with timer.span(sim.Name, 'run'):
+					sim.RunSimulation(wait=True)
+			except Exception as e:
+				_log.error("Simulation '%s' failed: %s. Skipping.", sim.Name, e)
+				continue
+			if not _has_results(sim):
+				_log.error("Simulation '%s' finished without results. Skipping.", sim.Name)
+				continue
+			_log.info("Finished running simulation: %s", sim.Name)
+			finished.append(sim)
+			if after_run is not None:
+				after_run(sim)
+		return finished
+
+	for start in range(0, len(sims), concurrency):
+		batch = sims[start:start + concurrency]
+		done = []
+		with timer.span(f"batch {start // concurrency} ({len(batch)} sims)", 'run'):
+			pending = []
+			for sim in batch:
+				if before_run is not None:
+					before_run(sim)
+				_log.info("Submitting simulation: %s...", sim.Name)
+				try:
+					sim.RunSimulation(wait=False)
+				except Exception as e:
+					_log.error("Failed to submit simulation '%s': %s. Skipping.", sim.Name, e)
+					continue
+				pending.append(sim)
+			# バッチ内のすべてのシミュレーションが結果を持つか、失敗するか、タイムアウトするまで待機
+			deadline = time.time() + batch_timeout_s
+			while pending:
+				still_pending = []
+				for sim in pending:
+					status = _has_results(sim)
+					if status:
+						done.append(sim)
+					elif status is not None:
+						still_pending.append(sim)
+				pending = still_pending
+				if pending and time.time() >= deadline:
+					_log.error("%d simulations of batch %d did not finish within %.0f s. Stopping: %s", len(pending),
+						start // concurrency, batch_timeout_s, ", ".join(sim.Name for sim in pending))
+					break
+				if pending:
+					time.sleep(poll_interval_s)
+			running = []
+			for sim in pending:
+				with timer.span(sim.Name, 'stop') as record:
+					record['ok'] = _stop_simulation(sim)
+				if not record['ok']:
+					running.append(sim)
+			if running:
+				_log.error("Waiting for %d simulations that could not be stopped before submitting the next batch: %s",
+					len(running), ", ".join(sim.Name for sim in running))
+			while running:
+				time.sleep(poll_interval_s)
+				still_running = []
+				for sim in running:
+					status = _has_results(sim)
+					if status:
+						done.append(sim)
+					elif status is not None:
+						still_running.append(sim)
+				running = still_running
+		for sim in batch:
+			if not any(sim is d for d in done):
+				continue
+			_log.info("Finished running simulation: %s", sim.Name)
+			finished.append(sim)
+			if after_run is not None:
+				after_run(sim)
+	return finished
+
+
+def create_sweep_instrumentation(output_dir, model_name, monitor_memory=False):
+	"""
+	フェーズごとの所要時間を記録するタイマーと、monitor_memory=Trueの場合は
+	フェーズ前後のメモリ使用量を記録するメモリモニターを作成します。メモリモニターはtracemallocで
+	Pythonのすべてのメモリ確保を遅くするため、リークの調査のとき以外は有効にしません。
+	終了時には close_sweep_instrumentation() を呼び出します。
+
+	Returns:
+		tuple: (SweepTimer, MemoryMonitorまたはNone)。
+	"""
+	monitor = None
+	if monitor_memory:
+		monitor = memory_monitor.MemoryMonitor(os.path.join(output_dir, f"{model_name}_memory.jsonl"))
+	timer = sweep_timing.SweepTimer(os.path.join(output_dir, f"{model_name}_timing.jsonl"),
+		hooks=[monitor] if monitor is not None else None)
+	return timer, monitor
+
+
+def print_sweep_instrumentation(timer, monitor):
+	"""
+	フェーズごとの所要時間とメモリ使用量の増加を表示し、タイムアウトして停止したシミュレーションの数を警告します。
+	"""
+	_log.info("--- Phase Timing Summary ---\n%s", timer.format_summary())
+	stopped = [record for record in timer.records if record['phase'] == 'stop']
+	if stopped:
+		_log.warning("%d simulations timed out (%d stopped, %d could not be stopped): %s", len(stopped),
+			sum(1 for record in stopped if record['ok']), sum(1 for record in stopped if not record['ok']),
+			", ".join(record['member'] for record in stopped))
+	if monitor is not None:
+		_log.info("--- Memory Growth Summary ---\n%s", monitor.format_growth_report())
+		for row in monitor.growth_report():
+			if row['monotonic']:
+				_log.warning("'%s' grows monotonically across sweep members.", row['metric'])
+
+
+def close_sweep_instrumentation(monitor):
+	"""
+	メモリモニターを閉じ、以後の処理 (多重波の合成や次のモデルのスイープなど) ではtracemallocを停止します。
+	スイープが例外で中断した場合も停止するよう、create_sweep_instrumentation() と try/finally で対にして呼び出します。
+	"""
+	if monitor is not None:
+		monitor.close()
+
+
+def build_simulation_configs(polarization_type, angle_step_deg):
+	"""
+	(名前サフィックス, Theta[度], Phi[度], Psi[度]) のタプルのリストを返します。
+	"""
+	simulation_configs = []
+	
+	if polarization_type == 'Both':
+		polarizations = {"VPol": 90.0, "HPol": 0.0}
+	elif polarization_type == 'VPol':
+		polarizations = {"VPol": 90.0}
+	elif polarization_type == 'HPol':
+		polarizations = {"HPol": 0.0}
+	else:
+		_log.error("Invalid polarization_type '%s'. Using Both.", polarization_type)
+		polarizations = {"VPol": 90.0, "HPol": 0.0}
+
+	# シミュレーションを回す角度のリスト
+	if angle_step_deg > 0:
+		phi_angles = range(0, 360, angle_step_deg)
+	else:
+		_log.warning("Invalid angle_step_deg. Defaulting to 30 degrees.")
+		phi_angles = range(0, 360, 30)
+
+	for pol_name, psi_angle in polarizations.items():
+		for phi_angle in phi_angles:
+			name_suffix = f"Phi_{phi_angle:03d}_{pol_name}"
+			simulation_configs.append((name_suffix, 90.0, float(phi_angle), psi_angle))
+	return simulation_configs
+
+
+def admit_simulation_configs(model_name, simulation_configs, output_dir, frequency_mhz,
+		ram_budget_gb=None, disk_budget_gb=None, concurrency=None, admission_policy='downscale', kernel='auto',
+		grid_mode='automatic'):
+	"""
+	シミュレーション1本分のリソースを見積もり、予算に収まるよう設定リストと同時実行数を調整します。
+	見積もりは実行するグリッド (grid_mode) で行います (estimate_single_simulation_resources() を参照)。
+
+	kernel='auto'の場合は、カーネルプロファイル (_kernel_benchmark.run_kernel_benchmark() で作成) から
+	見積もりセル数で最も速いカーネルを選び、concurrencyがNoneの場合は同時実行数もプロファイルから決めます。
+	プロファイルがない場合はカーネルをNone (AXwareを試してSoftwareにフォールバック)、同時実行数を1とします。
+
+	Returns:
+		tuple: (実行するシミュレーション設定のリスト, 同時実行数, カーネル名)。拒否された場合はNone。
+	"""
+	estimate = estimate_single_simulation_resources(frequency_mhz=frequency_mhz, grid_mode=grid_mode)
+	if estimate is None:
+		return simulation_configs, concurrency or 1, None if kernel == 'auto' else kernel
+
+	if kernel == 'auto':
+		kernel = None
+		profile = kernel_benchmark.load_profile()
+		if profile is None:
+			_log.info("No kernel profile found. Run _kernel_benchmark.run_kernel_benchmark() to enable kernel selection.")
+		else:
+			kernel, throughput = kernel_benchmark.select_kernel(profile, estimate['cells'])
+			if kernel is not None:
+				_log.info("Selected %s kernel from profile (%.1f Mcells/s expected).", kernel, throughput)
+				estimate = estimate_single_simulation_resources(frequency_mhz=frequency_mhz,
+					kernel=kernel, throughput_mcells=throughput, grid_mode=grid_mode)
+				if concurrency is None:
+					ram_budget_bytes = ram_budget_gb * 1024.0 ** 3 if ram_budget_gb is not None else None
+					concurrency = kernel_benchmark.select_concurrency(profile, kernel, estimate['cells'],
+						estimate['memory_bytes'], ram_budget_bytes)
+	elif kernel is not None:
+		estimate = estimate_single_simulation_resources(frequency_mhz=frequency_mhz, kernel=kernel, grid_mode=grid_mode)
+	if concurrency is None:
+		concurrency = 1
+
+	_log.info("Estimated resources per simulation: %s", resource_estimator.format_estimate(estimate))
+	admission = resource_estimator.admit_sweep(
+		estimate, len(simulation_configs),
+		ram_budget_gb=ram_budget_gb, disk_budget_gb=disk_budget_gb,
+		concurrency=concurrency, policy=admission_policy, output_dir=output_dir)
+	for reason in admission['reasons']:
+		_log.warning("%s", reason)
+	if not admission['admitted']:
+		_log.error("Sweep for model '%s' refused by admission control.", model_name)
+		if admission['suggested_max_step_mm'] is not None:
+			_log.info("A grid with MaxStep <= %.2f mm and Resolution <= %.2f mm would fit the RAM budget.",
+				admission['suggested_max_step_mm'], admission['suggested_resolution_mm'])
+		return None
+	if admission['max_configs'] < len(simulation_configs):
+		simulation_configs = drop_simulation_configs(model_name, simulation_configs, admission['max_configs'],
+			output_dir, "; ".join(admission['reasons']))
+	return simulation_configs, admission['concurrency'], kernel
+
+
+def drop_simulation_configs(model_name, simulation_configs, max_configs, output_dir, reason):
+	"""
+	シミュレーション設定のリストを、リスト全体から等間隔に選んだ max_configs 本に減らします
+	(先頭から切り詰めると偏波や求積点がまとめて欠けるため)。
+	除いた設定は output_dir/<モデル名>_dropped_configs.csv に記録し、エラーとして名前を記録します。
+
+	Returns:
+		list: 実行するシミュレーション設定のリスト (元の順序)。
+	"""
+	kept = set()
+	if max_configs > 0:
+		kept = set(np.linspace(0, len(simulation_configs) - 1, max_configs).round().astype(int).tolist())
+	dropped = [config for index, config in enumerate(simulation_configs) if index not in kept]
+	_log.error("Sweep down-scaled from %d to %d simulations. Dropped: %s", len(simulation_configs),
+		len(simulation_configs) - len(dropped), ", ".join(config[0] for config in dropped))
+	output.write_sar_results_to_csv([{'ModelName': model_name, 'Direction': name_suffix, 'Theta': theta_deg,
+		'Phi': phi_deg, 'Psi': psi_deg, 'Reason': reason} for name_suffix, theta_deg, phi_deg, psi_deg in dropped],
+		os.path.join(output_dir, f"{model_name}_dropped_configs.csv"), fieldnames=output.DROPPED_CONFIG_FIELDNAMES)
+	return [config for index, config in enumerate(simulation_configs) if index in kept]
+
+
+def run_simulation_configs(model_name, simulation_configs, concurrency=1, fidelity_tier='production',
+		frequency_mhz=None, grid_mode='automatic', kernel=None, adaptive_periods=False,
+		steady_state_tolerance=steady_state_monitor.DEFAULT_TOLERANCE,
+		stable_periods=steady_state_monitor.DEFAULT_STABLE_PERIODS,
+		convergence_level_db=steady_state_monitor.DEFAULT_CONVERGENCE_LEVEL_DB, timer=None, use_simple_model=False,
+		analyzer=None, sar_field='MassAveragedSAR', voxel_cache=None):
+	"""
+	シミュレーション設定のリストについて、作成・実行・解析の各フェーズを実行します。
+	production以外のティアでは、シミュレーション名の末尾にティア名を付けて区別します。
+	analyzerはシミュレーションを受け取ってSAR値 (取得できない場合はNone) を返す関数で、
+	既定では analysis.analyze_wbsar() です。値は結果の辞書の sar_field に格納します。
+
+	adaptive_periods=Trueの場合は、各シミュレーションを収束判定付きで実行し、点センサーの
+	周期ごとの位相振幅の相対変化が steady_state_tolerance 未満の状態が stable_periods 周期続いた時点を
+	定常状態に達した周期数として、モデルごとの周期予算を学習します。実行中の打ち切りには
+	ソルバーの自動終了 (収束レベル convergence_level_db [dB]) を使用します。
+	以降に実行するシミュレーション (次回以降のスイープを含む) のSimulationTimeはその予算になります。
+	timer (_sweep_timing.SweepTimer) を指定した場合は、各フェーズの所要時間をシミュレーション名ごとに記録します。
+	voxel_cache (ボクセル化済みのシミュレーション名の集合) を指定した場合は、同じ名前のボクセル化済みの
+	シミュレーションがドキュメントにあればそれを再利用して作成・グリッド・ボクセル化を省略し、
+	新しく作成したシミュレーションを登録します (s4l_sweep.posture.PoseEngine.voxel_cache() を参照)。
+
+	Returns:
+		list: FidelityTierを含む、CSV出力用のSAR結果の辞書のリスト。
+	"""
+	tier = FIDELITY_TIERS[fidelity_tier]
+	tier_grid_mode = tier['grid_mode'] if tier['grid_mode'] is not None else grid_mode
+	name_tag = "" if fidelity_tier == 'production' else f" [{fidelity_tier}]"
+	max_periods = tier['simulation_time_periods']
+	budget_key = steady_state_monitor.budget_key(model_name,
+		frequency_mhz if frequency_mhz is not None else DEFAULT_FREQUENCY_MHZ, f"{tier_grid_mode}, {fidelity_tier}")
+	if adaptive_periods:
+		periods = steady_state_monitor.get_period_budget(budget_key, max_periods)
+		_log.info("Period budget for '%s': %s of %s periods.", budget_key, periods, max_periods)
+	else:
+		periods = max_periods
+		steady_state_tolerance = None
+
+	import s4l_v1.document as document
+	import s4l_v1.units as units
+
+	if timer is None:
+		timer = sweep_timing.SweepTimer()
+	if analyzer is None:
+		analyzer = sar_analysis.analyze_wbsar
+
+	all_sar_results = []
+
+	_log.info("--- Simulation Creation Phase (%s) ---", fidelity_tier)
+	existing_names = {sim.Name for sim in document.AllSimulations} if voxel_cache is not None else set()
+	for name_suffix, theta_deg, phi_deg, psi_deg in simulation_configs:
+		sim_full_name = f"{model_name} - {name_suffix}{name_tag}"
+		if voxel_cache is not None and sim_full_name in voxel_cache and sim_full_name in existing_names:
+			_log.info("Reusing voxelized simulation: %s", sim_full_name)
+			continue
+		_log.info("Creating simulation: %s (Theta=%s, Phi=%s, Psi=%s)", sim_full_name, theta_deg, phi_deg, psi_deg)
+
+		with timer.span(sim_full_name, 'create'):
+			sim_instance = create_single_simulation_instance(sim_full_name, theta_deg, phi_deg, psi_deg,
+				use_simple_model=use_simple_model, frequency_mhz=frequency_mhz, grid_mode=tier_grid_mode,
+				cells_per_wavelength=tier['cells_per_wavelength'],
+				simulation_time_periods=periods, kernel=kernel, steady_state_tolerance=steady_state_tolerance,
+				convergence_level_db=convergence_level_db)
+		
+		if sim_instance is None:
+			_log.error("Failed to create simulation instance '%s'. Skipping.", sim_full_name)
+			continue
+
+		document.AllSimulations.Add(sim_instance)
+		with timer.span(sim_full_name, 'update_grid'):
+			sim_instance.UpdateGrid()
+		with timer.span(sim_full_name, 'create_voxels'):
+			sim_instance.CreateVoxels() 
+		if voxel_cache is not None:
+			voxel_cache.add(sim_full_name)
+
+	_log.info("--- Simulation Execution Phase (%s) ---", fidelity_tier)
+	sim_map = {sim.Name: sim for sim in document.AllSimulations}
+
+	sims_to_run = []
+	for name_suffix, _, _, _ in simulation_configs:
+		sim_full_name = f"{model_name} - {name_suffix}{name_tag}"
+		sim_to_run = sim_map.get(sim_full_name)
+
+		if sim_to_run:
+			sims_to_run.append(sim_to_run)
+		else:
+			_log.warning("Simulation '%s' not found for execution.", sim_full_name)
+	if adaptive_periods:
+		frequency_hz = (frequency_mhz if frequency_mhz is not None else DEFAULT_FREQUENCY_MHZ) * 1e6
+
+		def _apply_period_budget(sim):
+			budget = steady_state_monitor.get_period_budget(budget_key, max_periods)
+			sim.SetupSettings.SimulationTime = budget, units.Periods
+
+		def _learn_period_budget(sim):
+			sensor_names = [settings.Name for settings in sim.AllSettings
+				if settings.Name.startswith(steady_state_monitor.SENSOR_PREFIX)]
+			with timer.span(sim.Name, 'convergence'):
+				converged = steady_state_monitor.measure_convergence(sim, sensor_names, frequency_hz,
+					tolerance=steady_state_tolerance, stable_periods=stable_periods)
+			# 収束しなかった場合は観測値として記録せず、次のシミュレーションの予算を上限に戻す
+			budget = steady_state_monitor.update_period_budget(budget_key, converged, max_periods)
+			_log.info("'%s' reached steady state at %s periods. Period budget is now %s.", sim.Name, converged, budget)
+
+		finished = run_simulations(sims_to_run, concurrency, before_run=_apply_period_budget,
+			after_run=_learn_period_budget, timer=timer)
+		# 点センサーの点エンティティがシャードのプロジェクトに保存されないよう削除する
+		steady_state_monitor.remove_probe_points()
+		sweep_model.clear_entity_index()
+	else:
+		finished = run_simulations(sims_to_run, concurrency, timer=timer)
+	finished_names = {sim.Name for sim in finished}
+
+	_log.info("--- Simulation Analysis Phase (%s) ---", fidelity_tier)
+	for name_suffix, theta_deg, phi_deg, psi_deg in simulation_configs:
+		sim_full_name = f"{model_name} - {name_suffix}{name_tag}"
+		sim_to_analyze = sim_map.get(sim_full_name)
+
+		if sim_to_analyze and sim_full_name not in finished_names:
+			_log.warning("Simulation '%s' did not finish. Skipping analysis.", sim_full_name)
+		elif sim_to_analyze:
+			with timer.span(sim_full_name, 'analyze'):
+				extracted_sar = analyzer(sim_to_analyze)
+			if extracted_sar is not None:
+				all_sar_results.append({
+					'ModelName': model_name,
+					'SimulationName': sim_full_name,
+					'Direction': name_suffix,
+					'Theta': theta_deg,
+					'Phi': phi_deg,
+					'Psi': psi_deg,
+					'FidelityTier': fidelity_tier,
+					sar_field: extracted_sar
+				})
+		else:
+			_log.warning("Simulation '%s' not found for analysis.", sim_full_name)
+
+	return all_sar_results
+
+
+def select_screening_candidates(coarse_results, top_k=3, margin_fraction=0.1):
+	"""
+	粗い計算の結果をWBSARの降順に並べ、上位top_k件と、最大値との差が
+	margin_fraction以内の方向を本計算の候補として返します。
+
+	Returns:
+		list: 候補となる方向の名前サフィックス ('Direction') のリスト (WBSARの降順)。
+	"""
+	ranked = []
+	for row in coarse_results:
+		try:
+			ranked.append((float(row['MassAveragedSAR']), row['Direction']))
+		except (TypeError, ValueError):
+			_log.warning("Non-numeric SAR for '%s'. Excluded from ranking.", row['SimulationName'])
+	ranked.sort(reverse=True)
+	if not ranked:
+		return []
+
+	threshold = ranked[0][0] * (1.0 - margin_fraction)
+	return [direction for rank, (sar, direction) in enumerate(ranked) if rank < top_k or sar >= threshold]
+
+
+def retain_simulation_outputs(model_name, sar_results, output_dir, results_filename, policy='keep', options=None):
+	"""
+	sar_results のシミュレーションの生の出力に保持ポリシーを適用します。
+	コピーは output_dir/<モデル名>_retained に保存します。
+
+	Returns:
+		dict: s4l_sweep.retention.apply_retention() の結果。policy='keep' の場合はNone。
+	"""
+	import s4l_v1.document as document
+
+	if policy == 'keep':
+		return None
+	simulation_names = {row['SimulationName'] for row in sar_results}
+	simulations = [sim for sim in document.AllSimulations if sim.Name in simulation_names]
+	return retention.apply_retention(simulations, results_filename, policy,
+		retention.retained_dir(output_dir, model_name), **(options or {}))
+
+
+def run_multiple_plane_wave_simulations(polarization_type, angle_step_deg, output_dir,
+		ram_budget_gb=None, disk_budget_gb=None, concurrency=None, admission_policy='downscale',
+		frequency_mhz=None, grid_mode='automatic', kernel='auto', adaptive_periods=False, monitor_memory=False,
+		steady_state_tolerance=steady_state_monitor.DEFAULT_TOLERANCE,
+		stable_periods=steady_state_monitor.DEFAULT_STABLE_PERIODS,
+		convergence_level_db=steady_state_monitor.DEFAULT_CONVERGENCE_LEVEL_DB,
+		simulation_configs=None, model_name=None, project_path=None, retention_policy='keep', retention_options=None,
+		export_fields=False, field_options=None):
+	"""
+	Creates, runs, and analyzes multiple plane wave simulations for a given model.
+
+	frequency_mhz と grid_mode は create_single_simulation_instance() にそのまま渡されます。
+	simulation_configs ((名前サフィックス, Theta, Phi, Psi) のリスト) を指定した場合は、
+	polarization_type と angle_step_deg から作る代わりにその設定でスイープします。
+
+	実行前にシミュレーション1本分のリソースを見積もり、RAM/ディスク予算を超える場合は
+	admission_policy に従ってスイープを縮小 ('downscale') または拒否 ('refuse') します。
+	予算がNoneの場合は、利用可能な物理メモリと output_dir の空き容量から決定します。
+	'downscale' ではまず同時実行数を下げ、ディスク予算に収まらない場合だけ設定を等間隔に間引いて、
+	除いた設定を <モデル名>_dropped_configs.csv に記録します。
+	kernel='auto'またはconcurrency=Noneの場合は、カーネルプロファイルから決定します。
+	adaptive_periods=Trueの場合は、定常状態の監視から学習した周期予算でSimulationTimeを短縮します
+	(steady_state_tolerance、stable_periods、convergence_level_db は run_simulation_configs() を参照)。
+	monitor_memory=Trueの場合は、各フェーズ前後のメモリ使用量を記録し、単調な増加を警告します
+	(tracemallocでスイープ全体が遅くなるため、リークの調査用です)。
+	project_path を指定した場合は、シミュレーションの作成前にドキュメントをそのパスに別名で保存し、
+	解析後にもう一度保存します (シャード分割。s4l_sweep.shards を参照)。このときドキュメントの
+	ファイル名が変わるため、結果のCSV名とシミュレーション名には model_name (Noneの場合は保存前のモデル名) を使用します。
+	retention_policy が 'keep' 以外の場合は、CSVへの書き込みを確認してから生の出力を整理します
+	(retention_options は s4l_sweep.retention.apply_retention() の stride と roi_m)。
+	export_fields=Trueの場合は、生の出力を整理する前に電界とSARを <output_dir>/<モデル名>_fields に保存します
+	(多重波の合成に使用します。s4l_sweep.fields と s4l_sweep.multipath を参照)。
+	field_options は s4l_sweep.fields.export_sweep_fields() の storage と sparse です。
+
+	Returns:
+		list: CSVに書き出したSAR結果の辞書のリスト。アドミッション制御で拒否された場合はNone。
+	"""
+	if model_name is None:
+		model_name = sweep_model.get_model_name()
+
+	_log.info("--- Starting Multiple Simulations for Model: %s ---", model_name)
+	_log.info("Assumed model '%s' is already loaded in Sim4Life.", model_name)
+
+	# 'Wire Block 1'のサイズ変更前に、それを参照する既存のシミュレーションを削除する
+	sweep_model.delete_all_simulations()
+	estimate_frequency_mhz = frequency_mhz if frequency_mhz is not None else DEFAULT_FREQUENCY_MHZ
+	sweep_model.create_model(frequency_mhz=estimate_frequency_mhz)
+
+	if simulation_configs is None:
+		simulation_configs = build_simulation_configs(polarization_type, angle_step_deg)
+
+	admitted = admit_simulation_configs(model_name, simulation_configs, output_dir, estimate_frequency_mhz,
+		ram_budget_gb=ram_budget_gb, disk_budget_gb=disk_budget_gb,
+		concurrency=concurrency, admission_policy=admission_policy, kernel=kernel, grid_mode=grid_mode)
+	if admitted is None:
+		return
+	simulation_configs, concurrency, kernel = admitted
+
+	if project_path is not None:
+		# 前のシャードのシミュレーションは削除済みのため、このシャードのプロジェクトにはその分だけが入る
+		sweep_model.save_model(project_path)
+	timer, monitor = create_sweep_instrumentation(output_dir, model_name, monitor_memory)
+	# 例外が発生してもtracemallocを停止する
+	try:
+		all_sar_results = run_simulation_configs(model_name, simulation_configs, concurrency,
+			frequency_mhz=frequency_mhz, grid_mode=grid_mode, kernel=kernel, adaptive_periods=adaptive_periods,
+			steady_state_tolerance=steady_state_tolerance, stable_periods=stable_periods,
+			convergence_level_db=convergence_level_db, timer=timer)
+		if project_path is not None:
+			sweep_model.save_model()
+
+		_log.info("All simulations analyzed.")
+		_log.info("--- Multiple Simulations Finished for Model: %s ---", model_name)
+		print_sweep_instrumentation(timer, monitor)
+	finally:
+		close_sweep_instrumentation(monitor)
+
+	output_filename = os.path.join(output_dir, f"{model_name}_multi_wbsar_results.csv")
+	output.write_sar_results_to_csv(all_sar_results, output_filename)
+	if export_fields:
+		fields.export_sweep_fields(all_sar_results, fields.fields_dir(output_dir, model_name), frequency_mhz,
+			**(field_options or {}))
+	retain_simulation_outputs(model_name, all_sar_results, output_dir, output_filename,
+		retention_policy, retention_options)
+	return all_sar_results
+
+
+def run_screened_plane_wave_simulations(polarization_type, angle_step_deg, output_dir,
+		top_k=3, margin_fraction=0.1,
+		ram_budget_gb=None, disk_budget_gb=None, concurrency=None, admission_policy='downscale',
+		frequency_mhz=None, grid_mode='automatic', kernel='auto', adaptive_periods=False, monitor_memory=False,
+		steady_state_tolerance=steady_state_monitor.DEFAULT_TOLERANCE,
+		stable_periods=steady_state_monitor.DEFAULT_STABLE_PERIODS,
+		convergence_level_db=steady_state_monitor.DEFAULT_CONVERGENCE_LEVEL_DB,
+		simulation_configs=None, retention_policy='keep', retention_options=None, export_fields=False,
+		field_options=None):
+	"""
+	2段階の方向スイープを実行します。
+	simulation_configs、steady_state_tolerance、stable_periods、convergence_level_db、retention_policy、
+	retention_options、export_fields、field_options の扱いは run_multiple_plane_wave_simulations() と同じです。
+
+	まずすべての方向を 'coarse' ティア (粗いグリッド、短いSimulationTime) で計算してWBSARで順位付けし、
+	上位top_k件または最大値からmargin_fraction以内の方向だけを 'production' ティアで再計算します。
+	両ティアの結果はFidelityTier列付きで同じCSVに書き出されます。
+
+	Returns:
+		list: CSVに書き出した両ティアのSAR結果の辞書のリスト。
+	"""
+	model_name = sweep_model.get_model_name()
+
+	_log.info("--- Starting Screened Simulations for Model: %s ---", model_name)
+
+	sweep_model.delete_all_simulations()
+	estimate_frequency_mhz = frequency_mhz if frequency_mhz is not None else DEFAULT_FREQUENCY_MHZ
+	sweep_model.create_model(frequency_mhz=estimate_frequency_mhz)
+
+	if simulation_configs is None:
+		simulation_configs = build_simulation_configs(polarization_type, angle_step_deg)
+
+	# 粗い計算はセル数が少ないため、アドミッション制御は本計算の候補に対してのみ行う
+	timer, monitor = create_sweep_instrumentation(output_dir, model_name, monitor_memory)
+	try:
+		coarse_kernel = None if kernel == 'auto' else kernel
+		coarse_results = run_simulation_configs(model_name, simulation_configs, concurrency or 1,
+			fidelity_tier='coarse', frequency_mhz=frequency_mhz, grid_mode=grid_mode, kernel=coarse_kernel,
+			adaptive_periods=adaptive_periods, steady_state_tolerance=steady_state_tolerance,
+			stable_periods=stable_periods, convergence_level_db=convergence_level_db, timer=timer)
+
+		candidates = select_screening_candidates(coarse_results, top_k=top_k, margin_fraction=margin_fraction)
+		_log.info("%d of %d directions selected for production runs: %s", len(candidates), len(simulation_configs), candidates)
+		production_configs = [config for config in simulation_configs if config[0] in candidates]
+
+		admitted = admit_simulation_configs(model_name, production_configs, output_dir, estimate_frequency_mhz,
+			ram_budget_gb=ram_budget_gb, disk_budget_gb=disk_budget_gb,
+			concurrency=concurrency, admission_policy=admission_policy, kernel=kernel, grid_mode=grid_mode)
+		if admitted is None:
+			production_results = []
+		else:
+			production_configs, production_concurrency, production_kernel = admitted
+			production_results = run_simulation_configs(model_name, production_configs, production_concurrency,
+				fidelity_tier='production', frequency_mhz=frequency_mhz, grid_mode=grid_mode, kernel=production_kernel,
+				adaptive_periods=adaptive_periods, steady_state_tolerance=steady_state_tolerance,
+				stable_periods=stable_periods, convergence_level_db=convergence_level_db, timer=timer)
+
+		_log.info("--- Screened Simulations Finished for Model: %s ---", model_name)
+		print_sweep_instrumentation(timer, monitor)
+	finally:
+		close_sweep_instrumentation(monitor)
+
+	output_filename = os.path.join(output_dir, f"{model_name}_multi_wbsar_results.csv")
+	output.write_sar_results_to_csv(coarse_results + production_results, output_filename)
+	if export_fields:
+		fields.export_sweep_fields(production_results, fields.fields_dir(output_dir, model_name), frequency_mhz,
+			**(field_options or {}))
+	retain_simulation_outputs(model_name, coarse_results + production_results, output_dir, output_filename,
+		retention_policy, retention_options)
+	return coarse_results + production_results
@@ -0,0 +1,173 @@
+"""
+保存したSARのボリューム (FieldStore) の、組織ごとの質量・吸収電力・平均SAR・最大SARの内訳です。
+
+_analyze_wbsar は全組織 (All Regions) の1つの値しか返しません。ここでは組織ラベルのボリューム、セルの体積、
+質量密度からボクセルの質量を求め、方向ごとに重み付きの np.bincount の1回のパスで全組織の質量と吸収電力を集計します。
+最大SARは、ラベルの順に並べ替える順序 (格子ごとに1回だけ求める) でSARを並べ、np.maximum.reduceat で求めます。
+
+ラベル0は空気など組織以外として集計しません。
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+import csv
+import os
+
+import numpy as np
+
+import _sweep_logging as sweep_logging
+from s4l_sweep import fields
+from s4l_sweep import geometry
+from s4l_sweep import materials
+
+_log = sweep_logging.get_logger('tissues')
+
+TISSUE_FIELDNAMES = ['ModelName', 'Direction', 'TissueID', 'Tissue', 'Voxels', 'MassKg', 'AbsorbedPowerW',
+	'AverageSAR', 'MaxSAR']
+
+
+def default_densities(names):
+	"""
+	組織名が materials.FALLBACK_PROPERTIES にあるラベルの質量密度 [kg/m^3] の辞書を返します。
+	"""
+	return {label: materials.FALLBACK_PROPERTIES[name][0] for label, name in names.items()
+		if name in materials.FALLBACK_PROPERTIES}
+
+
+class TissueReducer(object):
+	"""
+	1つの格子の組織ラベルについて、方向によらない量 (ボクセルの質量、組織ごとの質量、ラベル順の並び) を保持し、
+	方向ごとのSARを組織ごとに集計します。
+	"""
+
+	def __init__(self, labels, grid, densities, flat_indices=None):
+		"""
+		Args:
+			labels (numpy.ndarray): 形状 (nx, ny, nz) の組織ラベル。
+			grid (GridGeometry): 格子の幾何量 (s4l_sweep.geometry.get_geometry())。ボクセルの質量はここにキャッシュされます。
+			densities (dict): ラベル -> 質量密度 [kg/m^3]。密度のないラベルは集計から除きます。
+			flat_indices (numpy.ndarray): 集計するボクセルの平坦化した番号 (C順)。人体のボクセルだけを保存した
+				(sparse) SARを集計する場合に指定し、reduce() にはこの順のSARを渡します。Noneの場合はすべてのボクセル。
+		"""
+		voxel_mass = grid.voxel_mass(labels, densities)
+		labels = np.asarray(labels).reshape(-1)
+		n_labels = int(labels.max()) + 1 if labels.size else 1
+		present = np.bincount(labels, minlength=n_labels)
+		missing = [int(label) for label in np.flatnonzero(present) if label != 0 and densities.get(label, 0.0) <= 0.0]
+		if missing:
+			_log.warning("No mass density for tissue labels %s. They are excluded from the breakdown.", missing)
+		if flat_indices is not None:
+			labels = labels[flat_indices]
+			voxel_mass = voxel_mass[flat_indices]
+			present = np.bincount(labels, minlength=n_labels)
+
+		self.labels = labels
+		self.n_labels = n_labels
+		self.voxel_mass = voxel_mass
+		self.voxel_counts = present
+		self.mass = np.bincount(labels, weights=self.voxel_mass, minlength=n_labels)
+		self.tissue_ids = np.array([label for label in np.flatnonzero(present) if label != 0 and self.mass[label] > 0.0],
+			dtype=np.int64)
+		# 最大SARの集計用。ラベル順に並べたときの各ラベルの先頭の位置
+		self.order = np.argsort(labels, kind='stable')
+		self.starts = np.concatenate(([0], np.cumsum(present)[:-1]))
+
+	def reduce(self, sar):
+		"""
+		SAR (形状 (nx, ny, nz) または平坦化した配列。flat_indices を指定した場合はその順の値) の組織ごとの集計を返します。
+
+		Returns:
+			dict: 'tissue_ids', 'voxels', 'mass' [kg], 'power' [W], 'average_sar' [W/kg], 'max_sar' [W/kg] の配列。
+		"""
+		sar = np.asarray(sar, dtype=np.float64).reshape(-1)
+		power = np.bincount(self.labels, weights=sar * self.voxel_mass, minlength=self.n_labels)
+		present = self.voxel_counts > 0
+		peaks = np.zeros(self.n_labels)
+		peaks[present] = np.maximum.reduceat(sar[self.order], self.starts[present])
+		ids = self.tissue_ids
+		return {'tissue_ids': ids, 'voxels': self.voxel_counts[ids], 'mass': self.mass[ids], 'power': power[ids],
+			'average_sar': power[ids] / self.mass[ids], 'max_sar': peaks[ids]}
+
+
+def load_label_file(path):
+	"""
+	組織ラベルのnpzファイル ('labels': 形状 (nx, ny, nz) の整数、省略可能な 'tissue_ids' と 'tissue_names'、'densities' [kg/m^3])
+	を読み込み、(ラベル, ラベル -> 組織名, ラベル -> 質量密度) を返します。
+	"""
+	with np.load(path) as saved:
+		labels = saved['labels']
+		ids = saved['tissue_ids'].tolist() if 'tissue_ids' in saved else []
+		names = dict(zip(ids, saved['tissue_names'].tolist())) if 'tissue_names' in saved else {}
+		densities = dict(zip(ids, saved['densities'].tolist())) if 'densities' in saved else {}
+	return labels, names, densities
+
+
+def store_label_file(store, path):
+	"""
+	組織ラベルのnpzファイルを、ストアの方向の格子 (最初の方向の格子) のラベルとして保存します。
+
+	Returns:
+		bool: 保存できた場合はTrue。
+	"""
+	directions = store.directions()
+	if not directions:
+		_log.error("No stored fields in '%s' to attach tissue labels to.", store.directory)
+		return False
+	labels, names, densities = load_label_file(path)
+	try:
+		store.write_labels(labels, store.axes(directions[0]), names, densities)
+	except ValueError as e:
+		_log.error("Failed to store tissue labels from '%s': %s", path, e)
+		return False
+	return True
+
+
+def tissue_breakdown_rows(store, model_name, densities=None, name='sar', directions=None):
+	"""
+	ストアの各方向のSARを組織ごとに集計し、長い形式 (方向 × 組織ごとに1行) の辞書のリストを返します。
+	densities を省略した場合は、ストアに保存した密度 (なければ組織名の既定の密度) を使用します。
+	組織ラベルが保存されていない方向は、エラーを記録して除きます。
+	"""
+	rows = []
+	reducers = {}
+	for direction in (directions if directions is not None else store.directions()):
+		if not store.has_array(direction, name):
+			continue
+		layout = store.voxel_layout(direction, name)
+		flat_indices, values = store.read_voxels(direction, name)
+		if layout not in reducers:
+			labels, names = store.read_labels(direction)
+			if labels is None:
+				_log.error("No tissue labels stored for the grid of '%s'.", direction)
+				reducers[layout] = None
+			else:
+				label_densities = densities or store.read_densities(direction) or default_densities(names)
+				reducers[layout] = (TissueReducer(labels, geometry.get_geometry(store.axes(direction)), label_densities,
+					flat_indices if layout[1] is not None else None), names)
+		if reducers[layout] is None:
+			continue
+		reducer, names = reducers[layout]
+		breakdown = reducer.reduce(values)
+		for index, tissue_id in enumerate(breakdown['tissue_ids']):
+			rows.append({'ModelName': model_name, 'Direction': direction, 'TissueID': int(tissue_id),
+				'Tissue': names.get(int(tissue_id), ''), 'Voxels': int(breakdown['voxels'][index]),
+				'MassKg': breakdown['mass'][index], 'AbsorbedPowerW': breakdown['power'][index],
+				'AverageSAR': breakdown['average_sar'][index], 'MaxSAR': breakdown['max_sar'][index]})
+	return rows
+
+
+def write_tissue_breakdown(output_dir, model_name, densities=None):
+	"""
+	<output_dir>/<モデル名>_fields のストアの組織ごとの内訳を <モデル名>_tissue_sar.csv に書き出します。
+
+	Returns:
+		list: 書き出した行の辞書のリスト。
+	"""
+	store = fields.FieldStore(fields.fields_dir(output_dir, model_name))
+	rows = tissue_breakdown_rows(store, model_name, densities)
+	filename = os.path.join(output_dir, f"{model_name}_tissue_sar.csv")
+	with open(filename, 'w', newline='') as f:
+		writer = csv.DictWriter(f, fieldnames=TISSUE_FIELDNAMES)
+		writer.writeheader()
+		writer.writerows(rows)
+	_log.info("Tissue breakdown of %d rows written to %s", len(rows), filename)
+	return rows